@@ -4,5 +4,7 @@ Individual analysis modules for steganography detection
 """
 
 from .base import BaseAnalyzer
+from .context import ImageContext
+from .encoding import EncodingProfile
 
-__all__ = ['BaseAnalyzer']
+__all__ = ['BaseAnalyzer', 'ImageContext', 'EncodingProfile']
@@ -3,27 +3,115 @@ Base analyzer class
 All analyzers should inherit from this class
 """
 
+import inspect
+import os
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+from .context import ImageContext
+from .encoding import EncodingProfile
 
 
 class BaseAnalyzer(ABC):
     """Base class for all steganography analyzers"""
 
+    # Where the scheduler runs this analyzer: 'thread' for analyzers that
+    # mostly wait on external tools, 'process' for CPU-bound Python work
+    executor = 'thread'
+
+    # Cost tier: 'cheap' analyzers make up the triage pass, 'expensive' ones
+    # run in triage only when its rules find something worth a closer look
+    cost = 'expensive'
+
+    # Bump when the analyzer's output changes so cached results are not reused
+    version = '1'
+
+    # How generated images are written; replaced by the worker's configured profile
+    encoding = EncodingProfile()
+
+    # Bytes of working memory for strip-wise processing of large images;
+    # replaced by the worker's configured budget
+    memory_budget = 256 * 1024 * 1024
+
     @abstractmethod
-    def analyze(self, filepath: str, output_dir: str) -> Dict[str, Any]:
+    def analyze(self, filepath: str, output_dir: str,
+                context: Optional[ImageContext] = None) -> Dict[str, Any]:
         """
         Analyze an image file
 
         Args:
             filepath: Path to the image file
             output_dir: Directory to save output files
+            context: Shared decoded image for this job (optional)
 
         Returns:
             Dictionary containing analysis results
         """
         pass
 
+    def run(self, filepath: str, output_dir: str,
+            context: Optional[ImageContext] = None, **kwargs) -> Dict[str, Any]:
+        """
+        Call analyze(), passing the shared context only to analyzers whose
+        analyze() accepts it so older two-argument analyzers keep working
+        """
+        if context is not None and self._accepts_context():
+            kwargs['context'] = context
+        return self.analyze(filepath, output_dir, **kwargs)
+
+    def _accepts_context(self) -> bool:
+        """Check whether this analyzer's analyze() takes a context argument"""
+        parameters = inspect.signature(self.analyze).parameters
+        return 'context' in parameters or any(
+            p.kind == inspect.Parameter.VAR_KEYWORD for p in parameters.values()
+        )
+
+    def artifacts(self, result: Dict[str, Any], output_dir: str) -> List[str]:
+        """
+        Files in output_dir that a result refers to
+
+        The default looks for string values anywhere in the result that name
+        an existing file relative to output_dir.
+
+        Returns:
+            List of paths relative to output_dir
+        """
+        found = []
+
+        def walk(value):
+            if isinstance(value, dict):
+                for item in value.values():
+                    walk(item)
+            elif isinstance(value, (list, tuple)):
+                for item in value:
+                    walk(item)
+            elif isinstance(value, str) and value and not os.path.isabs(value) \
+                    and '..' not in value.split(os.sep) \
+                    and os.path.isfile(os.path.join(output_dir, value)) and value not in found:
+                found.append(value)
+
+        walk(result)
+        return found
+
+    def params(self) -> Dict[str, Any]:
+        """
+        Settings that shape this analyzer's output, for memo and cache keys
+
+        The default takes every __init__ parameter stored in an attribute of
+        the same name, plus the artifact encoding.
+        """
+        parameters = inspect.signature(type(self).__init__).parameters.values()
+        params = {p.name: getattr(self, p.name) for p in parameters
+                  if p.name != 'self' and p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)
+                  and hasattr(self, p.name)}
+        params['encoding'] = self.encoding.params()
+        return params
+
+    @staticmethod
+    def get_context(filepath: str, context: Optional[ImageContext]) -> ImageContext:
+        """Return the shared context, or a private one when run standalone"""
+        return context if context is not None else ImageContext(filepath)
+
     def is_available(self) -> bool:
         """
         Check if the analyzer is available (tools installed, etc.)
@@ -0,0 +1,158 @@
+"""
+Bit-plane engine
+NumPy helpers for slicing images into per-channel bit planes
+"""
+
+import re
+import zipfile
+
+import numpy as np
+from PIL import Image
+
+# Channel order and display colors used for colored bit planes
+CHANNELS = ['R', 'G', 'B']
+CHANNEL_COLORS = {
+    'R': (255, 0, 0),    # Red
+    'G': (0, 255, 0),    # Green
+    'B': (0, 0, 255)     # Blue
+}
+
+# Packed planes kept instead of PNGs when bit planes are rendered lazily
+PLANES_FILE = 'lsb_planes.npz'
+
+# Names of the PNGs that can be rendered from packed planes
+PLANE_FILENAME = re.compile(r'^lsb_(?:([RGB])([0-7])(_gray)?|composite_bit([0-7]))\.(?:png|webp)$')
+
+
+def to_rgb_array(img: Image.Image) -> np.ndarray:
+    """Decode an image into a (height, width, 3) uint8 array"""
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return np.asarray(img, dtype=np.uint8)
+
+
+def bit_plane(pixels: np.ndarray, channel_idx: int, bit: int) -> np.ndarray:
+    """Return the 0/1 values of one bit of one channel"""
+    return (pixels[:, :, channel_idx] >> bit) & 1
+
+
+# Palette of bilevel composites: index r << 2 | g << 1 | b
+COMPOSITE_PALETTE = [255 * ((i >> shift) & 1) for i in range(8) for shift in (2, 1, 0)]
+
+
+def gray_values(bits: np.ndarray, bilevel: bool = False) -> np.ndarray:
+    """Pixels of a gray plane: 0/1 for mode '1', 0/255 for 'L'"""
+    return bits if bilevel else bits * np.uint8(255)
+
+
+def gray_format(bilevel: bool = False):
+    """(mode, palette) of gray planes"""
+    return ('1', None) if bilevel else ('L', None)
+
+
+def color_values(bits: np.ndarray, color, bilevel: bool = False) -> np.ndarray:
+    """Pixels of a colored plane: palette indices for 'P', RGB values otherwise"""
+    return bits if bilevel else bits[:, :, None] * np.asarray(color, dtype=np.uint8)
+
+
+def color_format(color, bilevel: bool = False):
+    """(mode, palette) of colored planes"""
+    return ('P', [0, 0, 0, *color]) if bilevel else ('RGB', None)
+
+
+def composite_values(pixels: np.ndarray, bit: int, bilevel: bool = False) -> np.ndarray:
+    """Pixels of a composite plane: palette indices for 'P', RGB values otherwise"""
+    bits = (pixels >> bit) & 1
+    if bilevel:
+        return (bits[:, :, 0] << 2) | (bits[:, :, 1] << 1) | bits[:, :, 2]
+    return bits * np.uint8(255)
+
+
+def composite_format(bilevel: bool = False):
+    """(mode, palette) of composite planes"""
+    return ('P', COMPOSITE_PALETTE) if bilevel else ('RGB', None)
+
+
+def to_image(values: np.ndarray, mode: str, palette=None) -> Image.Image:
+    """Wrap plane pixels in an image of the given (mode, palette)"""
+    if mode == '1':
+        return Image.fromarray(values.astype(bool))
+    if mode == 'P':
+        img = Image.fromarray(np.ascontiguousarray(values, dtype=np.uint8), 'P')
+        img.putpalette(palette)
+        return img
+    return Image.fromarray(values)
+
+
+def gray_plane(bits: np.ndarray, bilevel: bool = False) -> Image.Image:
+    """Render a 0/1 plane as a black and white 'L' image ('1' if bilevel)"""
+    return to_image(gray_values(bits, bilevel), *gray_format(bilevel))
+
+
+def color_plane(bits: np.ndarray, color, bilevel: bool = False) -> Image.Image:
+    """
+    Render a 0/1 plane as an 'RGB' image using the given channel color
+    (a two-color 'P' image if bilevel)
+    """
+    return to_image(color_values(bits, color, bilevel), *color_format(color, bilevel))
+
+
+def composite_plane(pixels: np.ndarray, bit: int, bilevel: bool = False) -> Image.Image:
+    """
+    Render one bit of all three channels as a single 'RGB' image
+    (an eight-color 'P' image if bilevel)
+    """
+    return to_image(composite_values(pixels, bit, bilevel), *composite_format(bilevel))
+
+
+def pack_planes(pixels: np.ndarray, path: str, rows: int = None):
+    """
+    Store all 24 bit planes, 8 pixels per byte, in an uncompressed .npz
+
+    Each plane is its own member, so rendering one plane reads only 1/24th
+    of the file. Planes are packed and written rows at a time.
+    """
+    height, width = pixels.shape[:2]
+    rows = rows or height
+    header = {'descr': '|u1', 'fortran_order': False, 'shape': (height, (width + 7) // 8)}
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        with archive.open('shape.npy', 'w') as member:
+            np.lib.format.write_array(member, np.asarray(pixels.shape[:2]))
+
+        for channel_idx, channel_name in enumerate(CHANNELS):
+            for bit in range(8):
+                with archive.open(f'{channel_name}{bit}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(member, header)
+                    for top in range(0, height, rows):
+                        strip = pixels[top:top + rows]
+                        plane = bit_plane(strip, channel_idx, bit)
+                        member.write(np.packbits(plane, axis=1).tobytes())
+
+
+def render_plane(planes_path: str, filename: str, bilevel: bool = False):
+    """
+    Render a bit plane image produced by the LSB analyzer from packed planes
+
+    Returns:
+        The image for filename, or None if filename is not a bit plane
+    """
+    match = PLANE_FILENAME.match(filename)
+    if not match:
+        return None
+    channel_name, bit, gray, composite_bit = match.groups()
+
+    with np.load(planes_path) as planes:
+        width = int(planes['shape'][1])
+
+        def unpack(name):
+            return np.unpackbits(planes[name], axis=1, count=width)
+
+        if composite_bit is not None:
+            bits = np.stack([unpack(f'{c}{composite_bit}') for c in CHANNELS], axis=2)
+            return composite_plane(bits, 0, bilevel)
+
+        bits = unpack(f'{channel_name}{bit}')
+        if gray:
+            return gray_plane(bits, bilevel)
+        return color_plane(bits, CHANNEL_COLORS[channel_name], bilevel)
@@ -0,0 +1,357 @@
+"""
+Signature carving
+Find embedded files in one pass over a memory-mapped file and work out where each ends
+"""
+
+import bz2
+import lzma
+import struct
+import zlib
+
+import numpy as np
+
+from .signatures import FILE_SIGNATURES
+
+# Bytes matched per block of the scan; blocks overlap by the longest magic
+SCAN_BLOCK = 4 * 1024 * 1024
+
+# Longest carve of a file type whose end cannot be parsed (up to the next match)
+MAX_CARVE_BYTES = 64 * 1024 * 1024
+
+# Decompressed bytes allowed while looking for the end of a compressed stream
+MAX_INFLATE_BYTES = 256 * 1024 * 1024
+INFLATE_CHUNK = 1024 * 1024
+
+# Candidate filter: every two-byte prefix that starts some magic
+PREFIXES = np.zeros(1 << 16, dtype=bool)
+for _signature in FILE_SIGNATURES:
+    PREFIXES[_signature.magic[0] << 8 | _signature.magic[1]] = True
+
+LONGEST_MAGIC = max(len(signature.magic) for signature in FILE_SIGNATURES)
+
+
+class InvalidFile(ValueError):
+    """A magic matched, but what follows is not a file of that type"""
+
+
+def find_signatures(data):
+    """
+    Offsets of every signature in data, in one pass
+
+    Each block of data is hashed into two-byte prefixes, looked up in the
+    PREFIXES table at once, and the few candidates are compared against
+    the full magics with NumPy.
+
+    Args:
+        data: Buffer (bytes, mmap...) to scan
+
+    Returns:
+        Sorted list of (offset, signature) pairs
+    """
+    values = np.frombuffer(data, dtype=np.uint8)
+    matches = []
+
+    for start in range(0, len(values), SCAN_BLOCK):
+        block = values[start:start + SCAN_BLOCK + LONGEST_MAGIC - 1]
+        if len(block) < 2:
+            break
+        prefixes = (block[:-1].astype(np.uint16) << 8) | block[1:]
+        candidates = np.flatnonzero(PREFIXES[prefixes[:SCAN_BLOCK]])
+        if not len(candidates):
+            continue
+        candidate_prefixes = prefixes[candidates]
+
+        for signature in FILE_SIGNATURES:
+            magic = signature.magic
+            positions = candidates[candidate_prefixes == (magic[0] << 8 | magic[1])]
+            positions = positions[positions + len(magic) <= len(block)]
+            for k in range(2, len(magic)):
+                positions = positions[block[positions + k] == magic[k]]
+            matches.extend((start + int(offset), signature) for offset in positions)
+
+    matches.sort(key=lambda match: match[0])
+    return matches
+
+
+def file_end(data, offset, extension):
+    """
+    Offset just past the file of the given type that starts at offset
+
+    Returns:
+        End offset, or None when the type carries no length information
+
+    Raises:
+        InvalidFile: if the data at offset is not a file of that type
+    """
+    parser = PARSERS.get(extension)
+    if parser is None:
+        return None
+    try:
+        end = parser(data, offset)
+    except (struct.error, IndexError, EOFError, OSError, zlib.error, lzma.LZMAError) as e:
+        raise InvalidFile(str(e))
+    if end is not None and (end <= offset or end > len(data)):
+        raise InvalidFile('length runs past the end of the data')
+    return end
+
+
+def _png_end(data, offset):
+    """Walk the chunks up to IEND"""
+    position = offset + 8
+    while True:
+        length, kind = struct.unpack_from('>I4s', data, position)
+        if not kind.isalpha():
+            raise InvalidFile('bad PNG chunk type')
+        position += 12 + length
+        if kind == b'IEND':
+            return position
+
+
+def _jpeg_end(data, offset):
+    """Walk the marker segments and entropy-coded scans up to EOI"""
+    position = offset + 2
+    size = len(data)
+    while position < size:
+        if data[position] != 0xff:
+            raise InvalidFile('bad JPEG marker')
+        marker = data[position + 1]
+        if marker == 0xff:
+            position += 1
+        elif marker == 0xd9:
+            return position + 2
+        elif 0xd0 <= marker <= 0xd7 or marker == 0x01:
+            position += 2
+        else:
+            length, = struct.unpack_from('>H', data, position + 2)
+            position += 2 + length
+            if marker == 0xda:
+                # Entropy-coded data runs to the next marker that is not a stuffed 0xff00
+                # or a restart
+                while True:
+                    position = data.find(b'\xff', position)
+                    if position < 0:
+                        raise InvalidFile('JPEG scan never ends')
+                    following = data[position + 1]
+                    if following == 0 or 0xd0 <= following <= 0xd7:
+                        position += 2
+                    else:
+                        break
+    raise InvalidFile('JPEG has no EOI')
+
+
+def _gif_end(data, offset):
+    """Skip the color tables and blocks up to the trailer"""
+    flags = data[offset + 10]
+    position = offset + 13
+    if flags & 0x80:
+        position += 3 << ((flags & 0x07) + 1)
+    while True:
+        block = data[position]
+        if block == 0x3b:
+            return position + 1
+        if block == 0x21:
+            position += 2
+        elif block == 0x2c:
+            flags = data[position + 9]
+            position += 10
+            if flags & 0x80:
+                position += 3 << ((flags & 0x07) + 1)
+            position += 1  # LZW minimum code size
+        else:
+            raise InvalidFile('bad GIF block')
+        # Data sub-blocks, ended by an empty one
+        while data[position]:
+            position += data[position] + 1
+        position += 1
+
+
+def _zip_end(data, offset):
+    """End of the end-of-central-directory record, including its comment"""
+    position = data.find(b'PK\x05\x06', offset)
+    if position < 0:
+        return None
+    comment_length, = struct.unpack_from('<H', data, position + 20)
+    return position + 22 + comment_length
+
+
+def _pdf_end(data, offset):
+    """Last %%EOF before the next PDF header, including its line ending"""
+    limit = data.find(b'%PDF-', offset + 5)
+    if limit < 0:
+        limit = len(data)
+    position = data.rfind(b'%%EOF', offset, limit)
+    if position < 0:
+        return None
+    position += 5
+    for newline in (b'\r\n', b'\n', b'\r'):
+        if data[position:position + len(newline)] == newline:
+            return position + len(newline)
+    return position
+
+
+def _gzip_end(data, offset):
+    """Parse the header and inflate the stream to find its trailer"""
+    flags = data[offset + 3]
+    if flags & 0xe0:
+        raise InvalidFile('reserved gzip flags set')
+    position = offset + 10
+    if flags & 0x04:  # FEXTRA
+        extra, = struct.unpack_from('<H', data, position)
+        position += 2 + extra
+    for flag in (0x08, 0x10):  # FNAME, FCOMMENT
+        if flags & flag:
+            position = data.find(b'\x00', position) + 1
+            if not position:
+                raise InvalidFile('unterminated gzip header field')
+    if flags & 0x02:  # FHCRC
+        position += 2
+
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    inflated = 0
+    with memoryview(data) as view:
+        while not inflater.eof:
+            chunk = view[position:position + INFLATE_CHUNK]
+            if not len(chunk):
+                return None  # Truncated: carve what there is
+            inflated += len(inflater.decompress(chunk, INFLATE_CHUNK))
+            while inflater.unconsumed_tail and not inflater.eof:
+                inflated += len(inflater.decompress(inflater.unconsumed_tail, INFLATE_CHUNK))
+                if inflated > MAX_INFLATE_BYTES:
+                    return None
+            if inflated > MAX_INFLATE_BYTES:
+                return None
+            position += len(chunk)
+    # Unread input belongs to whatever follows; the CRC32 and size trailer comes next
+    return position - len(inflater.unused_data) + 8
+
+
+def _bzip2_end(data, offset):
+    """Decompress the stream to find where it ends"""
+    if not 0x31 <= data[offset + 3] <= 0x39 or data[offset + 4:offset + 10] != b'1AY&SY':
+        raise InvalidFile('bad bzip2 header')
+    return _decompressed_end(bz2.BZ2Decompressor(), data, offset)
+
+
+def _xz_end(data, offset):
+    """Decompress the stream to find where it ends"""
+    return _decompressed_end(lzma.LZMADecompressor(lzma.FORMAT_XZ), data, offset)
+
+
+def _decompressed_end(decompressor, data, position):
+    """
+    Feed a bz2 or lzma decompressor until its stream ends
+
+    Returns:
+        Offset just past the stream, or None if it is truncated or
+        decompresses to more than MAX_INFLATE_BYTES
+    """
+    inflated = 0
+    with memoryview(data) as view:
+        while not decompressor.eof:
+            chunk = b''
+            if decompressor.needs_input:
+                chunk = view[position:position + INFLATE_CHUNK]
+                if not len(chunk):
+                    return None  # Truncated: carve what there is
+                position += len(chunk)
+            inflated += len(decompressor.decompress(chunk, INFLATE_CHUNK))
+            if inflated > MAX_INFLATE_BYTES:
+                return None
+    return position - len(decompressor.unused_data)
+
+
+def _7z_end(data, offset):
+    """Signature header plus the next header it points to"""
+    next_offset, next_size = struct.unpack_from('<QQ', data, offset + 12)
+    return offset + 32 + next_offset + next_size
+
+
+def _elf_end(data, offset):
+    """Furthest of the section header table and the program segments"""
+    elf_class, encoding, version = data[offset + 4], data[offset + 5], data[offset + 6]
+    if elf_class not in (1, 2) or encoding not in (1, 2) or version != 1:
+        raise InvalidFile('bad ELF identification')
+    order = '<' if encoding == 1 else '>'
+    if elf_class == 1:
+        phoff, shoff = struct.unpack_from(order + 'II', data, offset + 28)
+        phentsize, phnum, shentsize, shnum = struct.unpack_from(order + 'HHHH', data, offset + 42)
+        # p_offset and p_filesz of a program header
+        segment = [(order + 'I', 4), (order + 'I', 16)]
+    else:
+        phoff, shoff = struct.unpack_from(order + 'QQ', data, offset + 32)
+        phentsize, phnum, shentsize, shnum = struct.unpack_from(order + 'HHHH', data, offset + 54)
+        segment = [(order + 'Q', 8), (order + 'Q', 32)]
+    end = max(shoff + shnum * shentsize, phoff + phnum * phentsize)
+    for index in range(phnum):
+        header = offset + phoff + index * phentsize
+        (p_offset,), (p_filesz,) = (struct.unpack_from(fmt, data, header + field)
+                                    for fmt, field in segment)
+        end = max(end, p_offset + p_filesz)
+    return offset + end
+
+
+def _riff_end(data, offset):
+    """Chunk size field of the RIFF header"""
+    size, form = struct.unpack_from('<I4s', data, offset + 4)
+    if not form.strip().isalnum():
+        raise InvalidFile('bad RIFF form type')
+    return offset + 8 + size + (size & 1)
+
+
+def _sqlite_end(data, offset):
+    """Page size times page count from the database header"""
+    page_size, = struct.unpack_from('>H', data, offset + 16)
+    page_count, = struct.unpack_from('>I', data, offset + 28)
+    if page_size == 1:
+        page_size = 65536
+    if page_size < 512 or page_size & (page_size - 1) or not page_count:
+        raise InvalidFile('bad SQLite header')
+    return offset + page_size * page_count
+
+
+def _pem_end(data, offset):
+    """Through the end of the -----END ...----- line"""
+    position = data.find(b'-----END ', offset)
+    if position < 0:
+        raise InvalidFile('PEM block never ends')
+    position = data.find(b'-----', position + 9)
+    if position < 0:
+        raise InvalidFile('PEM block never ends')
+    return position + 5
+
+
+def _id3_end(data, offset):
+    """Only validates the tag header; the audio after it carries no total length"""
+    major, revision, flags = data[offset + 3], data[offset + 4], data[offset + 5]
+    if major not in (2, 3, 4) or revision == 0xff or flags & 0x0f \
+            or any(byte & 0x80 for byte in data[offset + 6:offset + 10]):
+        raise InvalidFile('bad ID3 header')
+    return None
+
+
+def _tiff_end(data, offset):
+    """Only validates the first IFD offset; TIFF data may sit anywhere after it"""
+    order = '<' if data[offset] == 0x49 else '>'
+    ifd, = struct.unpack_from(order + 'I', data, offset + 4)
+    if ifd < 8 or offset + ifd >= len(data):
+        raise InvalidFile('bad TIFF IFD offset')
+    return None
+
+
+PARSERS = {
+    'png': _png_end,
+    'jpg': _jpeg_end,
+    'gif': _gif_end,
+    'zip': _zip_end,
+    'pdf': _pdf_end,
+    'gz': _gzip_end,
+    'bz2': _bzip2_end,
+    'xz': _xz_end,
+    '7z': _7z_end,
+    'elf': _elf_end,
+    'riff': _riff_end,
+    'sqlite': _sqlite_end,
+    'pem': _pem_end,
+    'mp3': _id3_end,
+    'tif': _tiff_end,
+}
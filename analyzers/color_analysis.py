@@ -4,24 +4,24 @@ Analyzes color palette, histograms, and color distribution
 """
 
 from PIL import Image
-import os
-from collections import Counter
+import numpy as np
 from .base import BaseAnalyzer
+from .tiling import strip_rows, iter_strips
+
+# Working memory per pixel of a strip: packed colors and the sort behind np.unique
+STRIP_BYTES_PER_PIXEL = 32
 
 
 class ColorAnalyzer(BaseAnalyzer):
     """Analyze color palette and distribution"""
 
-    def analyze(self, filepath: str, output_dir: str) -> dict:
-        """Analyze color palette and create histograms"""
-        img = Image.open(filepath)
-
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+    executor = 'process'
+    version = '2'
 
-        width, height = img.size
-        pixels = img.load()
+    def analyze(self, filepath: str, output_dir: str, context=None) -> dict:
+        """Analyze color palette and create histograms"""
+        pixels = self.get_context(filepath, context).pixels
+        height, width = pixels.shape[:2]
 
         results = {
             'width': width,
@@ -33,20 +33,29 @@ class ColorAnalyzer(BaseAnalyzer):
             'histograms': {}
         }
 
-        # Collect all colors
-        colors = []
-        for y in range(height):
-            for x in range(width):
-                colors.append(pixels[x, y])
+        # Count every 24-bit color in a table, one strip of rows at a time
+        total = width * height
+        table = np.zeros(1 << 24, dtype=np.uint32 if total < 1 << 32 else np.uint64)
+        histograms = [np.zeros(256, dtype=np.int64) for _ in range(3)]
+        rows = strip_rows(self.memory_budget, width, STRIP_BYTES_PER_PIXEL)
+
+        for top, bottom in iter_strips(height, rows):
+            strip = pixels[top:bottom]
+            strip_colors, strip_counts = np.unique(self._pack(strip), return_counts=True)
+            table[strip_colors] += strip_counts.astype(table.dtype)
+            for c in range(3):
+                histograms[c] += np.bincount(strip[:, :, c].ravel(), minlength=256)
 
         # Count unique colors
-        color_counts = Counter(colors)
-        results['unique_colors'] = len(color_counts)
-        results['color_diversity'] = len(color_counts) / (width * height)
+        colors = np.flatnonzero(table).astype(np.uint32)
+        counts = table[colors]
+        del table
+        results['unique_colors'] = len(colors)
+        results['color_diversity'] = len(colors) / (width * height)
 
         # Get top 10 dominant colors
-        dominant = color_counts.most_common(10)
-        for color, count in dominant:
+        for packed_color, count in self._most_common(pixels, rows, colors, counts, 10):
+            color = ((packed_color >> 16) & 0xff, (packed_color >> 8) & 0xff, packed_color & 0xff)
             percentage = (count / (width * height)) * 100
             results['dominant_colors'].append({
                 'rgb': color,
@@ -56,59 +65,94 @@ class ColorAnalyzer(BaseAnalyzer):
             })
 
         # Create RGB histograms
-        self._create_histograms(img, output_dir, results)
+        self._create_histograms(histograms, output_dir, results)
 
         # Create color palette image
-        self._create_palette_image(results['dominant_colors'], output_dir)
+        results['palette_file'] = self._create_palette_image(results['dominant_colors'], output_dir)
 
         return results
 
-    def _create_histograms(self, img, output_dir, results):
-        """Create RGB histogram images"""
-        width, height = img.size
-        pixels = img.load()
-
-        # Initialize histogram bins
-        r_hist = [0] * 256
-        g_hist = [0] * 256
-        b_hist = [0] * 256
-
-        # Count pixel values
-        for y in range(height):
-            for x in range(width):
-                r, g, b = pixels[x, y]
-                r_hist[r] += 1
-                g_hist[g] += 1
-                b_hist[b] += 1
-
+    def _pack(self, pixels):
+        """Pack every pixel into one 24-bit integer"""
+        return ((pixels[:, :, 0].astype(np.uint32) << 16) |
+                (pixels[:, :, 1].astype(np.uint32) << 8) |
+                pixels[:, :, 2]).ravel()
+
+    def _most_common(self, pixels, rows, colors, counts, n):
+        """
+        The n most frequent colors as (packed_color, count) pairs
+
+        Like Counter.most_common, colors with equal counts are ordered by
+        their first appearance in scan order.
+        """
+        if len(colors) == 0:
+            return []
+
+        kth = np.partition(counts, -n)[-n] if len(colors) > n else counts.min()
+        above = set(colors[counts > kth].tolist())
+        needed = n - len(above)
+
+        # Candidates: every color above the cut, plus as many tied colors as fit
+        candidates = np.zeros(1 << 24, dtype=bool)
+        candidates[colors[counts >= kth]] = True
+
+        # Find first occurrences in scan order, strip by strip, until the selection is complete
+        height, width = pixels.shape[:2]
+        first_seen = {}
+        ties_seen = 0
+        for top, bottom in iter_strips(height, rows):
+            start = top * width
+            chunk = self._pack(pixels[top:bottom])
+            positions = np.flatnonzero(candidates[chunk])
+            values, first = np.unique(chunk[positions], return_index=True)
+            found = sorted(zip(values.tolist(), first.tolist()), key=lambda vp: vp[1])
+            for value, position in found:
+                if value in first_seen:
+                    continue
+                if value not in above:
+                    if ties_seen == needed:
+                        continue
+                    ties_seen += 1
+                first_seen[value] = start + positions[position]
+            if ties_seen == needed and above.issubset(first_seen):
+                break
+
+        found = np.fromiter(first_seen, dtype=colors.dtype, count=len(first_seen))
+        count_of = dict(zip(found.tolist(), counts[np.searchsorted(colors, found)].tolist()))
+        selected = sorted(first_seen, key=lambda c: (-count_of[c], first_seen[c]))
+        return [(color, count_of[color]) for color in selected]
+
+    def _create_histograms(self, histograms, output_dir, results):
+        """Create RGB histogram images from per-channel 256-bin counts"""
         # Create histogram images
         hist_width = 512
         hist_height = 256
 
-        for channel, hist, color in [('R', r_hist, (255, 0, 0)),
-                                      ('G', g_hist, (0, 255, 0)),
-                                      ('B', b_hist, (0, 0, 255))]:
-            hist_img = Image.new('RGB', (hist_width, hist_height), (0, 0, 0))
-            hist_pixels = hist_img.load()
+        for channel_idx, (channel, color) in enumerate([('R', (255, 0, 0)),
+                                                        ('G', (0, 255, 0)),
+                                                        ('B', (0, 0, 255))]):
+            hist = histograms[channel_idx].tolist()
 
             # Normalize histogram
             max_val = max(hist) if max(hist) > 0 else 1
 
-            # Draw histogram
+            # Bar height of every image column
+            column_heights = np.zeros(hist_width, dtype=np.int64)
             for i in range(256):
                 bar_height = int((hist[i] / max_val) * (hist_height - 10))
                 x = int((i / 256) * hist_width)
                 x_end = int(((i + 1) / 256) * hist_width)
+                column_heights[x:x_end] = bar_height
 
-                for y in range(hist_height - bar_height, hist_height):
-                    for px in range(x, x_end):
-                        if px < hist_width:
-                            hist_pixels[px, y] = color
+            # Draw histogram: fill each column from the bottom up to its bar height
+            rows = np.arange(hist_height)[:, None]
+            bars = rows >= (hist_height - column_heights)[None, :]
+            hist_pixels = np.zeros((hist_height, hist_width, 3), dtype=np.uint8)
+            hist_pixels[bars] = color
 
             # Save histogram
-            filename = f'histogram_{channel}.png'
-            hist_img.save(os.path.join(output_dir, filename))
-            results['histograms'][channel] = filename
+            results['histograms'][channel] = self.encoding.save(
+                Image.fromarray(hist_pixels), output_dir, f'histogram_{channel}')
 
     def _create_palette_image(self, dominant_colors, output_dir):
         """Create visual color palette"""
@@ -119,18 +163,13 @@ class ColorAnalyzer(BaseAnalyzer):
         palette_height = 100
 
         palette_img = Image.new('RGB', (palette_width, palette_height))
-        pixels = palette_img.load()
 
         colors_to_show = min(10, len(dominant_colors))
         color_width = palette_width // colors_to_show
 
         for i, color_info in enumerate(dominant_colors[:colors_to_show]):
-            color = color_info['rgb']
             x_start = i * color_width
-            x_end = (i + 1) * color_width
-
-            for y in range(palette_height):
-                for x in range(x_start, min(x_end, palette_width)):
-                    pixels[x, y] = color
+            x_end = min((i + 1) * color_width, palette_width)
+            palette_img.paste(color_info['rgb'], (x_start, 0, x_end, palette_height))
 
-        palette_img.save(os.path.join(output_dir, 'color_palette.png'))
+        return self.encoding.save(palette_img, output_dir, 'color_palette')
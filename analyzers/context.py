@@ -0,0 +1,156 @@
+"""
+Image context
+Decoded image data shared by all analyzers of one job
+"""
+
+import os
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from .tiling import iter_strips
+
+# Pixels converted to RGB at a time when filling the pixel array
+DECODE_STRIP_PIXELS = 1 << 22
+
+# Memory-mapped pixel store in a job's results directory
+PIXEL_STORE = '.pixels.npy'
+
+
+class ImageContext:
+    """Read and decode an uploaded image once, lazily, for every analyzer
+
+    Analyzers must treat everything exposed here as read-only: the same
+    objects are handed to every analyzer of the job.
+
+    Pillow decodes the source image in one piece, so the decoded image must
+    fit in memory once per job; the memory budget only bounds the analyzers'
+    working memory on top of it. The file is decoded from disk, and its raw
+    bytes are only read for analyzers that parse them.
+    """
+
+    def __init__(self, filepath: str, pixel_store: Optional[str] = None):
+        self.filepath = filepath
+        # Memory-mapped .npy file holding the pixels, see shared_pixels()
+        self.pixel_store = pixel_store
+        self._raw = None
+        self._image = None
+        self._rgb_image = None
+        self._pixels = None
+
+    def __getstate__(self):
+        # Only paths cross process boundaries; data is mapped or reloaded lazily
+        return {'filepath': self.filepath, 'pixel_store': self.pixel_store}
+
+    def __setstate__(self, state):
+        self.__init__(state['filepath'], state.get('pixel_store'))
+
+    @property
+    def raw(self) -> bytes:
+        """Raw file contents, read on first use (JPEG coefficient readers only need them)"""
+        if self._raw is None:
+            with open(self.filepath, 'rb') as f:
+                self._raw = f.read()
+        return self._raw
+
+    @property
+    def image(self) -> Image.Image:
+        """Decoded PIL image in its original mode"""
+        if self._image is None:
+            try:
+                image = Image.open(self.filepath)
+            except UnidentifiedImageError:
+                raise UnidentifiedImageError(f"cannot identify image file {self.filepath!r}")
+            image.load()
+            self._image = image
+        return self._image
+
+    @property
+    def format(self) -> Optional[str]:
+        """Image format as detected by Pillow (e.g. 'JPEG', 'PNG')"""
+        return self.image.format
+
+    @property
+    def quantization(self) -> Optional[dict]:
+        """JPEG quantization tables, or None for other formats"""
+        return getattr(self.image, 'quantization', None) or None
+
+    @property
+    def rgb_image(self) -> Image.Image:
+        """The image converted to RGB"""
+        if self._rgb_image is None:
+            image = self.image
+            self._rgb_image = image if image.mode == 'RGB' else image.convert('RGB')
+        return self._rgb_image
+
+    @property
+    def pixels(self) -> np.ndarray:
+        """Read-only (height, width, 3) uint8 array of the image in RGB
+
+        A zero-copy view of the pixel store when one is shared, otherwise
+        decoded strip by strip, so no full RGB copy of the image is made
+        alongside the array.
+        """
+        if self._pixels is None:
+            if self.pixel_store:
+                self._pixels = np.load(self.pixel_store, mmap_mode='r').view(np.ndarray)
+            else:
+                pixels = self._decode_into(np.empty(self._pixel_shape(), dtype=np.uint8))
+                pixels.flags.writeable = False
+                self._pixels = pixels
+        return self._pixels
+
+    @contextmanager
+    def shared_pixels(self, directory: str):
+        """
+        Decode the pixels once into a memory-mapped file in directory
+
+        While the block runs, this context and every copy pickled to another
+        process map the same file instead of holding their own decoded
+        array. The file is removed on exit. If the image cannot be decoded,
+        nothing is stored and analyzers report the error themselves.
+        """
+        path = os.path.join(directory, PIXEL_STORE)
+        try:
+            store = np.lib.format.open_memmap(path, mode='w+', dtype=np.uint8,
+                                              shape=self._pixel_shape())
+            if self._pixels is not None:
+                store[:] = self._pixels
+            else:
+                self._decode_into(store)
+            store.flush()
+            del store
+        except Exception:
+            # Analyzers report decoding errors themselves
+            if os.path.exists(path):
+                os.remove(path)
+            path = None
+
+        if path is None:
+            yield self
+            return
+
+        self.pixel_store = path
+        self._pixels = None
+        try:
+            yield self
+        finally:
+            self.pixel_store = None
+            self._pixels = None
+            os.remove(path)
+
+    def _pixel_shape(self):
+        width, height = self.image.size
+        return height, width, 3
+
+    def _decode_into(self, pixels: np.ndarray) -> np.ndarray:
+        """Convert the image to RGB into pixels, one strip of rows at a time"""
+        image = self.image
+        height, width = pixels.shape[:2]
+        rows = max(1, DECODE_STRIP_PIXELS // max(1, width))
+        for top, bottom in iter_strips(height, rows):
+            strip = image.crop((0, top, width, bottom))
+            pixels[top:bottom] = np.asarray(strip if strip.mode == 'RGB' else strip.convert('RGB'))
+        return pixels
@@ -0,0 +1,121 @@
+"""
+Artifact encoding
+Settings for how analyzers write the images they generate
+"""
+
+import os
+from contextlib import contextmanager
+
+from PIL import Image
+
+from .tiling import BufferedStripWriter, PNGStripWriter
+
+# Output formats and the file extension of each
+FORMATS = {
+    'png': '.png',
+    'webp': '.webp'
+}
+
+# Bytes per pixel a buffered strip writer holds for each mode
+MODE_BYTES = {'1': 1, 'L': 1, 'P': 1, 'RGB': 3}
+
+# Bytes per pixel while one buffered artifact is encoded: the joined strips,
+# Pillow's image and the encoder's ARGB picture
+BUFFERED_ENCODE_BYTES_PER_PIXEL = 12
+
+
+class EncodingProfile:
+    """How generated images (bit planes, maps, histograms...) are encoded"""
+
+    def __init__(self, format='png', compress_level=6, bilevel_planes=False, lossless=True,
+                 quality=80):
+        """
+        Args:
+            format: 'png' or 'webp'
+            compress_level: PNG zlib level, 0 (fastest) to 9 (smallest)
+            bilevel_planes: Store bit planes as 1-bit images instead of 8-bit
+                gray and 24-bit RGB
+            lossless: Use lossless WebP
+            quality: WebP quality, or compression effort when lossless
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported artifact format: {format}")
+        self.format = format
+        self.compress_level = compress_level
+        self.bilevel_planes = bilevel_planes
+        self.lossless = lossless
+        self.quality = quality
+
+    def params(self) -> dict:
+        """The profile's settings, as used in memo and cache keys"""
+        return {
+            'format': self.format,
+            'compress_level': self.compress_level,
+            'bilevel_planes': self.bilevel_planes,
+            'lossless': self.lossless,
+            'quality': self.quality
+        }
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.format]
+
+    def within(self, memory_budget: int, width: int, height: int, modes) -> 'EncodingProfile':
+        """
+        This profile, or a PNG one if its artifacts cannot be buffered within memory_budget
+
+        Only PNGs are streamed; other formats hold every strip until the
+        writer closes. modes lists the mode of each artifact written at the
+        same time, as all of them are held at once.
+        """
+        if self.format == 'png':
+            return self
+        held = sum(MODE_BYTES[mode] for mode in modes)
+        if width * height * (held + BUFFERED_ENCODE_BYTES_PER_PIXEL) <= memory_budget:
+            return self
+        print(f"{width}x{height} artifacts do not fit the memory budget as {self.format}, "
+              f"writing PNG")
+        return EncodingProfile('png', self.compress_level, self.bilevel_planes, self.lossless,
+                               self.quality)
+
+    def filename(self, stem: str) -> str:
+        """File name of an artifact in this profile's format"""
+        return stem + self.extension
+
+    def save(self, img: Image.Image, output_dir: str, stem: str) -> str:
+        """Write an artifact into output_dir and return its file name"""
+        filename = self.filename(stem)
+        with open(os.path.join(output_dir, filename), 'wb') as f:
+            self.write(img, f)
+        return filename
+
+    @contextmanager
+    def strip_writer(self, output_dir: str, stem: str, width: int, height: int, mode: str,
+                     palette=None):
+        """
+        Writer for an artifact produced in row strips, named filename(stem)
+
+        PNGs are streamed to disk strip by strip; other formats are assembled
+        in memory and encoded when the writer closes, see within().
+        """
+        with open(os.path.join(output_dir, self.filename(stem)), 'wb') as f:
+            if self.format == 'png':
+                writer = PNGStripWriter(f, width, height, mode, palette, self.compress_level)
+            else:
+                writer = BufferedStripWriter(f, self, width, height, mode, palette)
+            yield writer
+            writer.close()
+
+    def write(self, img: Image.Image, fp, extension=None):
+        """Encode img into a file object, in the format of extension (default: the profile's)"""
+        extension = extension or self.extension
+        if extension == FORMATS['webp']:
+            # WebP has no 1-bit or palette modes
+            if img.mode == '1':
+                img = img.convert('L')
+            elif img.mode == 'P':
+                img = img.convert('RGB')
+            img.save(fp, 'WEBP', lossless=self.lossless, quality=self.quality)
+        else:
+            # Palette images are written at the smallest bit depth that holds the palette
+            img.save(fp, 'PNG', compress_level=self.compress_level)
@@ -3,26 +3,26 @@ Entropy Analyzer
 Calculates entropy to detect hidden data and compression artifacts
 """
 
-from PIL import Image
-import math
-import os
-from collections import Counter
+import numpy as np
 from .base import BaseAnalyzer
+from .tiling import strip_rows, iter_strips, nearest_indices
+
+# Working memory per pixel while building per-block histograms
+BLOCK_BYTES_PER_PIXEL = 96
+
+# Working memory per pixel for channel histograms and entropy map rows
+STRIP_BYTES_PER_PIXEL = 8
 
 
 class EntropyAnalyzer(BaseAnalyzer):
     """Analyze image entropy"""
 
-    def analyze(self, filepath: str, output_dir: str) -> dict:
-        """Calculate entropy for the entire image and per channel"""
-        img = Image.open(filepath)
-
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+    executor = 'process'
 
-        width, height = img.size
-        pixels = img.load()
+    def analyze(self, filepath: str, output_dir: str, context=None) -> dict:
+        """Calculate entropy for the entire image and per channel"""
+        pixels = self.get_context(filepath, context).pixels
+        height, width = pixels.shape[:2]
 
         results = {
             'overall_entropy': 0,
@@ -32,59 +32,42 @@ class EntropyAnalyzer(BaseAnalyzer):
             'entropy_map_file': None
         }
 
-        # Calculate overall entropy
-        all_values = []
-        r_values = []
-        g_values = []
-        b_values = []
-
-        for y in range(height):
-            for x in range(width):
-                r, g, b = pixels[x, y]
-                all_values.extend([r, g, b])
-                r_values.append(r)
-                g_values.append(g)
-                b_values.append(b)
-
-        results['overall_entropy'] = self._calculate_entropy(all_values)
-        results['channel_entropy']['R'] = self._calculate_entropy(r_values)
-        results['channel_entropy']['G'] = self._calculate_entropy(g_values)
-        results['channel_entropy']['B'] = self._calculate_entropy(b_values)
-
-        # Calculate block-based entropy (8x8 blocks)
+        # Calculate overall and per-channel entropy from 256-bin histograms
+        histograms = [np.zeros(256, dtype=np.int64) for _ in range(3)]
+        for top, bottom in iter_strips(height, strip_rows(self.memory_budget, width,
+                                                          STRIP_BYTES_PER_PIXEL)):
+            for c in range(3):
+                histograms[c] += np.bincount(pixels[top:bottom, :, c].ravel(), minlength=256)
+        results['overall_entropy'] = self._calculate_entropy(sum(histograms))
+        results['channel_entropy']['R'] = self._calculate_entropy(histograms[0])
+        results['channel_entropy']['G'] = self._calculate_entropy(histograms[1])
+        results['channel_entropy']['B'] = self._calculate_entropy(histograms[2])
+
+        # Calculate block-based entropy (8x8 blocks), shared with the entropy map
         block_size = 8
-        block_entropies = []
-
-        for by in range(0, height - block_size, block_size):
-            for bx in range(0, width - block_size, block_size):
-                block_values = []
-                for y in range(by, min(by + block_size, height)):
-                    for x in range(bx, min(bx + block_size, width)):
-                        r, g, b = pixels[x, y]
-                        block_values.extend([r, g, b])
-
-                block_entropy = self._calculate_entropy(block_values)
-                block_entropies.append((bx, by, block_entropy))
+        block_entropies = self._block_entropies(pixels, block_size)
 
-        if block_entropies:
-            avg_block_entropy = sum(e for _, _, e in block_entropies) / len(block_entropies)
+        if block_entropies.size:
+            values = block_entropies.ravel().tolist()
+            avg_block_entropy = sum(values) / len(values)
             results['block_entropy']['average'] = avg_block_entropy
-            results['block_entropy']['min'] = min(e for _, _, e in block_entropies)
-            results['block_entropy']['max'] = max(e for _, _, e in block_entropies)
+            results['block_entropy']['min'] = min(values)
+            results['block_entropy']['max'] = max(values)
 
             # Find suspicious blocks (high entropy difference from average)
             threshold = avg_block_entropy * 1.2
-            for bx, by, entropy in block_entropies:
-                if entropy > threshold:
-                    results['suspicious_blocks'].append({
-                        'x': bx,
-                        'y': by,
-                        'entropy': entropy,
-                        'difference': entropy - avg_block_entropy
-                    })
+            for by, bx in zip(*np.nonzero(block_entropies > threshold)):
+                entropy = float(block_entropies[by, bx])
+                results['suspicious_blocks'].append({
+                    'x': int(bx) * block_size,
+                    'y': int(by) * block_size,
+                    'entropy': entropy,
+                    'difference': entropy - avg_block_entropy
+                })
 
         # Create entropy visualization
-        entropy_map_file = self._create_entropy_map(img, block_size, output_dir)
+        entropy_map_file = self._create_entropy_map(block_entropies, width, height,
+                                                    block_size, output_dir)
         if entropy_map_file:
             results['entropy_map_file'] = entropy_map_file
 
@@ -93,62 +76,89 @@ class EntropyAnalyzer(BaseAnalyzer):
 
         return results
 
-    def _calculate_entropy(self, values):
-        """Calculate Shannon entropy"""
-        if not values:
+    def _calculate_entropy(self, histogram):
+        """Calculate Shannon entropy from a histogram of value counts"""
+        total = histogram.sum()
+        if total == 0:
             return 0.0
 
-        counter = Counter(values)
-        total = len(values)
+        probabilities = histogram[histogram > 0] / total
+        entropy = 0.0 - np.sum(probabilities * np.log2(probabilities))
 
-        entropy = 0.0
-        for count in counter.values():
-            probability = count / total
-            if probability > 0:
-                entropy -= probability * math.log2(probability)
+        return round(float(entropy), 4)
 
-        return round(entropy, 4)
+    def _block_entropies(self, pixels, block_size):
+        """
+        Entropy of every block_size x block_size block over all three channels
 
-    def _create_entropy_map(self, img, block_size, output_dir):
-        """Create visual entropy map"""
-        width, height = img.size
-        pixels = img.load()
+        Blocks start every block_size pixels up to (but excluding) the last
+        block_size rows/columns, matching the original scan.
 
-        map_width = width // block_size
-        map_height = height // block_size
+        Returns:
+            (blocks_y, blocks_x) float array of entropies rounded to 4 places
+        """
+        height, width = pixels.shape[:2]
+        blocks_y = len(range(0, height - block_size, block_size))
+        blocks_x = len(range(0, width - block_size, block_size))
+        if blocks_y == 0 or blocks_x == 0:
+            return np.zeros((0, 0))
 
-        entropy_map = Image.new('L', (map_width, map_height))
-        map_pixels = entropy_map.load()
+        # -p*log2(p) for every possible count in a block
+        values_per_block = block_size * block_size * 3
+        counts = np.arange(values_per_block + 1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terms = 0.0 - (counts / values_per_block) * np.log2(counts / values_per_block)
+        terms[0] = 0.0
 
-        max_entropy = 0
+        entropies = np.empty((blocks_y, blocks_x))
+        rows_per_chunk = strip_rows(self.memory_budget, width, BLOCK_BYTES_PER_PIXEL,
+                                    block_size) // block_size
 
-        # Calculate entropy for each block
-        entropies = {}
-        for by in range(0, height - block_size, block_size):
-            for bx in range(0, width - block_size, block_size):
-                block_values = []
-                for y in range(by, min(by + block_size, height)):
-                    for x in range(bx, min(bx + block_size, width)):
-                        r, g, b = pixels[x, y]
-                        block_values.extend([r, g, b])
+        for row in range(0, blocks_y, rows_per_chunk):
+            rows = min(rows_per_chunk, blocks_y - row)
+            strip = pixels[row * block_size:(row + rows) * block_size, :blocks_x * block_size]
 
-                entropy = self._calculate_entropy(block_values)
-                entropies[(bx // block_size, by // block_size)] = entropy
-                max_entropy = max(max_entropy, entropy)
+            # One row of values_per_block samples per block
+            blocks = (strip.reshape(rows, block_size, blocks_x, block_size, 3)
+                      .transpose(0, 2, 1, 3, 4)
+                      .reshape(rows * blocks_x, values_per_block))
+
+            # Per-block 256-bin histograms in one bincount
+            offsets = np.arange(rows * blocks_x, dtype=np.int64)[:, None] * 256
+            histograms = np.bincount((blocks + offsets).ravel(),
+                                     minlength=rows * blocks_x * 256)
+            histograms = histograms.reshape(rows * blocks_x, 256)
+
+            entropies[row:row + rows] = terms[histograms].sum(axis=1).reshape(rows, blocks_x)
+
+        return np.round(entropies, 4)
+
+    def _create_entropy_map(self, block_entropies, width, height, block_size, output_dir):
+        """Create visual entropy map, scaled up to the image size one strip at a time"""
+        # At least one (black) cell, for images smaller than a block
+        map_width = max(1, width // block_size)
+        map_height = max(1, height // block_size)
+
+        entropy_map = np.zeros((map_height, map_width), dtype=np.uint8)
 
         # Normalize and draw
+        max_entropy = block_entropies.max() if block_entropies.size else 0
         if max_entropy > 0:
-            for (bx, by), entropy in entropies.items():
-                if bx < map_width and by < map_height:
-                    normalized = int((entropy / max_entropy) * 255)
-                    map_pixels[bx, by] = normalized
+            blocks_y, blocks_x = block_entropies.shape
+            normalized = (block_entropies / max_entropy) * 255
+            entropy_map[:blocks_y, :blocks_x] = normalized.astype(np.uint8)
+
+        # Scale up for visibility, picking the same map cells as a NEAREST resize
+        map_rows = nearest_indices(map_height, height)
+        map_columns = nearest_indices(map_width, width)
+        rows = strip_rows(self.memory_budget, width, STRIP_BYTES_PER_PIXEL)
 
-        # Scale up for visibility
-        entropy_map = entropy_map.resize((width, height), Image.NEAREST)
+        encoding = self.encoding.within(self.memory_budget, width, height, ['L'])
+        with encoding.strip_writer(output_dir, 'entropy_map', width, height, 'L') as writer:
+            for top, bottom in iter_strips(height, rows):
+                writer.write(entropy_map[map_rows[top:bottom]][:, map_columns])
 
-        filename = 'entropy_map.png'
-        entropy_map.save(os.path.join(output_dir, filename))
-        return filename
+        return encoding.filename('entropy_map')
 
     def _interpret_entropy(self, results):
         """Interpret entropy results"""
@@ -0,0 +1,298 @@
+"""
+ExifTool process pool
+Long-lived `exiftool -stay_open` processes shared by every job a worker runs
+"""
+
+import json
+import os
+import queue
+import re
+import secrets
+import select
+import signal
+import subprocess
+import threading
+import time
+
+# Line exiftool prints once a framed request has finished, on stdout after
+# -execute and on stderr through -echo4
+READY = re.compile(rb'\{ready(\d+)\}\r?\n')
+
+# Idle processes are pinged before reuse when unused for longer than this
+PING_INTERVAL = 60
+
+
+class ExifToolError(Exception):
+    """exiftool died, hung or could not be started"""
+
+
+class ExifToolBusy(ExifToolError):
+    """Every process is in use and the wait queue is full or timed out"""
+
+
+class ExifToolProcess:
+    """One `exiftool -stay_open True -@ -` process answering framed requests"""
+
+    def __init__(self, executable='exiftool'):
+        self.executable = executable
+        self.process = None
+        self.last_used = 0.0
+        self.start()
+
+    def start(self):
+        self.process = subprocess.Popen(
+            [self.executable, '-stay_open', 'True', '-@', '-'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE
+        )
+        # Only the process that started exiftool can wait() on it; forked
+        # work horses share the pipes but not the child
+        self.owner = os.getpid()
+        self.last_used = time.monotonic()
+
+    def alive(self) -> bool:
+        if self.process is None:
+            return False
+        if os.getpid() == self.owner:
+            return self.process.poll() is None
+        try:
+            os.kill(self.process.pid, 0)
+        except OSError:
+            return False
+        return True
+
+    def execute(self, args, timeout: float):
+        """
+        Run one command and return its (stdout, stderr) bytes
+
+        The request number in the ready lines is random, so output left in the
+        pipes by a request abandoned in another process is skipped rather than
+        mistaken for this one.
+        """
+        if any('\n' in arg or '\r' in arg for arg in args):
+            raise ValueError('exiftool arguments cannot contain line breaks')
+        number = secrets.randbits(31)
+        request = '\n'.join([*args, '-echo4', f'{{ready{number}}}', f'-execute{number}']) + '\n'
+        try:
+            self.process.stdin.write(request.encode('utf-8'))
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            raise ExifToolError(f'exiftool exited: {e}')
+
+        deadline = time.monotonic() + timeout
+        streams = {self.process.stdout.fileno(): bytearray(),
+                   self.process.stderr.fileno(): bytearray()}
+        done = {}
+        while len(done) < len(streams):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ExifToolError('exiftool timeout')
+            pending = [fd for fd in streams if fd not in done]
+            readable, _, _ = select.select(pending, [], [], remaining)
+            for fd in readable:
+                chunk = os.read(fd, 65536)
+                if not chunk:
+                    raise ExifToolError('exiftool exited')
+                buffer = streams[fd]
+                buffer += chunk
+                # Drop whatever earlier, abandoned requests left behind
+                while fd not in done:
+                    match = READY.search(buffer)
+                    if not match:
+                        break
+                    if int(match.group(1)) == number:
+                        done[fd] = bytes(buffer[:match.start()])
+                    else:
+                        del buffer[:match.end()]
+
+        self.last_used = time.monotonic()
+        out = self.process.stdout.fileno()
+        err = self.process.stderr.fileno()
+        return done[out], done[err]
+
+    def ping(self, timeout: float) -> bool:
+        """Whether the process still answers a version request"""
+        try:
+            out, _ = self.execute(['-ver'], timeout)
+        except ExifToolError:
+            return False
+        return bool(out.strip())
+
+    def kill(self):
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        try:
+            os.kill(process.pid, signal.SIGKILL)
+        except OSError:
+            pass
+        if os.getpid() == self.owner:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                pass
+        for stream in (process.stdin, process.stdout, process.stderr):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def restart(self):
+        self.kill()
+        self.start()
+
+    def close(self, timeout: float = 5):
+        """Ask exiftool to exit, killing it if it does not"""
+        if self.process is None:
+            return
+        try:
+            self.process.stdin.write(b'-stay_open\nFalse\n')
+            self.process.stdin.flush()
+            if os.getpid() == self.owner:
+                self.process.wait(timeout=timeout)
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+
+class ExifToolPool:
+    """
+    Up to size exiftool processes started on demand, with at most max_queue
+    requests waiting for one to become free
+    """
+
+    def __init__(self, size=2, max_queue=16, timeout=30, executable='exiftool'):
+        self.size = max(1, size)
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executable = executable
+        self._idle = queue.LifoQueue()
+        self._started = 0
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def _acquire(self) -> ExifToolProcess:
+        with self._lock:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+            if self._started < self.size:
+                self._started += 1
+                start = True
+            elif self._waiting >= self.max_queue:
+                raise ExifToolBusy('exiftool queue full')
+            else:
+                self._waiting += 1
+                start = False
+
+        if start:
+            try:
+                return ExifToolProcess(self.executable)
+            except OSError as e:
+                with self._lock:
+                    self._started -= 1
+                raise ExifToolError(f'exiftool could not be started: {e}')
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise ExifToolBusy('timed out waiting for an exiftool process')
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def _release(self, process: ExifToolProcess):
+        self._idle.put(process)
+
+    def execute(self, args):
+        """Run one exiftool command on a pooled process, restarting it if it hangs or dies"""
+        process = self._acquire()
+        try:
+            if not process.alive() or (time.monotonic() - process.last_used > PING_INTERVAL
+                                       and not process.ping(self.timeout)):
+                process.restart()
+            return process.execute(args, self.timeout)
+        except ExifToolError:
+            # A hung process may still be writing the abandoned answer
+            process.restart()
+            raise
+        finally:
+            self._release(process)
+
+    def metadata(self, filepaths) -> dict:
+        """
+        Metadata of many files from a single exiftool command
+
+        Returns:
+            Dict of file path -> metadata dict; files exiftool could not read are missing
+        """
+        # Absolute paths never start with '-', so none is taken for an option
+        paths = {os.path.abspath(path): path for path in filepaths}
+        if not paths:
+            return {}
+        out, err = self.execute(['-j', *paths])
+        if not out.strip():
+            message = err.decode('utf-8', 'replace').strip()
+            raise ExifToolError(f'exiftool failed: {message}' if message else 'exiftool failed')
+        return {paths[entry['SourceFile']]: entry for entry in json.loads(out)
+                if entry.get('SourceFile') in paths}
+
+    def check(self):
+        """Restart idle processes that died or stopped answering"""
+        idle = []
+        while True:
+            try:
+                idle.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        for process in idle:
+            try:
+                if not process.alive() or not process.ping(self.timeout):
+                    process.restart()
+            except OSError as e:
+                print(f"Could not restart exiftool: {e}")
+                with self._lock:
+                    self._started -= 1
+                continue
+            self._release(process)
+
+    def warm(self):
+        """Start every process now, so forked work horses inherit them"""
+        while True:
+            with self._lock:
+                if self._started >= self.size:
+                    return
+                self._started += 1
+            try:
+                self._release(ExifToolProcess(self.executable))
+            except OSError as e:
+                with self._lock:
+                    self._started -= 1
+                print(f"Could not start exiftool: {e}")
+                return
+
+    def close(self):
+        while True:
+            try:
+                process = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            process.close()
+            with self._lock:
+                self._started -= 1
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def shared_pool(size=2, max_queue=16, timeout=30, executable='exiftool') -> ExifToolPool:
+    """The process-wide pool for these settings, created on first use"""
+    key = (size, max_queue, timeout, executable)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ExifToolPool(size, max_queue, timeout, executable)
+        return pool
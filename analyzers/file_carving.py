@@ -1,21 +1,48 @@
 """
 File Carving Analyzer
-Extracts embedded files using binwalk and foremost
+Extracts embedded files by their signatures, optionally with binwalk and foremost
 """
 
+import mmap
 import subprocess
 import shutil
 import os
+import time
 from pathlib import Path
 from .base import BaseAnalyzer
+from .carver import InvalidFile, MAX_CARVE_BYTES, file_end, find_signatures
+from .structure import parse
+
+# Subdirectory of the output directory that carved files are written to
+CARVED_DIR = 'carved'
+
+# Carved files written per image, at most
+MAX_CARVED_FILES = 256
+
+# Bytes copied at a time when writing a carved file
+COPY_CHUNK = 1024 * 1024
+
+# Types that image metadata legitimately holds (EXIF IFDs, thumbnails,
+# previews); inside the host's metadata they are part of the host
+HOST_METADATA_TYPES = {'jpg', 'tif', 'png', 'gif'}
 
 
 class FileCarvingAnalyzer(BaseAnalyzer):
     """Extract embedded files from images"""
 
+    executor = 'process'
+    version = '3'
+
+    def __init__(self, external_tools=False):
+        # Also run binwalk and foremost after the built-in carver
+        self.external_tools = external_tools
+
     def analyze(self, filepath: str, output_dir: str) -> dict:
-        """Run binwalk and foremost to find embedded files"""
-        results = {}
+        """Carve embedded files by signature, then run binwalk and foremost if enabled"""
+        results = {'carver': self._carve(filepath, output_dir)}
+
+        if not self.external_tools:
+            return results
 
         # Try binwalk
         if shutil.which('binwalk'):
@@ -31,6 +58,115 @@ class FileCarvingAnalyzer(BaseAnalyzer):
 
         return results
 
+    def _carve(self, filepath: str, output_dir: str) -> dict:
+        """
+        Find every file signature in one pass over the memory-mapped image
+        and carve each embedded file out
+
+        A file ends where its own structure says it does (chunk walks,
+        archive directories, length fields); types without one are carved
+        up to the next signature, at most MAX_CARVE_BYTES. The image itself
+        is walked for its end, which tells how much data trails it, and its
+        metadata segments: images inside them (EXIF, thumbnails, MPF
+        previews) are listed apart from the embedded files.
+        """
+        start = time.monotonic()
+        results = {
+            'files': [],
+            'metadata_files': [],
+            'extracted_files': [],
+            'rejected_matches': 0,
+            'truncated': False,
+            'trailing_bytes': None
+        }
+
+        try:
+            with open(filepath, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return dict(results, scan_seconds=0.0)  # Empty file
+
+        try:
+            size = len(data)
+            matches = find_signatures(data)
+            host_end, regions = self._host_layout(data)
+            carved_dir = os.path.join(output_dir, CARVED_DIR)
+
+            for index, (offset, signature) in enumerate(matches):
+                if offset == 0 and host_end is not None:
+                    continue
+                try:
+                    end = file_end(data, offset, signature.extension)
+                except InvalidFile:
+                    results['rejected_matches'] += 1
+                    continue
+
+                if offset == 0:
+                    # The structure parser does not know this format; its match tells where it ends
+                    host_end = end
+                    continue
+
+                complete = end is not None
+                if not complete:
+                    following = next((o for o, _ in matches[index + 1:] if o > offset), size)
+                    end = min(following, offset + MAX_CARVE_BYTES)
+
+                entry = {
+                    'offset': offset,
+                    'type': signature.description,
+                    'size': end - offset,
+                    'complete': complete
+                }
+                region = next((name for first, last, name in regions if first <= offset < last),
+                              None)
+                if region is not None and signature.extension in HOST_METADATA_TYPES:
+                    entry['segment'] = region
+                    listing = results['metadata_files']
+                else:
+                    listing = results['files']
+                if len(results['extracted_files']) < MAX_CARVED_FILES:
+                    entry['file'] = self._write(data, offset, end, carved_dir,
+                                                f'{offset:08x}.{signature.extension}', results)
+                else:
+                    results['truncated'] = True
+                listing.append(entry)
+
+            if host_end is not None:
+                results['trailing_bytes'] = size - host_end
+                if host_end < size:
+                    self._write(data, host_end, size, carved_dir, 'trailing_data.bin', results)
+        finally:
+            data.close()
+
+        results['scan_seconds'] = round(time.monotonic() - start, 3)
+        return results
+
+    def _host_layout(self, data):
+        """
+        End of the image and its metadata regions, as (start, end, name)
+
+        Regions are the segments the structure parser marks as able to carry
+        anything: APPn and comment segments, ancillary chunks, extensions
+        and the images of a JPEG's MPF index.
+        """
+        structure = parse(data)
+        if structure is None:
+            return None, []
+        regions = [(segment['offset'], segment['offset'] + segment['size'], segment['type'])
+                   for segment in structure.segments
+                   if segment.get('extract') and segment['type'] != 'trailing data']
+        return structure.end, regions
+
+    def _write(self, data, start, end, carved_dir, filename, results):
+        """Copy data[start:end] into carved_dir and return its relative path"""
+        os.makedirs(carved_dir, exist_ok=True)
+        with open(os.path.join(carved_dir, filename), 'wb') as f:
+            for position in range(start, end, COPY_CHUNK):
+                f.write(data[position:min(end, position + COPY_CHUNK)])
+        path = f'{CARVED_DIR}/{filename}'
+        results['extracted_files'].append(path)
+        return path
+
     def _run_binwalk(self, filepath: str, output_dir: str) -> dict:
         """Run binwalk analysis"""
         try:
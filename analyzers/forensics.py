@@ -3,18 +3,33 @@ Forensics Analyzer
 Error Level Analysis (ELA) and manipulation detection
 """
 
-from PIL import Image, ImageChops, ImageEnhance
-import os
+from PIL import Image
 import io
+import tempfile
+import numpy as np
 from .base import BaseAnalyzer
+from .jpeg_coefficients import read_coefficients
+from .jpeg_steganalysis import analyze_coefficients
+from .tiling import strip_rows, iter_strips
+
+# Working memory per pixel of an ELA strip: the strip, its JPEG round trip and the difference
+ELA_BYTES_PER_PIXEL = 32
+
+# JPEG MCU height; ELA strips start on MCU rows and carry one MCU row of context
+# on each side so chroma upsampling sees the same neighbours as the whole image
+MCU_ROWS = 16
 
 
 class ForensicsAnalyzer(BaseAnalyzer):
     """Forensic analysis for image manipulation detection"""
 
-    def analyze(self, filepath: str, output_dir: str) -> dict:
+    executor = 'process'
+    version = '3'
+
+    def analyze(self, filepath: str, output_dir: str, context=None) -> dict:
         """Perform forensic analysis including ELA"""
-        img = Image.open(filepath)
+        context = self.get_context(filepath, context)
+        img = context.image
 
         results = {
             'ela_performed': False,
@@ -26,13 +41,16 @@ class ForensicsAnalyzer(BaseAnalyzer):
         }
 
         # Perform Error Level Analysis
-        ela_result = self._perform_ela(img, output_dir)
+        ela_result = self._perform_ela(context.pixels, output_dir)
         if ela_result:
             results.update(ela_result)
 
-        # Analyze compression artifacts
-        compression_analysis = self._analyze_compression(filepath, img)
+        # Analyze the JPEG's DCT coefficients
+        compression_analysis = self._analyze_compression(context)
         results.update(compression_analysis)
+        if 'jpeg_analysis' in compression_analysis:
+            jpeg_findings = self._interpret_jpeg(compression_analysis['jpeg_analysis'])
+            results['findings'] = results['findings'] + jpeg_findings
 
         # Analyze for cloning/copy-paste
         clone_analysis = self._detect_cloning(img)
@@ -41,36 +59,48 @@ class ForensicsAnalyzer(BaseAnalyzer):
 
         return results
 
-    def _perform_ela(self, img, output_dir):
-        """Perform Error Level Analysis"""
-        try:
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Save with known quality
-            quality = 90
-            temp_buffer = io.BytesIO()
-            img.save(temp_buffer, 'JPEG', quality=quality)
-            temp_buffer.seek(0)
+    def _perform_ela(self, pixels, output_dir):
+        """
+        Perform Error Level Analysis
 
-            # Load recompressed image
-            recompressed = Image.open(temp_buffer)
-
-            # Calculate difference
-            ela_img = ImageChops.difference(img, recompressed)
-
-            # Enhance the difference for visibility
-            extrema = ela_img.getextrema()
-            max_diff = max([ex[1] for ex in extrema])
-
-            if max_diff > 0:
-                scale = 255.0 / max_diff
-                ela_img = ImageEnhance.Brightness(ela_img).enhance(scale)
+        The image is recompressed in strips of MCU rows; the differences are
+        kept in a temporary file until the maximum is known and they can be
+        scaled for visibility.
+        """
+        try:
+            height, width = pixels.shape[:2]
+            rows = strip_rows(self.memory_budget, width, ELA_BYTES_PER_PIXEL, MCU_ROWS)
+
+            with tempfile.TemporaryFile(dir=output_dir) as scratch:
+                diff = np.memmap(scratch, dtype=np.uint8, mode='w+', shape=(height, width, 3))
+
+                # Save with known quality and calculate difference
+                max_diff = 0
+                for top, bottom in iter_strips(height, rows):
+                    start = max(0, top - MCU_ROWS)
+                    stop = min(height, bottom + MCU_ROWS)
+                    window = pixels[start:stop]
+                    recompressed = self._recompress(window, quality=90)
+                    strip_diff = np.abs(window[top - start:bottom - start].astype(np.int16) -
+                                        recompressed[top - start:bottom - start]).astype(np.uint8)
+                    diff[top:bottom] = strip_diff
+                    max_diff = max(max_diff, int(strip_diff.max()))
+
+                # Enhance the difference for visibility, as ImageEnhance.Brightness would
+                scale = np.float32(255.0 / max_diff) if max_diff > 0 else None
+                encoding = self.encoding.within(self.memory_budget, width, height, ['RGB'])
+                with encoding.strip_writer(output_dir, 'ela_result',
+                                           width, height, 'RGB') as writer:
+                    for top, bottom in iter_strips(height, rows):
+                        strip = diff[top:bottom]
+                        if scale is not None:
+                            strip = strip.astype(np.float32) * scale
+                            strip = np.clip(strip, 0, 255).astype(np.uint8)
+                        writer.write(strip)
+                del diff
 
             # Save ELA result
-            ela_filename = 'ela_result.png'
-            ela_img.save(os.path.join(output_dir, ela_filename))
+            ela_filename = encoding.filename('ela_result')
 
             return {
                 'ela_performed': True,
@@ -85,76 +115,87 @@ class ForensicsAnalyzer(BaseAnalyzer):
                 'error': str(e)
             }
 
-    def _analyze_compression(self, filepath, img):
-        """Analyze JPEG compression artifacts"""
+    def _recompress(self, pixels, quality):
+        """Pixels after a JPEG round trip at the given quality"""
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, 'JPEG', quality=quality)
+        buffer.seek(0)
+        with Image.open(buffer) as recompressed:
+            return np.asarray(recompressed.convert('RGB'))
+
+    def _analyze_compression(self, context):
+        """
+        Analyze a JPEG's compression and look for embedded data
+
+        The quantized DCT coefficients are read straight from the file, with
+        one entropy decode, and every statistic is computed on them.
+        """
         result = {
             'compression_level': 'Unknown',
             'double_jpeg': False,
             'quality_estimate': None
         }
 
-        # Check if it's a JPEG
-        if filepath.lower().endswith(('.jpg', '.jpeg')):
-            try:
-                # Try to get JPEG quality from quantization tables
-                img_copy = Image.open(filepath)
-
-                if hasattr(img_copy, 'quantization'):
-                    qtables = img_copy.quantization
-                    if qtables:
-                        # Estimate quality from quantization table
-                        result['quality_estimate'] = self._estimate_jpeg_quality(qtables)
-
-                # Check for double JPEG compression
-                # This is a simplified check
-                result['double_jpeg'] = self._check_double_jpeg(img_copy)
-
-            except:
-                pass
+        if context.format != 'JPEG':
+            return result
 
+        try:
+            analysis = analyze_coefficients(read_coefficients(context.raw))
+        except ValueError as e:
+            result['jpeg_analysis'] = {'error': str(e)}
+            return result
+
+        quality = analysis['quality']['quality']
+        result.update({
+            'compression_level': self._compression_level(quality),
+            'double_jpeg': analysis['double_compression']['detected'],
+            'quality_estimate': quality,
+            'jpeg_analysis': analysis
+        })
         return result
 
-    def _estimate_jpeg_quality(self, qtables):
-        """Estimate JPEG quality from quantization tables"""
-        # Simplified quality estimation
-        if not qtables or not qtables.get(0):
-            return None
-
-        q = qtables[0]
-        avg = sum(q) / len(q)
-
-        if avg < 10:
-            return "High (90-100)"
-        elif avg < 20:
-            return "Good (75-90)"
-        elif avg < 50:
-            return "Medium (50-75)"
+    def _compression_level(self, quality):
+        """How heavily an image of the given IJG quality is compressed"""
+        if quality >= 90:
+            return "Minimal"
+        elif quality >= 75:
+            return "Light"
+        elif quality >= 50:
+            return "Moderate"
         else:
-            return "Low (<50)"
-
-    def _check_double_jpeg(self, img):
-        """Check for signs of double JPEG compression"""
-        # This is a simplified check
-        # Real double JPEG detection requires DCT coefficient analysis
-        try:
-            # Save and reload with different quality
-            temp1 = io.BytesIO()
-            temp2 = io.BytesIO()
+            return "Heavy"
 
-            img.save(temp1, 'JPEG', quality=85)
-            img.save(temp2, 'JPEG', quality=95)
+    def _interpret_jpeg(self, analysis):
+        """Findings from the JPEG coefficient statistics"""
+        if 'error' in analysis:
+            return [f"JPEG coefficient analysis failed: {analysis['error']}"]
 
-            size1 = temp1.tell()
-            size2 = temp2.tell()
-
-            # If size difference is very small, might be double compressed
-            if size2 - size1 < 100:
-                return True
-
-        except:
-            pass
-
-        return False
+        findings = []
+        quality = analysis['quality']
+        if not quality['standard_tables']:
+            findings.append(f"Non-standard quantization tables (closest to quality "
+                            f"{quality['quality']}) - camera, editor or custom encoder")
+        double = analysis['double_compression']
+        if double['detected']:
+            findings.append(f"Double JPEG compression (confidence {double['confidence']:.0%}) - "
+                            f"the image was saved as JPEG more than once, first at about "
+                            f"quality {double['primary_quality']}")
+        if analysis['jsteg']['detected']:
+            findings.append(f"Chi-square attack: LSB replacement (JSteg-style) in the first "
+                            f"{analysis['jsteg']['embedded_fraction']:.0%} of the coefficients")
+        if analysis['f5']['detected']:
+            findings.append(f"F5-style coefficient shrinkage, about "
+                            f"{analysis['f5']['beta']:.0%} of coefficients")
+        if analysis['outguess']['detected']:
+            findings.append(f"OutGuess-style LSB changes, about "
+                            f"{analysis['outguess']['embedded_fraction']:.0%} of the capacity")
+        if not analysis['f5']['reliable']:
+            if double['detected']:
+                reason = "double-compressed images"
+            else:
+                reason = "small images, flat graphics and text"
+            findings.append(f"F5 and OutGuess estimates are unreliable on {reason}")
+        return findings
 
     def _detect_cloning(self, img):
         """Detect copy-paste/cloning artifacts"""
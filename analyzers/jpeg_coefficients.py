@@ -0,0 +1,592 @@
+"""
+JPEG coefficient reader
+Quantized DCT coefficients read straight from the entropy-coded data, without decoding to pixels
+
+Parses the marker segments and Huffman-decodes baseline, extended and
+progressive scans into one block array per component. Arithmetic-coded,
+lossless, hierarchical and 12-bit JPEGs are not supported.
+"""
+
+import re
+import struct
+from array import array
+
+import numpy as np
+
+# Blocks decoded per image, at most; larger images are read from the top
+# MCU rows down, which is plenty for coefficient statistics
+MAX_BLOCKS = 1 << 18
+
+# Natural (row-major) position of each coefficient in zigzag order
+ZIGZAG = np.array([
+    0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5,
+    12, 19, 26, 33, 40, 48, 41, 34, 27, 20, 13, 6, 7, 14, 21, 28,
+    35, 42, 49, 56, 57, 50, 43, 36, 29, 22, 15, 23, 30, 37, 44, 51,
+    58, 59, 52, 45, 38, 31, 39, 46, 53, 60, 61, 54, 47, 55, 62, 63
+])
+
+# Frame markers: baseline, extended and progressive Huffman-coded DCT
+BASELINE_FRAMES = {0xc0, 0xc1}
+PROGRESSIVE_FRAMES = {0xc2}
+UNSUPPORTED_FRAMES = {0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf}
+
+# Entropy-coded data ends at the first marker that is neither a stuffed 0xff00 nor a restart
+SCAN_END = re.compile(rb'\xff[^\x00\xd0-\xd7]')
+RESTART = re.compile(rb'\xff[\xd0-\xd7]')
+
+# Bytes of entropy-coded data turned into 32-bit windows at a time; a block
+# never needs more than REBASE_MARGIN bytes, so windows are rebuilt before that
+WINDOW_BYTES = 1 << 16
+REBASE_MARGIN = 1024
+
+MASKS = [(1 << size) - 1 for size in range(33)]
+HALVES = [1 << (size - 1) if size else 0 for size in range(33)]
+
+
+class UnsupportedJPEG(ValueError):
+    """A JPEG coding process the reader does not implement"""
+
+
+class Component:
+    """One color component: its sampling, quantization table and coefficient blocks"""
+
+    def __init__(self, ident, h, v, table):
+        self.id = ident
+        self.h = h
+        self.v = v
+        self.table = table
+        self.quantization = None  # 64 steps in natural order, latched at the first scan
+        self.blocks = None  # (rows, cols, 64) int16 coefficients in natural order
+        # Filled while decoding
+        self.block_cols = 0
+        self.block_rows = 0
+        self.grid_cols = 0
+        self.grid_rows = 0
+        self.coefficients = None  # Zigzag-ordered int16 array of grid_rows * grid_cols blocks
+
+
+class JPEGCoefficients:
+    """Quantized DCT coefficients of a JPEG, as read by read_coefficients()"""
+
+    def __init__(self, width, height, progressive, components, mcu_rows, decoded_mcu_rows):
+        self.width = width
+        self.height = height
+        self.progressive = progressive
+        self.components = components
+        self.mcu_rows = mcu_rows
+        self.decoded_mcu_rows = decoded_mcu_rows
+
+    @property
+    def complete(self) -> bool:
+        """Whether every block of the image was decoded"""
+        return self.decoded_mcu_rows >= self.mcu_rows
+
+    @property
+    def block_count(self) -> int:
+        return sum(component.blocks.shape[0] * component.blocks.shape[1]
+                   for component in self.components)
+
+    def sequence(self) -> np.ndarray:
+        """
+        Every decoded block, (n, 64) in natural order, MCU row by MCU row
+
+        Within an MCU row the blocks of each component follow one another;
+        a prefix of the sequence covers the same image area as a prefix of
+        the entropy-coded data, which is what sequential embedders fill.
+        """
+        rows = self.decoded_mcu_rows
+        parts = []
+        for component in self.components:
+            blocks = component.blocks
+            padded = np.zeros((rows * component.v, blocks.shape[1], 64), dtype=np.int16)
+            padded[:blocks.shape[0]] = blocks
+            parts.append(padded.reshape(rows, -1, 64))
+        if len(parts) == 1:
+            return parts[0].reshape(-1, 64)
+        return np.concatenate(parts, axis=1).reshape(-1, 64)
+
+
+def read_coefficients(data: bytes, max_blocks: int = MAX_BLOCKS) -> JPEGCoefficients:
+    """
+    Read the quantized DCT coefficients of a JPEG
+
+    Args:
+        data: The JPEG file contents
+        max_blocks: Stop after the MCU row that brings the block count past this
+
+    Returns:
+        JPEGCoefficients
+
+    Raises:
+        UnsupportedJPEG: for arithmetic-coded, lossless, hierarchical or 12-bit JPEGs
+        ValueError: if data is not a readable JPEG
+    """
+    if data[:2] != b'\xff\xd8':
+        raise ValueError('not a JPEG file')
+
+    tables = {}
+    huffman = {}
+    restart_interval = 0
+    frame = None
+    position = 2
+    size = len(data)
+
+    try:
+        while position < size:
+            if data[position] != 0xff:
+                raise ValueError('bad JPEG marker')
+            marker = data[position + 1]
+            if marker == 0xff:
+                position += 1
+                continue
+            if marker == 0xd9:
+                break
+            if 0xd0 <= marker <= 0xd7 or marker == 0x01:
+                position += 2
+                continue
+            length, = struct.unpack_from('>H', data, position + 2)
+            segment = data[position + 4:position + 2 + length]
+            position += 2 + length
+
+            if marker == 0xdb:
+                _read_quantization(segment, tables)
+            elif marker == 0xc4:
+                _read_huffman(segment, huffman)
+            elif marker == 0xdd:
+                restart_interval, = struct.unpack_from('>H', segment)
+            elif marker in BASELINE_FRAMES or marker in PROGRESSIVE_FRAMES:
+                frame = _Frame(segment, marker in PROGRESSIVE_FRAMES, max_blocks)
+            elif marker in UNSUPPORTED_FRAMES:
+                raise UnsupportedJPEG(f'unsupported JPEG coding process (SOF{marker - 0xc0})')
+            elif marker == 0xda:
+                if frame is None:
+                    raise ValueError('scan before frame header')
+                end = SCAN_END.search(data, position)
+                end = end.start() if end else size
+                frame.decode_scan(segment, data[position:end], tables, huffman, restart_interval)
+                position = end
+    except (struct.error, IndexError, OverflowError) as e:
+        raise ValueError(f'corrupt or truncated JPEG: {e}')
+
+    if frame is None or not frame.scans:
+        raise ValueError('JPEG has no image data')
+    return frame.result()
+
+
+def _read_quantization(segment, tables):
+    """Tables of a DQT segment, converted to natural order"""
+    position = 0
+    while position < len(segment):
+        precision, ident = segment[position] >> 4, segment[position] & 15
+        if precision:
+            values = struct.unpack_from('>64H', segment, position + 1)
+            position += 129
+        else:
+            values = segment[position + 1:position + 65]
+            position += 65
+        if len(values) < 64:
+            raise ValueError('truncated quantization table')
+        table = np.empty(64, dtype=np.int32)
+        table[ZIGZAG] = list(values)
+        tables[ident] = table
+
+
+def _read_huffman(segment, huffman):
+    """Tables of a DHT segment, as lookup lists keyed by (class, id)"""
+    position = 0
+    while position < len(segment):
+        kind, ident = segment[position] >> 4, segment[position] & 15
+        counts = segment[position + 1:position + 17]
+        total = sum(counts)
+        symbols = segment[position + 17:position + 17 + total]
+        if len(counts) < 16 or len(symbols) < total:
+            raise ValueError('truncated Huffman table')
+        huffman[kind, ident] = _huffman_lookup(counts, symbols)
+        position += 17 + total
+
+
+def _huffman_lookup(counts, symbols):
+    """
+    Decoding table indexed by the next 16 bits of data
+
+    Each entry is code length << 8 | symbol; 0 marks bits that start no code.
+    """
+    lookup = [0] * 65536
+    code = 0
+    index = 0
+    for length in range(1, 17):
+        span = 1 << (16 - length)
+        for _ in range(counts[length - 1]):
+            if code >= 1 << length:
+                raise ValueError('bad Huffman table')
+            lookup[code * span:(code + 1) * span] = [length << 8 | symbols[index]] * span
+            code += 1
+            index += 1
+        code <<= 1
+    return lookup
+
+
+class _Bits:
+    """
+    Entropy-coded bytes of one restart interval, read through 32-bit windows
+
+    windows[i] holds the four bytes from base + i, big-endian; position
+    counts bits from base. Block decoders copy both into locals and hand
+    the position back when done.
+    """
+
+    def __init__(self, data: bytes):
+        self.data = data.replace(b'\xff\x00', b'\xff')
+        self.base = 0
+        self.position = 0
+        self.windows = self._windows()
+
+    def _windows(self):
+        chunk = self.data[self.base:self.base + WINDOW_BYTES + REBASE_MARGIN]
+        values = np.frombuffer(chunk + b'\x00' * 4, dtype=np.uint8).astype(np.uint32)
+        words = (values[:-3] << 24) | (values[1:-2] << 16) | (values[2:-1] << 8) | values[3:]
+        return words.tolist()
+
+    def refill(self):
+        """Move the windows forward once the position nears their end"""
+        if self.position >= WINDOW_BYTES * 8:
+            self.base += self.position >> 3
+            self.position &= 7
+            self.windows = self._windows()
+
+
+class _Frame:
+    """Frame header and the coefficient grids that its scans fill"""
+
+    def __init__(self, segment, progressive, max_blocks):
+        precision, height, width, count = struct.unpack_from('>BHHB', segment)
+        if precision != 8:
+            raise UnsupportedJPEG(f'{precision}-bit JPEGs are not supported')
+        if not width or not height:
+            raise UnsupportedJPEG('JPEGs with the height in a DNL marker are not supported')
+
+        self.width = width
+        self.height = height
+        self.progressive = progressive
+        self.scans = 0
+        self.components = []
+        for index in range(count):
+            ident, sampling, table = segment[6 + 3 * index:9 + 3 * index]
+            self.components.append(Component(ident, sampling >> 4, sampling & 15, table))
+        if len(self.components) == 1:
+            # A single component is not interleaved: its MCU is one block
+            self.components[0].h = self.components[0].v = 1
+
+        h_max = max(component.h for component in self.components)
+        v_max = max(component.v for component in self.components)
+        self.mcu_cols = -(-width // (8 * h_max))
+        self.mcu_rows = -(-height // (8 * v_max))
+        blocks_per_mcu = sum(component.h * component.v for component in self.components)
+        blocks_per_row = self.mcu_cols * blocks_per_mcu
+        self.decoded_mcu_rows = min(self.mcu_rows, max(1, max_blocks // blocks_per_row))
+
+        for component in self.components:
+            component.block_cols = -(-(-(-width * component.h // h_max)) // 8)
+            component.block_rows = -(-(-(-height * component.v // v_max)) // 8)
+            component.grid_cols = self.mcu_cols * component.h
+            component.grid_rows = self.decoded_mcu_rows * component.v
+            size = component.grid_rows * component.grid_cols * 128
+            component.coefficients = array('h', bytes(size))
+
+    def decode_scan(self, header, data, tables, huffman, restart_interval):
+        """Decode one scan into the coefficient grids"""
+        count = header[0]
+        scan = []
+        for index in range(count):
+            ident, selectors = header[1 + 2 * index:3 + 2 * index]
+            component = next((c for c in self.components if c.id == ident), None)
+            if component is None:
+                raise ValueError(f'scan refers to unknown component {ident}')
+            dc_table = huffman.get((0, selectors >> 4))
+            ac_table = huffman.get((1, selectors & 15))
+            scan.append((component, dc_table, ac_table))
+        start, end, approximation = header[1 + 2 * count:4 + 2 * count]
+        high, low = approximation >> 4, approximation & 15
+
+        for component, _, _ in scan:
+            if component.quantization is None:
+                if component.table not in tables:
+                    raise ValueError(f'missing quantization table {component.table}')
+                component.quantization = tables[component.table]
+
+        if not self.progressive:
+            start, end, low = 0, 63, 0
+            decoder = _decode_sequential
+        elif start == 0:
+            decoder = _decode_dc_refine if high else _decode_dc_first
+        elif count != 1:
+            raise ValueError('interleaved AC scan')
+        else:
+            decoder = _decode_ac_refine if high else _decode_ac_first
+        uses_dc = decoder in (_decode_sequential, _decode_dc_first)
+        uses_ac = decoder in (_decode_sequential, _decode_ac_first, _decode_ac_refine)
+        for _, dc, ac in scan:
+            if (uses_dc and dc is None) or (uses_ac and ac is None):
+                raise ValueError('scan uses an undefined Huffman table')
+
+        state = _ScanState(scan, start, end, low)
+        segments = RESTART.split(data) if restart_interval else [data]
+        mcus = self._mcus([component for component, _, _ in scan])
+        interval = restart_interval or float('inf')
+
+        try:
+            for segment in segments:
+                bits = _Bits(segment)
+                state.restart()
+                decoded = 0
+                for mcu in mcus:
+                    for slot, coefficients, offset in mcu:
+                        bits.refill()
+                        decoder(bits, state, slot, coefficients, offset)
+                    decoded += 1
+                    if decoded >= interval:
+                        break
+                else:
+                    break  # Every MCU of the scan is decoded
+        except IndexError:
+            raise ValueError('JPEG scan data ends early')
+        self.scans += 1
+
+    def _mcus(self, components):
+        """
+        The blocks of every MCU within the decoded MCU rows, in scan order
+
+        Yields lists of (scan slot, coefficient array, block offset).
+        Non-interleaved scans walk one component's blocks in raster order.
+        """
+        if len(components) == 1:
+            component = components[0]
+            cols = component.block_cols
+            rows = min(component.block_rows, component.grid_rows)
+            for row in range(rows):
+                base = row * component.grid_cols * 64
+                for col in range(cols):
+                    yield [(0, component.coefficients, base + col * 64)]
+            return
+
+        for mcu_row in range(self.decoded_mcu_rows):
+            for mcu_col in range(self.mcu_cols):
+                mcu = []
+                for slot, component in enumerate(components):
+                    for v in range(component.v):
+                        row = mcu_row * component.v + v
+                        base = (row * component.grid_cols + mcu_col * component.h) * 64
+                        for h in range(component.h):
+                            mcu.append((slot, component.coefficients, base + h * 64))
+                yield mcu
+
+    def result(self):
+        for component in self.components:
+            grid = np.frombuffer(component.coefficients, dtype=np.int16)
+            grid = grid.reshape(component.grid_rows, component.grid_cols, 64)
+            rows = min(component.block_rows, component.grid_rows)
+            blocks = np.empty((rows, component.block_cols, 64), dtype=np.int16)
+            blocks[..., ZIGZAG] = grid[:rows, :component.block_cols]
+            component.blocks = blocks
+            component.coefficients = None
+            if component.quantization is None:
+                component.quantization = np.ones(64, dtype=np.int32)
+        return JPEGCoefficients(self.width, self.height, self.progressive, self.components,
+                                self.mcu_rows, self.decoded_mcu_rows)
+
+
+class _ScanState:
+    """Huffman tables, DC predictors and end-of-band run of the scan being decoded"""
+
+    def __init__(self, scan, start, end, low):
+        self.dc_tables = [dc for _, dc, _ in scan]
+        self.ac_tables = [ac for _, _, ac in scan]
+        self.start = start
+        self.end = end
+        self.low = low
+        self.predictors = [0] * len(scan)
+        self.eob_run = 0
+
+    def restart(self):
+        self.predictors = [0] * len(self.predictors)
+        self.eob_run = 0
+
+
+def _corrupt():
+    raise ValueError('corrupt entropy-coded data')
+
+
+def _decode_sequential(bits, state, slot, out, offset):
+    """One baseline block: the DC difference, then run/size coded AC coefficients"""
+    windows = bits.windows
+    p = bits.position
+
+    entry = state.dc_tables[slot][(windows[p >> 3] >> (16 - (p & 7))) & 0xffff]
+    if not entry:
+        _corrupt()
+    p += entry >> 8
+    size = entry & 0xff
+    if size:
+        value = (windows[p >> 3] >> (32 - size - (p & 7))) & MASKS[size]
+        p += size
+        if value < HALVES[size]:
+            value -= MASKS[size]
+        state.predictors[slot] += value
+    out[offset] = state.predictors[slot]
+
+    table = state.ac_tables[slot]
+    k = 1
+    while k < 64:
+        entry = table[(windows[p >> 3] >> (16 - (p & 7))) & 0xffff]
+        if not entry:
+            _corrupt()
+        p += entry >> 8
+        symbol = entry & 0xff
+        size = symbol & 15
+        if size:
+            k += symbol >> 4
+            if k > 63:
+                _corrupt()
+            value = (windows[p >> 3] >> (32 - size - (p & 7))) & MASKS[size]
+            p += size
+            if value < HALVES[size]:
+                value -= MASKS[size]
+            out[offset + k] = value
+            k += 1
+        elif symbol == 0xf0:
+            k += 16
+        else:
+            break
+
+    bits.position = p
+
+
+def _decode_dc_first(bits, state, slot, out, offset):
+    """First progressive DC scan of a block: the difference, scaled by the point transform"""
+    windows = bits.windows
+    p = bits.position
+    entry = state.dc_tables[slot][(windows[p >> 3] >> (16 - (p & 7))) & 0xffff]
+    if not entry:
+        _corrupt()
+    p += entry >> 8
+    size = entry & 0xff
+    if size:
+        value = (windows[p >> 3] >> (32 - size - (p & 7))) & MASKS[size]
+        p += size
+        if value < HALVES[size]:
+            value -= MASKS[size]
+        state.predictors[slot] += value
+    out[offset] = state.predictors[slot] << state.low
+    bits.position = p
+
+
+def _decode_dc_refine(bits, state, slot, out, offset):
+    """DC refinement: one more bit of precision"""
+    p = bits.position
+    if (bits.windows[p >> 3] >> (31 - (p & 7))) & 1:
+        out[offset] |= 1 << state.low
+    bits.position = p + 1
+
+
+def _decode_ac_first(bits, state, slot, out, offset):
+    """First progressive scan of a spectral band, with end-of-band runs"""
+    if state.eob_run:
+        state.eob_run -= 1
+        return
+    windows = bits.windows
+    p = bits.position
+    table = state.ac_tables[slot]
+    low = state.low
+    k = state.start
+    end = state.end
+    while k <= end:
+        entry = table[(windows[p >> 3] >> (16 - (p & 7))) & 0xffff]
+        if not entry:
+            _corrupt()
+        p += entry >> 8
+        symbol = entry & 0xff
+        run, size = symbol >> 4, symbol & 15
+        if size:
+            k += run
+            if k > end:
+                _corrupt()
+            value = (windows[p >> 3] >> (32 - size - (p & 7))) & MASKS[size]
+            p += size
+            if value < HALVES[size]:
+                value -= MASKS[size]
+            out[offset + k] = value << low
+            k += 1
+        elif run == 15:
+            k += 16
+        else:
+            eob_run = 1 << run
+            if run:
+                eob_run += (windows[p >> 3] >> (32 - run - (p & 7))) & MASKS[run]
+                p += run
+            state.eob_run = eob_run - 1
+            break
+    bits.position = p
+
+
+def _decode_ac_refine(bits, state, slot, out, offset):
+    """
+    Progressive AC refinement: new coefficients of magnitude 1 << low, and
+    one correction bit for every coefficient that is already non-zero
+    """
+    windows = bits.windows
+    p = bits.position
+    table = state.ac_tables[slot]
+    positive = 1 << state.low
+    negative = -1 << state.low
+    k = state.start
+    end = state.end
+
+    if not state.eob_run:
+        while k <= end:
+            entry = table[(windows[p >> 3] >> (16 - (p & 7))) & 0xffff]
+            if not entry:
+                _corrupt()
+            p += entry >> 8
+            symbol = entry & 0xff
+            run, size = symbol >> 4, symbol & 15
+            value = 0
+            if size:
+                value = positive if (windows[p >> 3] >> (31 - (p & 7))) & 1 else negative
+                p += 1
+            elif run != 15:
+                eob_run = 1 << run
+                if run:
+                    eob_run += (windows[p >> 3] >> (32 - run - (p & 7))) & MASKS[run]
+                    p += run
+                state.eob_run = eob_run
+                break
+            # Skip run zero coefficients, refining the non-zero ones passed on the way
+            while k <= end:
+                coefficient = out[offset + k]
+                if coefficient:
+                    if (windows[p >> 3] >> (31 - (p & 7))) & 1 and not coefficient & positive:
+                        out[offset + k] = coefficient + (positive if coefficient > 0 else negative)
+                    p += 1
+                else:
+                    if not run:
+                        break
+                    run -= 1
+                k += 1
+            if value:
+                if k > end:
+                    _corrupt()
+                out[offset + k] = value
+            k += 1
+
+    if state.eob_run:
+        # Inside an end-of-band run only the correction bits remain
+        while k <= end:
+            coefficient = out[offset + k]
+            if coefficient:
+                if (windows[p >> 3] >> (31 - (p & 7))) & 1 and not coefficient & positive:
+                    out[offset + k] = coefficient + (positive if coefficient > 0 else negative)
+                p += 1
+            k += 1
+        state.eob_run -= 1
+
+    bits.position = p
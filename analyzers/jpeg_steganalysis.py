@@ -0,0 +1,443 @@
+"""
+JPEG steganalysis
+Quality, double compression and embedding statistics computed on quantized DCT coefficients
+
+All detectors work on the coefficient arrays of jpeg_coefficients; the
+only pixel-domain step is calibration, which decompresses the luminance
+blocks with a vectorized inverse DCT, crops four pixels and transforms
+them again to estimate the cover image's statistics.
+"""
+
+import numpy as np
+
+from .jpeg_coefficients import ZIGZAG
+from .statistics import normal_cdf, pair_chi_square
+
+# IJG (libjpeg) base tables in natural order; quality q scales them by 5000 / q
+# below 50 and by 200 - 2q above
+LUMINANCE_TABLE = np.array([
+    16, 11, 10, 16, 24, 40, 51, 61,
+    12, 12, 14, 19, 26, 58, 60, 55,
+    14, 13, 16, 24, 40, 57, 69, 56,
+    14, 17, 22, 29, 51, 87, 80, 62,
+    18, 22, 37, 56, 68, 109, 103, 77,
+    24, 35, 55, 64, 81, 104, 113, 92,
+    49, 64, 78, 87, 103, 121, 120, 101,
+    72, 92, 95, 98, 112, 100, 103, 99
+])
+CHROMINANCE_TABLE = np.array([
+    17, 18, 24, 47, 99, 99, 99, 99,
+    18, 21, 26, 66, 99, 99, 99, 99,
+    24, 26, 56, 99, 99, 99, 99, 99,
+    47, 66, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99
+])
+
+# Low-frequency AC modes (zigzag positions 1-14) fitted for double
+# compression, and the non-zero coefficients a mode needs to be fitted at
+# all; flat graphics leave most modes nearly empty
+DOUBLE_COMPRESSION_MODES = ZIGZAG[1:15]
+MIN_MODE_COEFFICIENTS = 100
+
+# Coefficient magnitudes compared one by one; larger ones share the last bin
+DOUBLE_COMPRESSION_BINS = 20
+
+# Standard deviation, in coefficient units, of the rounding and clipping
+# noise a decompression to 8-bit pixels adds between the two compressions
+RECOMPRESSION_NOISE = 0.35
+
+# Double compression is reported when a primary quantization explains at
+# least this share of the misfit of the single-compression model
+# (confidence), and the misfit it removes is at least this many times the
+# square root of the coefficients fitted. Of 1,356 clean JPEGs (system
+# graphics, screenshots and photos at qualities 50 to 95) 0.3% pass.
+# Recompression at a higher quality (50 -> 80, 75 -> 90) is found in
+# 71-88% of screenshots, all photos with fine texture and 28-38% of
+# graphics, whose clipped flat areas blur the trace; recompression at a
+# lower quality (80 -> 60, 90 -> 70) in 37-80% of such photos only. From
+# quality 95 the primary steps divide or vanish in the secondary ones.
+DOUBLE_COMPRESSION_CONFIDENCE = 0.35
+DOUBLE_COMPRESSION_SIGNIFICANCE = 1
+
+# Chi-square attack: prefixes of the coefficient sequence tested, and the
+# usable coefficients a prefix needs to be tested at all
+CHI_SQUARE_PREFIXES = [0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+MIN_CHI_SQUARE_SAMPLES = 2000
+
+# p-value above which a prefix looks like JSteg-style LSB replacement; pairs
+# evened out by random bits give about half the chi-square of a fair test,
+# natural coefficients give p-values of practically zero
+JSTEG_P_THRESHOLD = 0.5
+
+# Luminance blocks calibrated, at most (from the top of the image)
+MAX_CALIBRATION_BLOCKS = 1 << 16
+
+# Modes used for the F5 estimate: (0,1), (1,0) and (1,1)
+F5_MODES = [1, 8, 9]
+
+# Estimated share of shrunk coefficients above which F5 is reported
+F5_BETA_THRESHOLD = 0.2
+
+# Calibration-based estimates (F5, OutGuess) are only made on images with
+# this many non-zero coefficients in F5_MODES and at most this share of
+# blocks without any non-zero AC coefficient. Clean graphics and
+# screenshots estimate F5 betas of 0.4-1.5 at any size and OutGuess
+# fractions up to 0.6; within the limits, none of the clean JPEGs above
+# reaches the F5 threshold and 0.3% the OutGuess one.
+MIN_CALIBRATION_COEFFICIENTS = 2000
+MAX_FLAT_BLOCKS = 0.1
+
+# Share of usable coefficients whose LSBs are flipped to measure how much
+# blockiness a maximal OutGuess-style embedding adds (half the bits change)
+OUTGUESS_PROBE_RATE = 0.5
+OUTGUESS_PROBE_SEED = 0
+
+# Estimated embedded share above which OutGuess is reported; clean images
+# within the calibration limits estimate around zero
+OUTGUESS_THRESHOLD = 0.15
+
+# Orthonormal 8-point DCT-II basis; coefficients = C @ block @ C.T
+_n = np.arange(8)
+DCT_MATRIX = np.sqrt(2 / 8) * np.cos((2 * _n[None, :] + 1) * _n[:, None] * np.pi / 16)
+DCT_MATRIX[0] /= np.sqrt(2)
+
+
+def ijg_table(base, quality):
+    """IJG quantization table of the given quality, from a base table"""
+    scale = 5000 // quality if quality < 50 else 200 - 2 * quality
+    return np.clip((base * scale + 50) // 100, 1, 255)
+
+
+def estimate_quality(coefficients):
+    """
+    IJG quality whose tables come closest to the image's
+
+    Returns:
+        Dict with the quality, whether the tables are exactly the IJG ones
+        (as written by libjpeg, Pillow, most cameras' own encoders are not)
+        and the mean absolute difference per table entry
+    """
+    tables = [(coefficients.components[0].quantization, LUMINANCE_TABLE)]
+    if len(coefficients.components) > 1:
+        tables.append((coefficients.components[1].quantization, CHROMINANCE_TABLE))
+
+    best = None
+    for quality in range(1, 101):
+        error = sum(np.abs(table - ijg_table(base, quality)).sum() for table, base in tables)
+        if best is None or error < best[1]:
+            best = (quality, error)
+    quality, error = best
+    return {
+        'quality': quality,
+        'standard_tables': bool(error == 0),
+        'table_error': round(float(error) / (64 * len(tables)), 2)
+    }
+
+
+def magnitude_histogram(values):
+    """Counts of the absolute values 0 to DOUBLE_COMPRESSION_BINS, larger ones in the last bin"""
+    magnitudes = np.minimum(np.abs(values), DOUBLE_COMPRESSION_BINS).astype(np.int64)
+    return np.bincount(magnitudes, minlength=DOUBLE_COMPRESSION_BINS + 1).astype(np.float64)
+
+
+def requantized_histogram(cover, primary, secondary):
+    """
+    Expected magnitude histogram of unquantized coefficients compressed
+    with the primary step, decompressed and compressed with the secondary one
+
+    The decompression noise spreads each primary multiple over the
+    secondary bins around it as a normal distribution.
+    """
+    levels = np.bincount(np.abs(np.round(cover / primary)).astype(np.int64))
+    values = np.nonzero(levels)[0] * primary
+    bins = np.arange(-1, DOUBLE_COMPRESSION_BINS + 2)
+    upper = normal_cdf(((bins + 0.5) * secondary - values[:, None]) / RECOMPRESSION_NOISE)
+    lower = normal_cdf(((bins - 0.5) * secondary - values[:, None]) / RECOMPRESSION_NOISE)
+    counts = ((upper - lower) * levels[levels > 0, None]).sum(axis=0)
+    histogram = np.bincount(np.minimum(np.abs(bins), DOUBLE_COMPRESSION_BINS), weights=counts,
+                            minlength=DOUBLE_COMPRESSION_BINS + 1)
+    # Values past the last bin computed
+    histogram[-1] += max(0.0, cover.size - histogram.sum())
+    return histogram
+
+
+def histogram_misfit(observed, expected):
+    """Chi-square-like distance of the non-zero bins of two magnitude histograms"""
+    return float(((observed - expected) ** 2 / (observed + expected + 1))[1:].sum())
+
+
+def double_compression(blocks, cover, quantization):
+    """
+    Lukas and Fridrich's estimate of the primary quality of a double-compressed JPEG
+
+    The calibrated, unquantized coefficients stand in for the image before
+    any compression. Quantized once with the image's own table they predict
+    the histogram of a single compression; quantized with the step of an
+    IJG quality first, then with the image's, they predict that of a double
+    compression. The primary quality is the one that fits best. A primary
+    step that divides the image's leaves no trace.
+
+    Args:
+        blocks: (rows, cols, 64) luminance coefficients in natural order
+        cover: Their calibrated, unquantized coefficients
+        quantization: Luminance table in natural order
+
+    Returns:
+        Dict with the verdict, the confidence (share of the single-compression
+        misfit explained), the primary quality when detected and the modes
+        and coefficients fitted
+    """
+    scale = blocks.shape[0] * blocks.shape[1] / max(1, cover.shape[0] * cover.shape[1])
+    primaries = np.array([ijg_table(LUMINANCE_TABLE, quality) for quality in range(1, 101)])
+
+    single = 0.0
+    double = np.zeros(len(primaries))
+    modes = []
+    coefficients = 0
+    for mode in DOUBLE_COMPRESSION_MODES:
+        observed = magnitude_histogram(blocks[..., mode].ravel())
+        if observed[1:].sum() < MIN_MODE_COEFFICIENTS:
+            continue
+        values = cover[..., mode].ravel()
+        secondary = int(quantization[mode])
+        single_expected = magnitude_histogram(np.round(values / secondary)) * scale
+        misfit = histogram_misfit(observed, single_expected)
+        fits = {}
+        for quality, primary in enumerate(primaries[:, mode].tolist()):
+            if primary not in fits:
+                fits[primary] = misfit if secondary % primary == 0 else histogram_misfit(
+                    observed, requantized_histogram(values, primary, secondary) * scale)
+            double[quality] += fits[primary]
+        single += misfit
+        modes.append(f'{mode // 8},{mode % 8}')
+        coefficients += int(observed[1:].sum())
+
+    if not modes:
+        return {'detected': False, 'confidence': None, 'primary_quality': None,
+                'modes': [], 'coefficients': 0}
+
+    best = int(np.argmin(double))
+    gain = max(0.0, single - double[best])
+    confidence = gain / single if single else 0.0
+    detected = (confidence >= DOUBLE_COMPRESSION_CONFIDENCE
+                and gain >= DOUBLE_COMPRESSION_SIGNIFICANCE * np.sqrt(coefficients))
+    return {
+        'detected': bool(detected),
+        'confidence': round(float(confidence), 3),
+        'primary_quality': best + 1 if detected else None,
+        'modes': modes,
+        'coefficients': coefficients
+    }
+
+
+def chi_square_attack(sequence):
+    """
+    Westfeld and Pfitzmann's chi-square attack on sequential LSB replacement (JSteg)
+
+    Overwriting coefficient LSBs with message bits evens out the counts of
+    each value pair (2i, 2i + 1). The AC coefficients other than 0 and 1,
+    which JSteg skips, are tested over growing prefixes of the sequence;
+    a p-value near 1 means the pairs are even, as in the embedded part.
+
+    Args:
+        sequence: (n, 64) blocks in natural order, in embedding order
+
+    Returns:
+        Dict with the p-value of the whole sequence, the p-value per tested
+        prefix and the estimated embedded share of the sequence
+    """
+    values = sequence[:, 1:].ravel()
+    usable = (values >= -128) & (values < 128) & (values != 0) & (values != 1)
+    values = values[usable] + 128
+    if len(values) < MIN_CHI_SQUARE_SAMPLES:
+        return {'p_value': None, 'prefixes': [], 'embedded_fraction': 0.0,
+                'detected': False, 'coefficients': int(len(values))}
+
+    prefixes = []
+    previous = 0
+    histogram = np.zeros(256, dtype=np.int64)
+    for fraction in CHI_SQUARE_PREFIXES:
+        end = int(len(values) * fraction)
+        histogram += np.bincount(values[previous:end], minlength=256)
+        previous = end
+        if end >= MIN_CHI_SQUARE_SAMPLES:
+            prefixes.append({'fraction': fraction, 'p_value': pair_chi_square(histogram)})
+
+    embedded = 0.0
+    for prefix in prefixes:
+        if prefix['p_value'] < JSTEG_P_THRESHOLD:
+            break
+        embedded = prefix['fraction']
+
+    return {
+        'p_value': prefixes[-1]['p_value'],
+        'prefixes': prefixes,
+        'embedded_fraction': embedded,
+        'detected': embedded > 0,
+        'coefficients': int(len(values))
+    }
+
+
+def decompress(blocks, quantization):
+    """Pixel plane of dequantized blocks, inverse transformed, rounded and clipped like a decoder"""
+    rows, cols = blocks.shape[:2]
+    dequantized = (blocks * quantization.astype(np.float32)).reshape(rows, cols, 8, 8)
+    pixels = DCT_MATRIX.T.astype(np.float32) @ dequantized @ DCT_MATRIX.astype(np.float32) + 128
+    pixels = np.clip(np.round(pixels), 0, 255)
+    return pixels.transpose(0, 2, 1, 3).reshape(rows * 8, cols * 8)
+
+
+def transform(pixels):
+    """Unquantized DCT blocks of a pixel plane; rows and columns past a multiple of 8 are dropped"""
+    rows, cols = pixels.shape[0] // 8, pixels.shape[1] // 8
+    tiles = pixels[:rows * 8, :cols * 8].reshape(rows, 8, cols, 8).transpose(0, 2, 1, 3) - 128
+    matrix = DCT_MATRIX.astype(np.float32)
+    transformed = matrix @ tiles.astype(np.float32) @ matrix.T
+    return transformed.reshape(rows, cols, 64)
+
+
+def compress(pixels, quantization):
+    """Quantized DCT blocks of a pixel plane; rows and columns past a multiple of 8 are dropped"""
+    return np.round(transform(pixels) / quantization).astype(np.int16)
+
+
+def calibrate(blocks, quantization):
+    """
+    Estimate the cover image's coefficients from the stego image's
+
+    The decompressed image is cropped by four pixels in both directions so
+    the block grid no longer lines up with the embedding changes, and
+    transformed again. The result is unquantized, with one block row and
+    column fewer; quantizing it with the same table gives the calibrated
+    image.
+    """
+    return transform(decompress(blocks, quantization)[4:, 4:])
+
+
+def calibration_reliable(blocks):
+    """
+    Whether calibration can be trusted to recreate the cover's histograms
+
+    Edges of flat graphics and text ring differently on the shifted block
+    grid, so calibration loses zeros there just as F5 gains them.
+    """
+    nonzero = int(sum((blocks[..., mode] != 0).sum() for mode in F5_MODES))
+    flat = float((~blocks[..., 1:].any(axis=-1)).mean())
+    return nonzero >= MIN_CALIBRATION_COEFFICIENTS and flat <= MAX_FLAT_BLOCKS
+
+
+def f5_estimate(blocks, calibrated):
+    """
+    Fridrich's estimate of the share of coefficients F5 shrank
+
+    F5 decrements coefficient magnitudes, moving counts from each
+    histogram bin towards zero. With the calibrated histogram h standing in
+    for the cover and H for the image, beta minimizes the squared error of
+    H(0) = h(0) + beta h(1) and H(1) = h(1) + beta (h(2) - h(1)) over the
+    three lowest-frequency AC modes.
+    """
+    betas = []
+    for mode in F5_MODES:
+        stego = np.bincount(np.abs(blocks[..., mode].ravel().astype(np.int32)), minlength=3)[:3]
+        cover = np.bincount(np.abs(calibrated[..., mode].ravel().astype(np.int32)), minlength=3)[:3]
+        # The calibrated image is one block smaller
+        stego = stego * (cover.sum() / max(1, stego.sum()))
+        denominator = cover[1] ** 2 + (cover[2] - cover[1]) ** 2
+        if denominator:
+            betas.append((cover[1] * (stego[0] - cover[0])
+                          + (stego[1] - cover[1]) * (cover[2] - cover[1])) / denominator)
+    beta = float(np.mean(betas)) if betas else 0.0
+    return {
+        'beta': round(beta, 4),
+        'detected': beta > F5_BETA_THRESHOLD
+    }
+
+
+def blockiness(pixels):
+    """Mean absolute difference across the 8x8 block boundaries of a pixel plane"""
+    rows = np.abs(pixels[7:-1:8] - pixels[8::8]).mean() if pixels.shape[0] > 8 else 0.0
+    cols = np.abs(pixels[:, 7:-1:8] - pixels[:, 8::8]).mean() if pixels.shape[1] > 8 else 0.0
+    return float(rows + cols) / 2
+
+
+def flip_lsbs(blocks, rate, rng):
+    """Copy of blocks with the LSB of each AC coefficient other than 0 and 1 flipped at rate"""
+    flipped = blocks.copy()
+    ac = flipped[..., 1:]
+    usable = (ac != 0) & (ac != 1)
+    ac[usable & (rng.random(ac.shape, dtype=np.float32) < rate)] ^= 1
+    return flipped
+
+
+def outguess_estimate(blocks, calibrated, quantization):
+    """
+    Fridrich, Goljan and Hogea's blockiness attack on OutGuess
+
+    OutGuess flips coefficient LSBs and then corrects the histogram, so the
+    chi-square attack misses it, but every change adds discontinuity at the
+    block boundaries. Flipping LSBs of a maximal message into the image
+    adds less blockiness the more of them were already changed; the
+    calibrated image shows how much a clean image would gain. The embedded
+    share is one minus the ratio of the two gains.
+
+    Args:
+        blocks: (rows, cols, 64) luminance coefficients
+        calibrated: Their calibrated blocks, one row and column fewer
+    """
+    rng = np.random.default_rng(OUTGUESS_PROBE_SEED)
+    rows, cols = calibrated.shape[:2]
+    blocks = blocks[:rows, :cols]
+
+    gains = []
+    for image in (blocks, calibrated):
+        probed = flip_lsbs(image, OUTGUESS_PROBE_RATE, rng)
+        gains.append(blockiness(decompress(probed, quantization))
+                     - blockiness(decompress(image, quantization)))
+    stego_gain, cover_gain = gains
+    estimate = 1 - stego_gain / cover_gain if cover_gain > 0 else 0.0
+    return {
+        'embedded_fraction': round(float(estimate), 4),
+        'detected': estimate > OUTGUESS_THRESHOLD
+    }
+
+
+def analyze_coefficients(coefficients):
+    """
+    Run every detector on the coefficients of a JPEG
+
+    Returns:
+        Dict of results by detector, plus how much of the image was read
+    """
+    luminance = coefficients.components[0]
+    blocks = luminance.blocks
+    quantization = luminance.quantization
+
+    # Calibration works on whole block rows from the top of the image
+    rows = max(1, min(blocks.shape[0], MAX_CALIBRATION_BLOCKS // max(1, blocks.shape[1])))
+    calibration_blocks = blocks[:rows]
+    cover = calibrate(calibration_blocks, quantization)
+    calibrated = np.round(cover / quantization).astype(np.int16)
+
+    double = double_compression(calibration_blocks, cover, quantization)
+    f5 = f5_estimate(calibration_blocks, calibrated)
+    outguess = outguess_estimate(calibration_blocks, calibrated, quantization)
+    # Calibration recreates the last compression only, and fails on flat
+    # graphics and text; either throws both estimates far off
+    reliable = calibration_reliable(calibration_blocks) and not double['detected']
+    for estimate in (f5, outguess):
+        estimate['reliable'] = reliable
+        estimate['detected'] = estimate['detected'] and reliable
+
+    return {
+        'quality': estimate_quality(coefficients),
+        'double_compression': double,
+        'jsteg': chi_square_attack(coefficients.sequence()),
+        'f5': f5,
+        'outguess': outguess,
+        'blocks_analyzed': coefficients.block_count,
+        'complete': coefficients.complete,
+        'progressive': coefficients.progressive
+    }
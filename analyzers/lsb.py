@@ -3,107 +3,113 @@ LSB (Least Significant Bit) Analyzer
 Extracts and visualizes bit planes from images
 """
 
-from PIL import Image
 import os
-from pathlib import Path
+from contextlib import ExitStack
 from .base import BaseAnalyzer
+from .bitplanes import (CHANNELS, CHANNEL_COLORS, PLANES_FILE, bit_plane, gray_values, gray_format,
+                        color_values, color_format, composite_values, composite_format, pack_planes)
+from .tiling import strip_rows, iter_strips
+
+# Working memory per pixel of a strip: planes, rendered values and PNG rows
+STRIP_BYTES_PER_PIXEL = 16
 
 
 class LSBAnalyzer(BaseAnalyzer):
     """Analyze and extract LSB data from images"""
 
-    def analyze(self, filepath: str, output_dir: str) -> dict:
-        """Extract LSB data from all color channels and bit planes"""
-        img = Image.open(filepath)
+    executor = 'process'
 
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
+    def __init__(self, lazy=False):
+        # Store packed planes and render PNGs on first access instead of now
+        self.lazy = lazy
 
-        width, height = img.size
-        pixels = img.load()
+    def analyze(self, filepath: str, output_dir: str, context=None) -> dict:
+        """Extract LSB data from all color channels and bit planes"""
+        # Decoded once per job into a (height, width, 3) array
+        pixels = self.get_context(filepath, context).pixels
+        height, width = pixels.shape[:2]
 
         results = {
             'width': width,
             'height': height,
-            'mode': img.mode,
+            'mode': 'RGB',
             'bit_planes': [],
             'composite_planes': []
         }
 
-        # Color maps for each channel (R, G, B)
-        color_maps = {
-            'R': (255, 0, 0),    # Red
-            'G': (0, 255, 0),    # Green
-            'B': (0, 0, 255)     # Blue
-        }
+        rows = strip_rows(self.memory_budget, width, STRIP_BYTES_PER_PIXEL)
+
+        encoding = self.encoding
+        if self.lazy:
+            pack_planes(pixels, os.path.join(output_dir, PLANES_FILE), rows)
+            results['planes_file'] = PLANES_FILE
+        else:
+            # All 56 images are written at once
+            bilevel = encoding.bilevel_planes
+            modes = [gray_format(bilevel)[0] for _ in CHANNELS for _ in range(8)]
+            modes += [color_format(CHANNEL_COLORS[name], bilevel)[0]
+                      for name in CHANNELS for _ in range(8)]
+            modes += [composite_format(bilevel)[0] for _ in range(8)]
+            encoding = encoding.within(self.memory_budget, width, height, modes)
+            self._write_planes(pixels, output_dir, rows, encoding)
+
+        # List bit planes for each channel
+        for channel_name in CHANNELS:
+            base_color = CHANNEL_COLORS[channel_name]
 
-        # Extract bit planes for each channel
-        channels = ['R', 'G', 'B']
-        for channel_idx, channel_name in enumerate(channels):
             for bit in range(8):
-                # Create grayscale version
-                bit_plane_gray = Image.new('L', (width, height))
-                bit_plane_gray_pixels = bit_plane_gray.load()
-
-                # Create colored version
-                bit_plane_color = Image.new('RGB', (width, height))
-                bit_plane_color_pixels = bit_plane_color.load()
-
-                base_color = color_maps[channel_name]
-
-                for y in range(height):
-                    for x in range(width):
-                        pixel_value = pixels[x, y][channel_idx]
-                        bit_value = (pixel_value >> bit) & 1
-
-                        # Grayscale version
-                        bit_plane_gray_pixels[x, y] = bit_value * 255
-
-                        # Colored version - apply channel color only where bit is set
-                        if bit_value:
-                            bit_plane_color_pixels[x, y] = base_color
-                        else:
-                            bit_plane_color_pixels[x, y] = (0, 0, 0)
-
-                # Save grayscale bit plane image
-                output_filename_gray = f"lsb_{channel_name}{bit}_gray.png"
-                output_path_gray = os.path.join(output_dir, output_filename_gray)
-                bit_plane_gray.save(output_path_gray)
-
-                # Save colored bit plane image
-                output_filename_color = f"lsb_{channel_name}{bit}.png"
-                output_path_color = os.path.join(output_dir, output_filename_color)
-                bit_plane_color.save(output_path_color)
-
                 results['bit_planes'].append({
                     'channel': channel_name,
                     'bit': bit,
-                    'filename': output_filename_color,
-                    'filename_gray': output_filename_gray,
+                    'filename': encoding.filename(f"lsb_{channel_name}{bit}"),
+                    'filename_gray': encoding.filename(f"lsb_{channel_name}{bit}_gray"),
                     'color': '#{:02x}{:02x}{:02x}'.format(*base_color)
                 })
 
-        # Create composite views combining all channels for each bit
+        # Composite views combining all channels for each bit
         for bit in range(8):
-            composite = Image.new('RGB', (width, height))
-            composite_pixels = composite.load()
-
-            for y in range(height):
-                for x in range(width):
-                    r_bit = (pixels[x, y][0] >> bit) & 1
-                    g_bit = (pixels[x, y][1] >> bit) & 1
-                    b_bit = (pixels[x, y][2] >> bit) & 1
-
-                    composite_pixels[x, y] = (r_bit * 255, g_bit * 255, b_bit * 255)
-
-            composite_filename = f"lsb_composite_bit{bit}.png"
-            composite_path = os.path.join(output_dir, composite_filename)
-            composite.save(composite_path)
-
             results['composite_planes'].append({
                 'bit': bit,
-                'filename': composite_filename
+                'filename': encoding.filename(f"lsb_composite_bit{bit}")
             })
 
         return results
+
+    def _write_planes(self, pixels, output_dir, rows, encoding):
+        """Write every bit plane and composite image, one strip of rows at a time"""
+        height, width = pixels.shape[:2]
+        bilevel = encoding.bilevel_planes
+
+        with ExitStack() as stack:
+            def writer(stem, image_format):
+                mode, palette = image_format
+                return stack.enter_context(encoding.strip_writer(output_dir, stem, width, height,
+                                                                 mode, palette))
+
+            gray_writers = {}
+            color_writers = {}
+            for channel_name in CHANNELS:
+                for bit in range(8):
+                    stem = f"lsb_{channel_name}{bit}"
+                    gray_writers[channel_name, bit] = writer(f"{stem}_gray", gray_format(bilevel))
+                    color_writers[channel_name, bit] = writer(
+                        stem, color_format(CHANNEL_COLORS[channel_name], bilevel))
+            composite_writers = [writer(f"lsb_composite_bit{bit}", composite_format(bilevel))
+                                 for bit in range(8)]
+
+            for top, bottom in iter_strips(height, rows):
+                strip = pixels[top:bottom]
+
+                for channel_idx, channel_name in enumerate(CHANNELS):
+                    for bit in range(8):
+                        bits = bit_plane(strip, channel_idx, bit)
+
+                        # Grayscale bit plane image
+                        gray_writers[channel_name, bit].write(gray_values(bits, bilevel))
+
+                        # Colored bit plane image - channel color only where bit is set
+                        color_writers[channel_name, bit].write(
+                            color_values(bits, CHANNEL_COLORS[channel_name], bilevel))
+
+                for bit in range(8):
+                    composite_writers[bit].write(composite_values(strip, bit, bilevel))
@@ -0,0 +1,198 @@
+"""
+LSB steganalysis
+Chi-square attack, RS analysis and Sample Pair Analysis of a pixel channel
+
+Every detector takes one (height, width) uint8 channel, works through it
+in row strips with NumPy and returns plain numbers, so a whole image is
+screened in a fraction of a second.
+"""
+
+import numpy as np
+
+from .statistics import pair_chi_square
+from .tiling import iter_strips
+
+# Chi-square curve: the channel is cut into this many consecutive windows of
+# pixels (in raster order), each holding at least MIN_WINDOW_PIXELS
+CHI_SQUARE_WINDOWS = 100
+MIN_WINDOW_PIXELS = 4096
+
+# p-value above which a window looks like LSB replacement with random bits
+CHI_SQUARE_P_THRESHOLD = 0.5
+
+# RS analysis: pixel groups are runs of four horizontal neighbours, and the
+# mask flips the middle two
+RS_GROUP = 4
+
+
+def chi_square_attack(channel, rows):
+    """
+    Westfeld and Pfitzmann's chi-square attack, over the channel and along it
+
+    Args:
+        channel: (height, width) uint8 values
+        rows: Rows processed at a time
+
+    Returns:
+        Dict with the p-value of the whole channel, the curve of p-values
+        of consecutive windows, and the share of leading windows that look
+        embedded (sequential embedders fill the image from the top)
+    """
+    height, width = channel.shape
+    windows = min(CHI_SQUARE_WINDOWS, height * width // MIN_WINDOW_PIXELS)
+    size = height * width // windows if windows else 0
+
+    histogram = np.zeros(256, dtype=np.int64)
+    window_histograms = np.zeros((windows, 256), dtype=np.int64)
+    for top, bottom in iter_strips(height, rows):
+        values = channel[top:bottom].ravel()
+        histogram += np.bincount(values, minlength=256)
+        if windows:
+            # Split the strip at window boundaries; pixels past the last whole window are left out
+            start, end = top * width, bottom * width
+            for window in range(start // size, min(windows, -(-end // size))):
+                segment = values[max(0, window * size - start):(window + 1) * size - start]
+                window_histograms[window] += np.bincount(segment, minlength=256)
+
+    curve = [pair_chi_square(counts) for counts in window_histograms]
+    leading = 0
+    for p_value in curve:
+        if p_value < CHI_SQUARE_P_THRESHOLD:
+            break
+        leading += 1
+
+    return {
+        'p_value': pair_chi_square(histogram),
+        'curve': curve,
+        'embedded_fraction': round(leading / windows, 4) if windows else 0.0
+    }
+
+
+def rs_analysis(channel, rows):
+    """
+    Fridrich, Goljan and Du's RS analysis
+
+    Groups of pixels are regular when flipping their masked pixels makes
+    them noisier (by the sum of neighbour differences) and singular when it
+    smooths them. LSB replacement pulls the regular and singular shares of
+    F1 flipping together while those of F-1 flipping drift apart; measuring
+    both on the channel and on its LSB-inverted copy gives a quadratic
+    whose root is the embedding rate.
+
+    Returns:
+        Dict with the estimated rate (share of pixels carrying message
+        bits) and the four group shares of the channel
+    """
+    height, width = channel.shape
+    usable = width // RS_GROUP * RS_GROUP
+    counts = np.zeros(8, dtype=np.int64)  # R_M, S_M, R_-M, S_-M for the channel, then inverted
+    total = 0
+
+    for top, bottom in iter_strips(height, rows):
+        # One contiguous array per position in the group
+        group = [channel[top:bottom, column:usable:RS_GROUP].astype(np.int16)
+                 for column in range(RS_GROUP)]
+        total += group[0].size
+        for offset, (a, b, c, d) in ((0, group), (4, [column ^ 1 for column in group])):
+            noise = _noise(a, b, c, d)
+            for index, flip in enumerate((_flip, _shifted_flip)):
+                flipped_noise = _noise(a, flip(b), flip(c), d)
+                counts[offset + 2 * index] += np.count_nonzero(flipped_noise > noise)
+                counts[offset + 2 * index + 1] += np.count_nonzero(flipped_noise < noise)
+
+    if not total:
+        return {'rate': None}
+
+    r_m, s_m, r_neg, s_neg, r_m_inv, s_m_inv, r_neg_inv, s_neg_inv = counts / total
+    d0, d1 = r_m - s_m, r_m_inv - s_m_inv
+    d0_neg, d1_neg = r_neg - s_neg, r_neg_inv - s_neg_inv
+    x = _smaller_root(2 * (d1 + d0), d0_neg - d1_neg - d1 - 3 * d0, d0 - d0_neg)
+    rate = x / (x - 0.5) if x is not None and x != 0.5 else None
+
+    return {
+        'rate': _rate(rate),
+        'regular': round(float(r_m), 4),
+        'singular': round(float(s_m), 4),
+        'regular_negative': round(float(r_neg), 4),
+        'singular_negative': round(float(s_neg), 4)
+    }
+
+
+def _flip(values):
+    """F1: swap 2i and 2i + 1"""
+    return values ^ 1
+
+
+def _shifted_flip(values):
+    """F-1: swap 2i - 1 and 2i"""
+    return ((values + 1) ^ 1) - 1
+
+
+def _noise(a, b, c, d):
+    """Discrimination function: sum of absolute differences between neighbours in each group"""
+    return np.abs(b - a) + np.abs(c - b) + np.abs(d - c)
+
+
+def sample_pair_analysis(channel, rows):
+    """
+    Dumitrescu, Wu and Wang's Sample Pair Analysis
+
+    Over all pairs of horizontally or vertically adjacent pixels (u, v),
+    counts X (v even and u < v, or v odd and u > v), Y (the reverse) and
+    K (u and v equal but for the LSB). Without embedding X and Y are about
+    equal; the rate is the smaller root of 2K b^2 + 2(2X - n) b + Y - X = 0,
+    doubled.
+
+    Returns:
+        Dict with the estimated rate and the pair counts
+    """
+    height, width = channel.shape
+    x = y = k = n = 0
+    previous_row = None
+
+    for top, bottom in iter_strips(height, rows):
+        strip = channel[top:bottom]
+        pairs = [(strip[:, :-1], strip[:, 1:]), (strip[:-1], strip[1:])]
+        if previous_row is not None:
+            pairs.append((previous_row, strip[:1]))
+        for u, v in pairs:
+            if not u.size:
+                continue
+            odd = (v & 1).astype(bool)
+            less = u < v
+            greater = u > v
+            x += np.count_nonzero(less & ~odd) + np.count_nonzero(greater & odd)
+            y += np.count_nonzero(greater & ~odd) + np.count_nonzero(less & odd)
+            k += np.count_nonzero((u >> 1) == (v >> 1))
+            n += u.size
+        previous_row = strip[-1:]
+
+    if not k:
+        return {'rate': None, 'pairs': n}
+
+    beta = _smaller_root(2 * k, 2 * (2 * x - n), y - x)
+    return {
+        'rate': _rate(2 * beta if beta is not None else None),
+        'pairs': int(n),
+        'x': int(x),
+        'y': int(y),
+        'k': int(k)
+    }
+
+
+def _smaller_root(a, b, c):
+    """Root of a z^2 + b z + c = 0 with the smaller magnitude, or None if there is no real one"""
+    if a == 0:
+        return -c / b if b else None
+    discriminant = b * b - 4 * a * c
+    if discriminant < 0:
+        return None
+    root = discriminant ** 0.5
+    return min((-b + root) / (2 * a), (-b - root) / (2 * a), key=abs)
+
+
+def _rate(value):
+    """An estimated rate as reported: clipped to 0-1 and rounded"""
+    if value is None:
+        return None
+    return round(min(1.0, max(0.0, float(value))), 4)
@@ -1,48 +1,59 @@
 """
 Metadata Analyzer
-Extracts EXIF and other metadata using exiftool
+Extracts EXIF and other metadata using a pool of long-lived exiftool processes
 """
 
-import subprocess
-import json
 import shutil
 from .base import BaseAnalyzer
+from .exiftool import shared_pool
 
 
 class MetadataAnalyzer(BaseAnalyzer):
     """Extract metadata from images"""
 
+    cost = 'cheap'
+    version = '2'
+
+    def __init__(self, executable='exiftool', pool_size=2, queue_size=16, timeout=30):
+        self.executable = executable
+        # exiftool processes kept running per worker, and requests allowed to wait for one
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        self.timeout = timeout
+
+    def params(self) -> dict:
+        """The pool's size and queue do not change the output"""
+        params = super().params()
+        del params['pool_size'], params['queue_size']
+        return params
+
+    def pool(self):
+        """This worker's exiftool pool, started on first use"""
+        return shared_pool(self.pool_size, self.queue_size, self.timeout, self.executable)
+
     def is_available(self) -> bool:
         """Check if exiftool is installed"""
-        return shutil.which('exiftool') is not None
+        return shutil.which(self.executable) is not None
 
     def analyze(self, filepath: str, output_dir: str) -> dict:
         """Extract metadata using exiftool"""
+        return self.analyze_batch([filepath])[filepath]
+
+    def analyze_batch(self, filepaths) -> dict:
+        """
+        Extract the metadata of many images with a single exiftool command
+
+        Returns:
+            Dict of file path -> result, as analyze() returns for that file
+        """
+        filepaths = list(filepaths)
         if not self.is_available():
-            return {'error': 'exiftool not installed'}
+            return {path: {'error': 'exiftool not installed'} for path in filepaths}
 
         try:
-            # Run exiftool
-            result = subprocess.run(
-                ['exiftool', '-j', filepath],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-
-            if result.returncode == 0:
-                metadata = json.loads(result.stdout)
-                return {
-                    'metadata': metadata[0] if metadata else {},
-                    'raw_output': result.stdout
-                }
-            else:
-                return {
-                    'error': 'exiftool failed',
-                    'stderr': result.stderr
-                }
-
-        except subprocess.TimeoutExpired:
-            return {'error': 'exiftool timeout'}
+            metadata = self.pool().metadata(filepaths)
         except Exception as e:
-            return {'error': str(e)}
+            return {path: {'error': str(e)} for path in filepaths}
+
+        return {path: {'metadata': metadata[path]} if path in metadata
+                else {'error': 'exiftool failed'} for path in filepaths}
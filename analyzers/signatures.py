@@ -0,0 +1,41 @@
+"""
+File signatures
+Magic bytes of file types commonly hidden inside images
+"""
+
+from collections import namedtuple
+
+Signature = namedtuple('Signature', ['magic', 'description', 'extension'])
+
+# Only signatures of 3+ bytes, so random data rarely matches
+FILE_SIGNATURES = [
+    Signature(b'\x89PNG\r\n\x1a\n', 'PNG image', 'png'),
+    Signature(b'\xff\xd8\xff', 'JPEG image', 'jpg'),
+    Signature(b'GIF87a', 'GIF image', 'gif'),
+    Signature(b'GIF89a', 'GIF image', 'gif'),
+    Signature(b'II*\x00', 'TIFF image', 'tif'),
+    Signature(b'MM\x00*', 'TIFF image', 'tif'),
+    Signature(b'RIFF', 'RIFF container (WAV/AVI/WebP)', 'riff'),
+    Signature(b'%PDF-', 'PDF document', 'pdf'),
+    Signature(b'PK\x03\x04', 'ZIP archive', 'zip'),
+    Signature(b'Rar!\x1a\x07', 'RAR archive', 'rar'),
+    Signature(b"7z\xbc\xaf'\x1c", '7-Zip archive', '7z'),
+    Signature(b'\x1f\x8b\x08', 'gzip compressed data', 'gz'),
+    Signature(b'BZh', 'bzip2 compressed data', 'bz2'),
+    Signature(b'\xfd7zXZ\x00', 'xz compressed data', 'xz'),
+    Signature(b'\x7fELF', 'ELF executable', 'elf'),
+    Signature(b'Salted__', 'OpenSSL encrypted data', 'enc'),
+    Signature(b'-----BEGIN ', 'PEM/PGP armored data', 'pem'),
+    Signature(b'ID3', 'MP3 audio', 'mp3'),
+    Signature(b'OggS', 'Ogg media', 'ogg'),
+    Signature(b'fLaC', 'FLAC audio', 'flac'),
+    Signature(b'SQLite format 3\x00', 'SQLite database', 'sqlite'),
+]
+
+
+def identify(data: bytes):
+    """Description of the file type data starts with, or None"""
+    for signature in FILE_SIGNATURES:
+        if data.startswith(signature.magic):
+            return signature.description
+    return None
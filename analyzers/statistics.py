@@ -0,0 +1,80 @@
+"""
+Statistics
+Distribution functions shared by the steganalysis detectors
+"""
+
+import math
+
+import numpy as np
+
+# Average count a value pair needs to enter a pair chi-square test
+MIN_PAIR_EXPECTED = 5
+
+
+def pair_chi_square(histogram, min_expected=MIN_PAIR_EXPECTED):
+    """
+    p-value of the chi-square test that the counts of each value pair (2i, 2i + 1) are equal
+
+    Pairs expecting min_expected or fewer counts are left out. A p-value
+    near 1 means the pairs are as even as LSB replacement with random bits
+    leaves them; natural data gives practically zero.
+
+    Args:
+        histogram: Counts by value, starting at an even value
+    """
+    even, odd = histogram[0::2].astype(np.float64), histogram[1::2].astype(np.float64)
+    expected = (even + odd) / 2
+    kept = expected > min_expected
+    if kept.sum() < 2:
+        return 0.0
+    chi_square = float((((even - expected) ** 2)[kept] / expected[kept]).sum())
+    return round(chi_square_survival(chi_square, int(kept.sum()) - 1), 4)
+
+
+_erf = np.vectorize(math.erf, otypes=[np.float64])
+
+
+def normal_cdf(x):
+    """Standard normal distribution function, element-wise"""
+    return 0.5 * (1 + _erf(np.asarray(x, dtype=np.float64) / math.sqrt(2)))
+
+
+def chi_square_survival(x, dof):
+    """P(X > x) for a chi-square distribution with dof degrees of freedom"""
+    return _gamma_q(dof / 2, x / 2)
+
+
+def _gamma_q(a, x):
+    """Regularized upper incomplete gamma function Q(a, x)"""
+    if x <= 0:
+        return 1.0
+    log_prefix = -x + a * math.log(x) - math.lgamma(a)
+    if x < a + 1:
+        # Series for P(a, x)
+        term = total = 1 / a
+        n = a
+        for _ in range(1000):
+            n += 1
+            term *= x / n
+            total += term
+            if abs(term) < abs(total) * 1e-12:
+                break
+        return max(0.0, 1 - total * math.exp(log_prefix))
+    # Continued fraction for Q(a, x), by the modified Lentz method
+    tiny = 1e-300
+    b = x + 1 - a
+    c = 1 / tiny
+    d = 1 / b
+    result = d
+    for i in range(1, 1000):
+        an = -i * (i - a)
+        b += 2
+        d = an * d + b
+        d = 1 / (d if abs(d) > tiny else tiny)
+        c = b + an / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        result *= delta
+        if abs(delta - 1) < 1e-12:
+            break
+    return min(1.0, result * math.exp(log_prefix))
@@ -6,28 +6,78 @@ Attempts to extract hidden data using steghide
 import subprocess
 import shutil
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from .base import BaseAnalyzer
+from .steghide_header import HeaderCheck, validated_seed
+
+# Seconds a single steghide attempt may take
+ATTEMPT_TIMEOUT = 30
+
+# Image formats steghide can embed into, by magic bytes
+SUPPORTED_SIGNATURES = {
+    b'\xff\xd8\xff': 'JPEG',
+    b'BM': 'BMP',
+}
+
+
+def read_wordlist(path):
+    """Stream candidate passwords from a wordlist, one per line, as bytes"""
+    with open(path, 'rb') as f:
+        for line in f:
+            yield line.rstrip(b'\r\n')
 
 
 class SteghideAnalyzer(BaseAnalyzer):
     """Extract data hidden with steghide"""
 
+    version = '3'
+
+    def __init__(self, workers=None, header_check=True):
+        # Concurrent steghide processes in dictionary mode
+        self.workers = workers or os.cpu_count() or 1
+        # Reject JPEG passphrases whose steghide header does not match in Python first
+        self.header_check = header_check
+
+    def params(self) -> dict:
+        """The number of concurrent processes does not change the output"""
+        params = super().params()
+        del params['workers']
+        return params
+
     def is_available(self) -> bool:
         """Check if steghide is installed"""
         return shutil.which('steghide') is not None
 
-    def analyze(self, filepath: str, output_dir: str, custom_passwords=None) -> dict:
+    def analyze(self, filepath: str, output_dir: str, custom_passwords=None, wordlist=None,
+                context=None) -> dict:
         """Try to extract data with steghide
 
         Args:
             filepath: Path to the image file
             output_dir: Directory to save extracted files
             custom_passwords: Optional list of custom passwords to try
+            wordlist: Optional path to a wordlist for a dictionary attack
+            context: Shared decoded image for this job (optional)
         """
         if not self.is_available():
             return {'error': 'steghide not installed'}
 
-        results = {'attempts': []}
+        # Don't spawn a single steghide process for files it can never hold data in
+        image_format = self._image_format(filepath)
+        if image_format is None:
+            return {'error': 'steghide only embeds into JPEG and BMP images - skipped',
+                    'skipped': True}
+        check = self._header_check(image_format, filepath, context)
+        if check is not None and not check.has_capacity():
+            return {'error': f'Only {check.samples} usable DCT coefficients, too few to hold '
+                             f'steghide data - skipped', 'skipped': True}
+
+        if wordlist:
+            return self._dictionary_attack(filepath, output_dir, wordlist, check)
+
+        results = {'attempts': [], 'header_check': check is not None}
 
         # Use custom passwords if provided, otherwise use defaults
         if custom_passwords:
@@ -39,6 +89,14 @@ class SteghideAnalyzer(BaseAnalyzer):
 
         for password in passwords:
             try:
+                if check is not None and not check.accepts(password.encode('utf-8')):
+                    results['attempts'].append({
+                        'password': password or '(empty)',
+                        'success': False,
+                        'message': 'Rejected by header check'
+                    })
+                    continue
+
                 output_file = os.path.join(output_dir, f'steghide_extracted_{password or "empty"}.txt')
 
                 cmd = ['steghide', 'extract', '-sf', filepath, '-xf', output_file]
@@ -85,3 +143,159 @@ class SteghideAnalyzer(BaseAnalyzer):
                 })
 
         return results
+
+    def _image_format(self, filepath: str):
+        """Format steghide can have embedded into, from the file's magic bytes, or None"""
+        with open(filepath, 'rb') as f:
+            header = f.read(max(len(magic) for magic in SUPPORTED_SIGNATURES))
+        for magic, image_format in SUPPORTED_SIGNATURES.items():
+            if header.startswith(magic):
+                return image_format
+        return None
+
+    def _header_check(self, image_format, filepath, context):
+        """
+        Header check of a JPEG, or None when every passphrase must go to steghide
+
+        The check is only used once it agrees with the installed steghide;
+        BMP files and JPEGs it cannot read whole always get full runs.
+        """
+        if not self.header_check or image_format != 'JPEG':
+            return None
+        seed = validated_seed()
+        if seed is None:
+            return None
+        try:
+            return HeaderCheck(self.get_context(filepath, context).raw, seed)
+        except ValueError as e:
+            print(f"steghide header check not used for {os.path.basename(filepath)}: {e}")
+            return None
+
+    def _dictionary_attack(self, filepath: str, output_dir: str, wordlist: str, check=None) -> dict:
+        """Try every password of a wordlist on a pool of steghide processes
+
+        The wordlist is streamed, at most self.workers attempts run at once,
+        and all in-flight attempts are killed as soon as one succeeds. Only
+        summary counts and the winning password are reported. Passwords the
+        header check rejects never reach steghide.
+        """
+        results = {
+            'mode': 'dictionary',
+            'using_custom_passwords': True,
+            'wordlist': os.path.basename(wordlist),
+            'workers': self.workers,
+            'header_check': check is not None,
+            'success': False,
+            'password': None,
+            'rejected': 0,
+            'attempted': 0,
+            'failed': 0,
+            'timeouts': 0,
+            'errors': 0
+        }
+
+        found = threading.Event()
+        live = set()
+        lock = threading.Lock()
+
+        def attempt(password, slot):
+            """Run one steghide extraction; returns (outcome, password, slot)"""
+            if found.is_set():
+                return 'cancelled', password, slot
+
+            slot_file = os.path.join(output_dir, f'.steghide_slot{slot}')
+            try:
+                proc = subprocess.Popen(
+                    ['steghide', 'extract', '-sf', filepath, '-xf', slot_file,
+                     '-f', '-p', password],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL
+                )
+            except OSError:
+                return 'error', password, slot
+            with lock:
+                live.add(proc)
+                # A success may have been reported while this one was starting
+                if found.is_set():
+                    proc.kill()
+            try:
+                returncode = proc.wait(timeout=ATTEMPT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                return 'timeout', password, slot
+            finally:
+                with lock:
+                    live.discard(proc)
+
+            if returncode == 0:
+                return 'success', password, slot
+            return ('cancelled' if found.is_set() else 'failed'), password, slot
+
+        start = time.monotonic()
+        candidates = read_wordlist(wordlist)
+        free_slots = list(range(self.workers))
+        running = set()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            exhausted = False
+            while running or not exhausted:
+                # Keep every worker busy until the wordlist runs out
+                while not exhausted and not found.is_set() and free_slots:
+                    password = next(candidates, None)
+                    if password is None:
+                        exhausted = True
+                        break
+                    if check is not None and not check.accepts(password):
+                        results['rejected'] += 1
+                        continue
+                    running.add(pool.submit(attempt, password, free_slots.pop()))
+
+                if not running:
+                    break
+
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    outcome, password, slot = future.result()
+                    free_slots.append(slot)
+
+                    if outcome == 'cancelled':
+                        continue
+                    results['attempted'] += 1
+
+                    if outcome == 'success' and not results['success']:
+                        found.set()
+                        exhausted = True
+                        # Stop every other attempt still running
+                        with lock:
+                            for proc in live:
+                                proc.kill()
+
+                        output_file = 'steghide_extracted.txt'
+                        os.replace(os.path.join(output_dir, f'.steghide_slot{slot}'),
+                                   os.path.join(output_dir, output_file))
+                        results['success'] = True
+                        results['password'] = (password.decode('utf-8', errors='replace')
+                                               or '(empty)')
+                        results['output_file'] = output_file
+                    elif outcome == 'timeout':
+                        results['timeouts'] += 1
+                    elif outcome == 'failed':
+                        results['failed'] += 1
+                    elif outcome == 'error':
+                        results['errors'] += 1
+
+        # Remove per-slot output files left by failed attempts
+        for slot in range(self.workers):
+            try:
+                os.remove(os.path.join(output_dir, f'.steghide_slot{slot}'))
+            except FileNotFoundError:
+                pass
+
+        elapsed = time.monotonic() - start
+        results['elapsed_seconds'] = round(elapsed, 3)
+        results['attempts_per_second'] = (round(results['attempted'] / elapsed, 1)
+                                          if elapsed > 0 else 0.0)
+
+        return results
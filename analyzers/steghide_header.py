@@ -0,0 +1,176 @@
+"""
+Steghide header check
+Tell whether a passphrase can open a steghide JPEG without running steghide
+
+steghide spreads its data over the non-zero DCT coefficients in an order
+seeded by the passphrase, and starts it with a 24-bit magic number. Reading
+those 24 bits the same way rejects a wrong passphrase after a few
+coefficients, so only the passphrases that pass need a steghide run.
+"""
+
+import hashlib
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+
+import numpy as np
+from PIL import Image
+
+from .jpeg_coefficients import read_coefficients
+
+# Start of every steghide payload, read least significant bit first
+MAGIC = 0x73688d
+MAGIC_BITS = 24
+
+# JPEG coefficients per embedded bit: the bit is the parity of the sum of
+# their magnitudes
+SAMPLES_PER_BIT = 3
+
+# steghide's pseudo-random generator: value = (a * value + c) mod 2^32
+LCG_MULTIPLIER = 1367208549
+LCG_INCREMENT = 1
+
+# Validation against the installed steghide: passphrases embedded, wrong
+# passphrases that must all be rejected, and seconds per embedding
+VALIDATION_PASSPHRASES = 2
+VALIDATION_WRONG_PASSPHRASES = 64
+VALIDATION_TIMEOUT = 30
+
+
+def _seed_little_endian(digest):
+    """XOR of the four little-endian words of the MD5 digest"""
+    words = np.frombuffer(digest, dtype='<u4')
+    return int(words[0] ^ words[1] ^ words[2] ^ words[3])
+
+
+def _seed_big_endian(digest):
+    """XOR of the four big-endian words of the MD5 digest"""
+    words = np.frombuffer(digest, dtype='>u4')
+    return int(words[0] ^ words[1] ^ words[2] ^ words[3])
+
+
+# Ways of folding the passphrase's MD5 into the 32-bit seed; validation keeps
+# the one the installed steghide agrees with
+SEED_FUNCTIONS = [_seed_little_endian, _seed_big_endian]
+
+
+class HeaderCheck:
+    """Passphrase check on the coefficients of one JPEG"""
+
+    def __init__(self, data: bytes, seed=_seed_little_endian):
+        """
+        Args:
+            data: The JPEG file contents
+            seed: Function of the MD5 digest giving the generator's seed
+
+        Raises:
+            ValueError: if the JPEG cannot be read whole
+        """
+        coefficients = read_coefficients(data, max_blocks=sys.maxsize)
+        if not coefficients.complete:
+            raise ValueError('JPEG could not be read whole')
+        # Components in frame order, block rows, blocks, coefficients in natural order
+        values = np.concatenate([component.blocks.ravel() for component in coefficients.components])
+        values = values[values != 0].astype(np.int32)
+        self.parities = (np.abs(values) & 1).astype(np.uint8).tobytes()
+        self.samples = len(self.parities)
+        self.seed = seed
+
+    def has_capacity(self) -> bool:
+        """Whether the image has enough usable coefficients to hold a steghide header"""
+        return self.samples > SAMPLES_PER_BIT * MAGIC_BITS
+
+    def accepts(self, passphrase: bytes) -> bool:
+        """
+        Whether the first MAGIC_BITS bits this passphrase selects spell the magic
+
+        Coefficients are picked by a partial Fisher-Yates shuffle driven by
+        the generator, as steghide's Selector does; the shuffle is kept
+        sparse, as only a few dozen positions are ever drawn.
+        """
+        if not self.has_capacity():
+            return False
+        samples = self.samples
+        parities = self.parities
+        value = self.seed(hashlib.md5(passphrase).digest())
+        moved = {}
+        index = 0
+        for bit in range(MAGIC_BITS):
+            total = 0
+            for _ in range(SAMPLES_PER_BIT):
+                value = (LCG_MULTIPLIER * value + LCG_INCREMENT) & 0xffffffff
+                pick = index + int(value / 4294967296.0 * (samples - index))
+                total += parities[moved.get(pick, pick)]
+                moved[pick] = moved.get(index, index)
+                index += 1
+            if total & 1 != (MAGIC >> bit) & 1:
+                return False
+        return True
+
+
+_seed = None
+_validated = False
+_lock = threading.Lock()
+
+
+def validated_seed(executable='steghide'):
+    """
+    The seed function the installed steghide agrees with, or None
+
+    Runs once per process: random payloads are embedded under random
+    passphrases into a noise JPEG, and a seed function is kept only if the
+    check accepts every right passphrase and rejects every wrong one. A
+    failed embedding or no agreeing function disables the check, so every
+    passphrase goes to steghide.
+    """
+    global _seed, _validated
+    with _lock:
+        if not _validated:
+            _seed = _validate(executable)
+            _validated = True
+        return _seed
+
+
+def _validate(executable):
+    stegos = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            cover = os.path.join(directory, 'cover.jpg')
+            payload = os.path.join(directory, 'payload.bin')
+            noise = np.random.default_rng().integers(0, 256, (128, 128, 3), dtype=np.uint8)
+            Image.fromarray(noise).save(cover, 'JPEG', quality=90)
+            with open(payload, 'wb') as f:
+                f.write(secrets.token_bytes(16))
+            for index in range(VALIDATION_PASSPHRASES):
+                passphrase = secrets.token_hex(8)
+                stego = os.path.join(directory, f'stego{index}.jpg')
+                subprocess.run(
+                    [executable, 'embed', '-cf', cover, '-ef', payload, '-sf', stego,
+                     '-p', passphrase, '-f', '-q'],
+                    stdin=subprocess.DEVNULL,
+                    capture_output=True,
+                    timeout=VALIDATION_TIMEOUT,
+                    check=True
+                )
+                with open(stego, 'rb') as f:
+                    stegos.append((f.read(), passphrase.encode()))
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"steghide header check disabled, could not embed a test payload: {e}")
+        return None
+
+    for seed in SEED_FUNCTIONS:
+        try:
+            checks = [(HeaderCheck(data, seed), passphrase) for data, passphrase in stegos]
+        except ValueError as e:
+            print(f"steghide header check disabled, could not read a test image: {e}")
+            return None
+        if all(check.accepts(passphrase) for check, passphrase in checks) and not any(
+                check.accepts(secrets.token_hex(8).encode())
+                for check, _ in checks for _ in range(VALIDATION_WRONG_PASSPHRASES)):
+            return seed
+
+    print("steghide header check disabled, it does not agree with the installed steghide")
+    return None
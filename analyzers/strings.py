@@ -1,49 +1,171 @@
 """
 Strings Analyzer
-Extracts readable ASCII strings from image data
+Extracts readable ASCII and UTF-16 strings from image data
 """
 
-import subprocess
+import heapq
+import mmap
 import os
+import re
 from .base import BaseAnalyzer
 
+# Longest string reported as one hit; longer runs continue in the next hit
+MAX_STRING_LENGTH = 65536
+
+# Characters of a string that are scored and kept in the results (strings.txt has them whole)
+MAX_RANKED_LENGTH = 1024
+
+# Printable ASCII plus tab, as GNU strings counts them
+PRINTABLE = rb'[\x20-\x7e\t]'
+
+# Byte pattern of a string character, and the codec that decodes it, per encoding
+ENCODINGS = {
+    'ascii': (PRINTABLE, 'ascii'),
+    'utf-16le': (PRINTABLE + rb'\x00', 'utf-16-le'),
+    'utf-16be': (rb'\x00' + PRINTABLE, 'utf-16-be'),
+}
+UTF16_ENCODINGS = {'utf-16le', 'utf-16be'}
+
+# What makes a string interesting, and how much; encodings only count for
+# strings of at least ENCODED_DISTINCT different characters ('AAAA...' is not base64)
+INTEREST_PATTERNS = [
+    (re.compile(r'\b[A-Za-z][A-Za-z0-9_]{1,15}\{[A-Za-z0-9_\-!?@#$.]{6,}\}'), 'flag', 100),
+    (re.compile(r'(?i)\b(?:https?|ftp)://[^\s"\'<>]+'), 'url', 50),
+    (re.compile(r'\b[A-Za-z0-9._%+-]{3,64}@[a-z0-9-]{3,63}(?:\.[a-z0-9-]{2,63})*\.[a-z]{2,6}\b'),
+     'email', 40),
+    (re.compile(r'-----BEGIN [A-Z ]+-----'), 'pem', 60),
+    # Letters only as boundaries: \b does not fire between '_' and a letter, as in 'hidden_password'
+    (re.compile(r'(?i)(?<![A-Za-z])'
+                r'(?:password|passwd|secret|token|api[_-]?key|private|flag|ctf|hidden)'
+                r'(?![A-Za-z])'),
+     'keyword', 30),
+    (re.compile(r'^(?:[A-Za-z0-9+/]{4}){4,}(?:[A-Za-z0-9+/]{2}==|[A-Za-z0-9+/]{3}=)?$'),
+     'base64', 25),
+    (re.compile(r'^(?:[0-9a-fA-F]{2}){16,}$'), 'hex', 20),
+]
+ENCODED_TAGS = {'base64', 'hex'}
+ENCODED_DISTINCT = 8
+
+
+def interest(text: str):
+    """Score and tags of a string; longer and more varied text scores a little higher"""
+    tags = []
+    score = 0
+    distinct = len(set(text))
+    for pattern, tag, weight in INTEREST_PATTERNS:
+        if tag in ENCODED_TAGS and distinct < ENCODED_DISTINCT:
+            continue
+        if pattern.search(text):
+            tags.append(tag)
+            score += weight
+    score += min(len(text), 64) / 8 + distinct / 8
+    return score, tags
+
 
 class StringsAnalyzer(BaseAnalyzer):
     """Extract readable strings from image file"""
 
+    executor = 'process'
+    cost = 'cheap'
+    version = '3'
+
+    def __init__(self, min_length=8, encodings=('ascii', 'utf-16le', 'utf-16be'), top=100):
+        self.min_length = min_length
+        self.encodings = [name for name in encodings if name in ENCODINGS]
+        # Strings reported in the results, most interesting first
+        self.top = top
+
     def analyze(self, filepath: str, output_dir: str) -> dict:
-        """Extract strings using the strings command"""
+        """Extract strings from the memory-mapped file, streaming them to strings.txt
+
+        Every string is written to strings.txt in file order as soon as it is
+        found; only the top most interesting ones are kept in memory, in a
+        bounded heap.
+        """
         try:
-            # Run strings command
-            result = subprocess.run(
-                ['strings', '-n', '8', filepath],  # Min length 8 characters
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-
-            if result.returncode == 0:
-                strings_list = result.stdout.split('\n')
-                strings_list = [s.strip() for s in strings_list if s.strip()]
-
-                # Save to file
-                output_file = os.path.join(output_dir, 'strings.txt')
-                with open(output_file, 'w') as f:
-                    f.write('\n'.join(strings_list))
-
-                return {
-                    'success': True,
-                    'count': len(strings_list),
-                    'strings': strings_list[:100],  # First 100 strings
-                    'output_file': 'strings.txt'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': result.stderr
-                }
+            output_file = os.path.join(output_dir, 'strings.txt')
+            count = 0
+            best = []  # Min-heap of (score, -offset, text, encoding, tags)
+            by_encoding = dict.fromkeys(self.encodings, 0)
+
+            with open(filepath, 'rb') as f, open(output_file, 'w') as out:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    data = b''  # Empty file
+
+                try:
+                    for offset, encoding, text in self._iter_strings(data):
+                        out.write(text + '\n')
+                        count += 1
+                        by_encoding[encoding] += 1
+
+                        text = text[:MAX_RANKED_LENGTH]
+                        score, tags = interest(text)
+                        entry = (score, -offset, text, encoding, tags)
+                        if len(best) < self.top:
+                            heapq.heappush(best, entry)
+                        elif entry > best[0]:
+                            heapq.heapreplace(best, entry)
+                finally:
+                    if isinstance(data, mmap.mmap):
+                        data.close()
+
+            ranked = sorted(best, reverse=True)
+            return {
+                'success': True,
+                'count': count,
+                'by_encoding': by_encoding,
+                'min_length': self.min_length,
+                'strings': [text for _, _, text, _, _ in ranked],
+                'ranked': [{'string': text, 'offset': -negative_offset, 'encoding': encoding,
+                            'score': round(score, 1), 'tags': tags}
+                           for score, negative_offset, text, encoding, tags in ranked],
+                'output_file': 'strings.txt'
+            }
 
-        except subprocess.TimeoutExpired:
-            return {'error': 'strings command timeout'}
         except Exception as e:
             return {'error': str(e)}
+
+    def _iter_strings(self, data):
+        """
+        (offset, encoding, text) of every string, in file order
+
+        Each encoding is one compiled regex scanning the whole buffer; the
+        scans are merged lazily so nothing but the current hits is held.
+        A UTF-16 string also matches the other byte order shifted by one
+        byte; of two such hits starting one byte apart, only the longer
+        decode is kept.
+        """
+        scans = []
+        for name in self.encodings:
+            character, codec = ENCODINGS[name]
+            pattern = re.compile(b'(?:' + character + b'){%d,%d}'
+                                 % (self.min_length, MAX_STRING_LENGTH))
+            scans.append(self._scan(pattern, data, name, codec))
+
+        pending = None  # UTF-16 hit held until the next hit shows it has no shifted twin
+        for hit in heapq.merge(*scans, key=lambda hit: hit[0]):
+            offset, encoding, text = hit
+            if pending is not None:
+                shifted = encoding in UTF16_ENCODINGS and encoding != pending[1]
+                if shifted and offset == pending[0] + 1:
+                    if len(text) > len(pending[2]):
+                        pending = hit
+                    continue
+                yield pending
+                pending = None
+            if encoding in UTF16_ENCODINGS:
+                pending = hit
+            else:
+                yield hit
+        if pending is not None:
+            yield pending
+
+    @staticmethod
+    def _scan(pattern, data, encoding, codec):
+        """Decoded, stripped hits of one encoding's pattern"""
+        for match in pattern.finditer(data):
+            text = match.group().decode(codec).strip()
+            if text:
+                yield match.start(), encoding, text
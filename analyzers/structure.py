@@ -0,0 +1,399 @@
+"""
+Container structure
+Walk the chunks, markers, blocks or headers of PNG, JPEG, GIF and BMP files
+
+Every parser takes a buffer (bytes, mmap...) and makes one pass over it,
+reading headers in place; only CRCs touch the chunk data, through
+memoryview slices, so nothing is copied.
+"""
+
+import re
+import struct
+import zlib
+
+# Segments listed per file, at most; the rest are only counted
+MAX_SEGMENTS = 1024
+
+# Bytes of a text keyword or APPn identifier reported
+MAX_LABEL_LENGTH = 79
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_CRITICAL = {b'IHDR', b'PLTE', b'IDAT', b'IEND'}
+# Registered ancillary chunks and widespread private ones (Apple iDOT, vpAg...)
+PNG_ANCILLARY = {
+    b'tRNS', b'cHRM', b'gAMA', b'iCCP', b'sBIT', b'sRGB', b'cICP', b'mDCv', b'cLLi',
+    b'tEXt', b'zTXt', b'iTXt', b'bKGD', b'hIST', b'pHYs', b'sPLT', b'eXIf', b'tIME',
+    b'acTL', b'fcTL', b'fdAT', b'oFFs', b'pCAL', b'sCAL', b'sTER', b'gIFg', b'gIFx',
+    b'gIFt', b'fRAc', b'dSIG', b'iDOT', b'vpAg', b'caNv', b'orNT'
+}
+PNG_TEXT = {b'tEXt', b'zTXt', b'iTXt'}
+
+# JPEG markers without a length field
+JPEG_STANDALONE = {0x01} | set(range(0xd0, 0xd8))
+JPEG_NAMES = {
+    0xc4: 'DHT', 0xc8: 'JPG', 0xcc: 'DAC', 0xd8: 'SOI', 0xd9: 'EOI', 0xda: 'SOS',
+    0xdb: 'DQT', 0xdc: 'DNL', 0xdd: 'DRI', 0xde: 'DHP', 0xdf: 'EXP', 0xfe: 'COM', 0x01: 'TEM'
+}
+JPEG_NAMES.update({marker: f'SOF{marker - 0xc0}' for marker in range(0xc0, 0xd0)
+                   if marker not in (0xc4, 0xc8, 0xcc)})
+JPEG_NAMES.update({marker: f'APP{marker - 0xe0}' for marker in range(0xe0, 0xf0)})
+JPEG_NAMES.update({marker: f'JPG{marker - 0xf0}' for marker in range(0xf0, 0xfe)})
+# Segments that may carry anything: application data and comments
+JPEG_FREEFORM = set(range(0xe0, 0xf0)) | {0xfe}
+
+# End of entropy-coded data: a marker that is neither a stuffed 0xff00 nor a restart
+JPEG_SCAN_END = re.compile(rb'\xff[^\x00\xd0-\xd7]')
+
+GIF_EXTENSIONS = {0xf9: 'Graphic Control', 0xfe: 'Comment', 0x01: 'Plain Text', 0xff: 'Application'}
+
+# BMP info header sizes by version
+BMP_HEADERS = {12: 'BITMAPCOREHEADER', 16: 'OS22XBITMAPHEADER', 40: 'BITMAPINFOHEADER',
+               52: 'BITMAPV2INFOHEADER', 56: 'BITMAPV3INFOHEADER', 64: 'OS22XBITMAPHEADER',
+               108: 'BITMAPV4HEADER', 124: 'BITMAPV5HEADER'}
+BMP_BITFIELDS = (3, 6)
+
+
+class Structure:
+    """Segments of one file as a parser walked them"""
+
+    def __init__(self, format_name, size):
+        self.format = format_name
+        self.size = size
+        self.segments = []
+        self.segment_count = 0
+        self.anomalies = []
+        # Offset just past the image; None if the structure is broken or does not say
+        self.end = None
+
+    def add(self, offset, size, kind, **fields):
+        """
+        Record a segment
+
+        fields may include 'extract' (the segment can hold a payload outside
+        the image data) plus anything reported with it.
+        """
+        self.segment_count += 1
+        if len(self.segments) < MAX_SEGMENTS:
+            segment = {'offset': offset, 'size': size, 'type': kind}
+            segment.update(fields)
+            self.segments.append(segment)
+            return segment
+        return None
+
+    def anomaly(self, kind, offset, description):
+        """Record something a clean encoder would not have written"""
+        self.anomalies.append({'kind': kind, 'offset': offset, 'description': description})
+
+    def finish(self, end):
+        """Set the image end and note any data after it"""
+        self.end = end
+        if end is not None and end < self.size:
+            self.add(end, self.size - end, 'trailing data', extract=True)
+            self.anomaly('trailing', end, f'{self.size - end} bytes after the end of the image')
+        return self
+
+
+def parse(data):
+    """
+    Structure of the image in data, by its signature
+
+    Returns:
+        Structure, or None if data is not a PNG, JPEG, GIF or BMP file
+    """
+    header = bytes(data[:8])
+    if header.startswith(PNG_SIGNATURE):
+        parser = parse_png
+    elif header.startswith(b'\xff\xd8'):
+        parser = parse_jpeg
+    elif header[:6] in (b'GIF87a', b'GIF89a'):
+        parser = parse_gif
+    elif header.startswith(b'BM'):
+        parser = parse_bmp
+    else:
+        return None
+    return parser(data)
+
+
+def _label(data, start, limit):
+    """NUL-terminated label at start, read within limit bytes"""
+    raw = bytes(data[start:start + min(limit, MAX_LABEL_LENGTH + 1)])
+    return raw.split(b'\x00', 1)[0][:MAX_LABEL_LENGTH].decode('latin-1')
+
+
+def parse_png(data):
+    """Walk the chunks: length, type, data and CRC of each, up to IEND"""
+    structure = Structure('PNG', len(data))
+    structure.add(0, 8, 'signature')
+    position = 8
+    run = None  # Consecutive IDAT chunks are listed as one segment
+
+    with memoryview(data) as view:
+        while True:
+            if position + 12 > len(data):
+                structure.anomaly('malformed', position, 'PNG ends without an IEND chunk')
+                return structure.finish(None)
+            length, kind = struct.unpack_from('>I4s', data, position)
+            end = position + 12 + length
+            if not kind.isalpha() or end > len(data):
+                structure.anomaly('malformed', position,
+                                  f'Broken chunk header at offset {position}')
+                return structure.finish(None)
+
+            name = kind.decode('ascii')
+            stored, = struct.unpack_from('>I', data, end - 4)
+            crc_ok = zlib.crc32(view[position + 4:end - 4]) == stored
+            if not crc_ok:
+                structure.anomaly('crc', position,
+                                  f'CRC mismatch in {name} chunk at offset {position}')
+
+            if kind == b'IDAT' and run is not None and run['crc_ok'] == crc_ok:
+                run['size'] += end - position
+                run['count'] += 1
+            else:
+                known = kind in PNG_CRITICAL or kind in PNG_ANCILLARY
+                fields = {'length': length, 'crc_ok': crc_ok, 'ancillary': kind[0:1].islower(),
+                          'known': known, 'extract': kind not in PNG_CRITICAL}
+                if kind in PNG_TEXT:
+                    fields['keyword'] = _label(data, position + 8, length)
+                if kind == b'IDAT':
+                    fields['count'] = 1
+                segment = structure.add(position, end - position, name, **fields)
+                run = segment if kind == b'IDAT' else None
+                if not known:
+                    structure.anomaly('unknown', position,
+                                      f'Unknown chunk {name} ({length} bytes) at offset {position}')
+
+            position = end
+            if kind == b'IEND':
+                return structure.finish(position)
+
+
+def parse_jpeg(data):
+    """Walk the marker segments and entropy-coded scans up to EOI"""
+    structure = Structure('JPEG', len(data))
+    structure.add(0, 2, 'SOI')
+    position = 2
+    size = len(data)
+    mpf = None
+
+    while position < size:
+        if data[position] != 0xff or position + 1 >= size:
+            structure.anomaly('malformed', position, f'Expected a marker at offset {position}')
+            return structure.finish(None)
+        marker = data[position + 1]
+        if marker == 0xff:
+            position += 1  # Fill byte
+            continue
+        name = JPEG_NAMES.get(marker, f'0x{marker:02X}')
+        if marker == 0xd9:
+            structure.add(position, 2, 'EOI')
+            end = position + 2
+            # MPF previews and maps follow the primary image and belong to the file
+            for offset, length in mpf_images(data, mpf) if mpf is not None else []:
+                if offset >= end:
+                    structure.add(offset, length, 'MPF image', extract=True)
+                    end = max(end, offset + length)
+            return structure.finish(end)
+        if marker in JPEG_STANDALONE:
+            structure.add(position, 2, name)
+            position += 2
+            continue
+
+        if position + 4 > size:
+            break
+        length, = struct.unpack_from('>H', data, position + 2)
+        end = position + 2 + length
+        if length < 2 or end > size:
+            structure.anomaly('malformed', position,
+                              f'{name} segment at offset {position} runs past the end')
+            return structure.finish(None)
+
+        fields = {'length': length, 'known': marker in JPEG_NAMES,
+                  'extract': marker in JPEG_FREEFORM}
+        if 0xe0 <= marker <= 0xef:
+            fields['identifier'] = _label(data, position + 4, length - 2)
+            if marker == 0xe2 and fields['identifier'] == 'MPF':
+                mpf = position
+        if marker not in JPEG_NAMES:
+            structure.anomaly('unknown', position,
+                              f'Reserved marker {name} ({length} bytes) at offset {position}')
+        structure.add(position, end - position, name, **fields)
+        position = end
+
+        if marker == 0xda:
+            match = JPEG_SCAN_END.search(data, position)
+            scan_end = match.start() if match else size
+            structure.add(position, scan_end - position, 'scan data')
+            if not match:
+                structure.anomaly('malformed', position, 'Scan data runs to the end of the file')
+                return structure.finish(None)
+            position = scan_end
+
+    structure.anomaly('malformed', position, 'JPEG ends without an EOI marker')
+    return structure.finish(None)
+
+
+def mpf_images(data, offset):
+    """
+    Images a JPEG's MPF index (APP2 'MPF' segment) lists after the primary one
+
+    Camera previews and depth or gain maps are stored after the primary
+    image's EOI, at offsets relative to the index's TIFF header.
+
+    Args:
+        offset: Offset of the APP2 marker
+
+    Returns:
+        List of (offset, size) pairs within data, empty if the index is unreadable
+    """
+    base = offset + 8  # Marker, length and 'MPF\0'
+    try:
+        order = {b'II': '<', b'MM': '>'}[bytes(data[base:base + 2])]
+        ifd, = struct.unpack_from(order + 'I', data, base + 4)
+        count, = struct.unpack_from(order + 'H', data, base + ifd)
+        for field in range(base + ifd + 2, base + ifd + 2 + 12 * count, 12):
+            tag, _, length, value = struct.unpack_from(order + 'HHII', data, field)
+            if tag == 0xb002:  # MPEntry: 16 bytes per image
+                images = []
+                for entry in range(base + value, base + value + length - 15, 16):
+                    size, start = struct.unpack_from(order + 'II', data, entry + 4)
+                    if start and base + start + size <= len(data):
+                        images.append((base + start, size))
+                return images
+    except (KeyError, struct.error):
+        pass
+    return []
+
+
+def parse_gif(data):
+    """Walk the screen descriptor, color tables, extensions and images up to the trailer"""
+    structure = Structure('GIF', len(data))
+    size = len(data)
+    try:
+        structure.add(0, 13, 'header')
+        flags = data[10]
+        position = 13
+        if flags & 0x80:
+            table = 3 << ((flags & 0x07) + 1)
+            structure.add(position, table, 'global color table')
+            position += table
+
+        frames = 0
+        while True:
+            start = position
+            block = data[position]
+            if block == 0x3b:
+                structure.add(position, 1, 'trailer')
+                return structure.finish(position + 1)
+            if block == 0x21:
+                label = data[position + 1]
+                position = _skip_sub_blocks(data, position + 2)
+                known = label in GIF_EXTENSIONS
+                name = f'{GIF_EXTENSIONS[label]} extension' if known else f'extension 0x{label:02X}'
+                fields = {'known': known, 'extract': label != 0xf9}
+                if label == 0xff:
+                    identifier = data[start + 3:start + 3 + min(11, data[start + 2])]
+                    fields['identifier'] = bytes(identifier).decode('latin-1')
+                if not known:
+                    structure.anomaly('unknown', start,
+                                      f'Unknown {name} ({position - start} bytes) '
+                                      f'at offset {start}')
+                structure.add(start, position - start, name, **fields)
+            elif block == 0x2c:
+                flags = data[position + 9]
+                position += 10
+                if flags & 0x80:
+                    position += 3 << ((flags & 0x07) + 1)
+                position = _skip_sub_blocks(data, position + 1)  # After the LZW minimum code size
+                frames += 1
+                structure.add(start, position - start, 'image', frame=frames)
+            else:
+                structure.anomaly('malformed', position,
+                                  f'Unknown GIF block 0x{block:02X} at offset {position}')
+                return structure.finish(None)
+            if position > size:
+                raise IndexError
+    except IndexError:
+        structure.anomaly('malformed', size, 'GIF ends without a trailer')
+        return structure.finish(None)
+
+
+def _skip_sub_blocks(data, position):
+    """Offset past a chain of data sub-blocks ended by an empty one"""
+    while data[position]:
+        position += data[position] + 1
+    return position + 1
+
+
+def parse_bmp(data):
+    """Read the file and info headers and lay out the palette, pixel array and ICC profile"""
+    structure = Structure('BMP', len(data))
+    size = len(data)
+    if size < 26:
+        structure.anomaly('malformed', 0, 'BMP headers are truncated')
+        return structure.finish(None)
+
+    declared_size, pixel_offset = struct.unpack_from('<I4xI', data, 2)
+    header_size, = struct.unpack_from('<I', data, 14)
+    structure.add(0, 14, 'file header', declared_size=declared_size)
+    if header_size not in BMP_HEADERS or 14 + header_size > size:
+        structure.anomaly('malformed', 14, f'Unsupported BMP info header of {header_size} bytes')
+        return structure.finish(None)
+    structure.add(14, header_size, BMP_HEADERS[header_size])
+
+    if header_size == 12:
+        width, height, _, bits = struct.unpack_from('<HHHH', data, 18)
+        compression = image_size = colors = 0
+        entry = 3
+    else:
+        width, height, _, bits, compression, image_size, _, _, colors = \
+            struct.unpack_from('<iiHHIIiiI', data, 18)
+        entry = 4
+
+    position = 14 + header_size
+    if header_size == 40 and compression in BMP_BITFIELDS:
+        masks = 12 if compression == 3 else 16
+        structure.add(position, masks, 'bit masks')
+        position += masks
+    if width <= 0 or height == 0 or bits not in (1, 2, 4, 8, 16, 24, 32) and bits:
+        structure.anomaly('malformed', 18,
+                          f'Invalid {width}x{height} image of {bits} bits per pixel')
+        return structure.finish(None)
+    if bits <= 8 or colors:
+        palette = (colors or 1 << bits) * entry
+        structure.add(position, palette, 'color table')
+        position += palette
+
+    if pixel_offset < position or pixel_offset > size:
+        structure.anomaly('malformed', 10, f'Pixel data offset {pixel_offset} is outside the file')
+        return structure.finish(None)
+    if pixel_offset > position:
+        structure.add(position, pixel_offset - position, 'gap', extract=True)
+        structure.anomaly('gap', position,
+                          f'{pixel_offset - position} unused bytes before the pixel data')
+
+    if compression not in (0,) + BMP_BITFIELDS:
+        pixel_size = image_size  # Only the header tells how long compressed data is
+    else:
+        pixel_size = ((width * bits + 31) // 32) * 4 * abs(height)
+    end = pixel_offset + pixel_size
+    if end > size:
+        structure.anomaly('malformed', pixel_offset, 'Pixel data runs past the end of the file')
+        return structure.finish(None)
+    structure.add(pixel_offset, pixel_size, 'pixel data')
+
+    if header_size == 124:
+        # V5 headers may point at an ICC profile, usually after the pixels
+        profile_offset, profile_size = struct.unpack_from('<II', data, 14 + 112)
+        profile_start = 14 + profile_offset
+        if profile_size and profile_start >= end and profile_start + profile_size <= size:
+            if profile_start > end:
+                structure.add(end, profile_start - end, 'gap', extract=True)
+                structure.anomaly('gap', end,
+                                  f'{profile_start - end} unused bytes before the ICC profile')
+            structure.add(profile_start, profile_size, 'ICC profile')
+            end = profile_start + profile_size
+
+    if declared_size and declared_size != size:
+        structure.anomaly('size', 2, f'Header declares {declared_size} bytes, the file has {size}')
+    return structure.finish(end)
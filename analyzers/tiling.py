@@ -0,0 +1,175 @@
+"""
+Strip processing
+Helpers for working through large images in row strips within a memory budget
+"""
+
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+# Bytes of output buffered before an IDAT chunk is written
+IDAT_CHUNK = 256 * 1024
+
+# PNG color types
+GRAYSCALE = 0
+TRUECOLOR = 2
+INDEXED = 3
+
+
+def strip_rows(memory_budget: int, width: int, bytes_per_pixel: int, multiple: int = 1) -> int:
+    """
+    Rows per strip so that a strip's working set stays within memory_budget
+
+    Args:
+        memory_budget: Bytes a strip may use
+        width: Image width in pixels
+        bytes_per_pixel: Working memory the caller needs per pixel of a strip
+        multiple: Round the row count down to a multiple of this (at least one multiple)
+    """
+    rows = memory_budget // max(1, width * bytes_per_pixel)
+    return max(multiple, rows // multiple * multiple)
+
+
+def iter_strips(height: int, rows: int):
+    """(top, bottom) row ranges covering height in strips of rows"""
+    for top in range(0, height, rows):
+        yield top, min(height, top + rows)
+
+
+def nearest_indices(source: int, target: int) -> np.ndarray:
+    """
+    Source index of every target index when resizing with Image.NEAREST
+
+    Computed by Pillow itself so strip-wise upscaling matches Image.resize.
+    """
+    ramp = Image.fromarray(np.arange(source, dtype=np.int32)[None, :])
+    return np.asarray(ramp.resize((target, 1), Image.NEAREST))[0]
+
+
+def _pack_rows(values: np.ndarray, bit_depth: int) -> np.ndarray:
+    """Pack rows of small integers at bit_depth bits per value, PNG style"""
+    if bit_depth == 8:
+        return values
+    per_byte = 8 // bit_depth
+    height, width = values.shape
+    padded = -width % per_byte
+    if padded:
+        values = np.pad(values, ((0, 0), (0, padded)))
+    values = values.reshape(height, -1, per_byte)
+    shifts = np.arange(8 - bit_depth, -1, -bit_depth, dtype=np.uint8)
+    return np.bitwise_or.reduce(values << shifts, axis=2).astype(np.uint8)
+
+
+class PNGStripWriter:
+    """
+    Write a PNG one strip of rows at a time
+
+    Supports modes '1', 'L', 'RGB' and 'P' (1, 2, 4 or 8 bits per pixel,
+    chosen from the palette size, as Pillow does). 8-bit rows use the 'Up'
+    filter; packed rows are unfiltered.
+    """
+
+    def __init__(self, fp, width: int, height: int, mode: str, palette=None,
+                 compress_level: int = 6):
+        self.fp = fp
+        self.previous = None
+
+        if mode == '1':
+            color_type, self.bit_depth = GRAYSCALE, 1
+        elif mode == 'L':
+            color_type, self.bit_depth = GRAYSCALE, 8
+        elif mode == 'RGB':
+            color_type, self.bit_depth = TRUECOLOR, 8
+        elif mode == 'P':
+            colors = len(palette) // 3
+            color_type = INDEXED
+            self.bit_depth = next(bits for bits in (1, 2, 4, 8) if colors <= 1 << bits)
+        else:
+            raise ValueError(f"Unsupported strip mode: {mode}")
+
+        fp.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, self.bit_depth, color_type,
+                                         0, 0, 0))
+        if mode == 'P':
+            self._chunk(b'PLTE', bytes(palette))
+
+        self.compressor = zlib.compressobj(compress_level)
+        self.pending = []
+        self.pending_size = 0
+
+    def write(self, strip: np.ndarray):
+        """Append rows: (rows, width) for '1', 'L' and 'P', (rows, width, 3) for 'RGB'"""
+        rows = strip.reshape(strip.shape[0], -1).astype(np.uint8, copy=False)
+
+        if self.bit_depth < 8:
+            data = _pack_rows(rows, self.bit_depth)
+            filter_type = 0
+        else:
+            # Up filter: difference to the row above, modulo 256
+            above = np.empty_like(rows)
+            above[0] = self.previous if self.previous is not None else 0
+            above[1:] = rows[:-1]
+            data = rows - above
+            self.previous = rows[-1].copy()
+            filter_type = 2
+
+        filtered = np.empty((data.shape[0], data.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = filter_type
+        filtered[:, 1:] = data
+        self._compressed(self.compressor.compress(filtered.tobytes()))
+
+    def close(self):
+        """Finish the image"""
+        self._compressed(self.compressor.flush())
+        self._flush_idat()
+        self._chunk(b'IEND', b'')
+
+    def _compressed(self, data: bytes):
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+            if self.pending_size >= IDAT_CHUNK:
+                self._flush_idat()
+
+    def _flush_idat(self):
+        if self.pending:
+            self._chunk(b'IDAT', b''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+
+    def _chunk(self, kind: bytes, data: bytes):
+        self.fp.write(struct.pack('>I', len(data)))
+        self.fp.write(kind)
+        self.fp.write(data)
+        self.fp.write(struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+
+class BufferedStripWriter:
+    """
+    Collect strips into one image and encode it on close
+
+    Used for formats that cannot be written incrementally; memory grows with
+    the image, so EncodingProfile.within() falls back to PNG for large ones.
+    """
+
+    def __init__(self, fp, encoding, width: int, height: int, mode: str, palette=None):
+        self.fp = fp
+        self.encoding = encoding
+        self.mode = mode
+        self.palette = palette
+        self.strips = []
+
+    def write(self, strip: np.ndarray):
+        self.strips.append(np.array(strip, dtype=bool if self.mode == '1' else np.uint8))
+
+    def close(self):
+        pixels = np.concatenate(self.strips)
+        if self.mode == 'P':
+            img = Image.fromarray(pixels, 'P')
+            img.putpalette(self.palette)
+        else:
+            img = Image.fromarray(pixels)
+        self.strips = []
+        self.encoding.write(img, self.fp)
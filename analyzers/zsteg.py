@@ -1,49 +1,219 @@
 """
 Zsteg Analyzer
 Detects LSB steganography in PNG and BMP images
+
+A native equivalent of `zsteg -a`: the bit stream of every channel
+combination, bit count, bit order and pixel order is extracted with NumPy
+and checked for text, known file signatures and zlib streams.
 """
 
-import subprocess
-import shutil
+import os
+import time
+import zlib
+
+import numpy as np
+
 from .base import BaseAnalyzer
+from .signatures import identify
+
+# Bytes at the start of every bit stream that are checked for a payload
+SCAN_BYTES = 4096
+
+# Longest bit stream written to disk when it starts with a known file type
+MAX_EXTRACT_BYTES = 4 * 1024 * 1024
+
+# Text must be this long, mostly letters/digits/spaces and not one repeated
+# character; shorter runs turn up by chance in noisy bit planes
+MIN_TEXT_LENGTH = 10
+MIN_TEXT_DISTINCT = 4
+MIN_TEXT_ALNUM = 0.8
+
+# zlib streams must end within the scanned bytes or inflate to this many bytes
+MIN_ZLIB_OUTPUT = 64
+
+# zlib headers tried per stream
+MAX_ZLIB_CANDIDATES = 16
+
+# Characters of text and decompressed data shown per payload
+PREVIEW_LENGTH = 64
+
+# Channel combinations scanned, as zsteg -a does
+CHANNEL_SETS = ['r', 'g', 'b', 'rgb', 'bgr']
+ALPHA_CHANNEL_SETS = ['a', 'rgba', 'abgr']
+
+# Pixel orders: the first letter is the axis walked first, upper case walks it backwards
+ORDERS = ['xy', 'yx', 'XY', 'YX', 'Xy', 'yX', 'xY', 'Yx']
+
+# Byte packing, named as zsteg does: 'lsb' fills each byte from its most
+# significant bit down, 'msb' from its least significant bit up
+BIT_ORDERS = ['lsb', 'msb']
+
+# Formats whose pixels are stored exactly; LSB payloads do not survive lossy encoding
+LOSSLESS_FORMATS = {'PNG', 'BMP', 'GIF', 'TIFF', 'PPM', 'WEBP', 'ICO', 'TGA'}
+
+PRINTABLE = np.zeros(256, dtype=bool)
+PRINTABLE[0x20:0x7f] = True
+PRINTABLE[[0x09, 0x0a, 0x0d]] = True
+
+ALNUM = np.zeros(256, dtype=bool)
+for _start, _end in ((0x30, 0x3a), (0x41, 0x5b), (0x61, 0x7b)):
+    ALNUM[_start:_end] = True
+ALNUM[0x20] = True
+
+# Second byte of the common zlib headers (first byte 0x78)
+ZLIB_FLAGS = [0x01, 0x5e, 0x9c, 0xda]
 
 
 class ZstegAnalyzer(BaseAnalyzer):
-    """Analyze images using zsteg"""
-
-    def is_available(self) -> bool:
-        """Check if zsteg is installed"""
-        return shutil.which('zsteg') is not None
-
-    def analyze(self, filepath: str, output_dir: str) -> dict:
-        """Run zsteg analysis"""
-        if not self.is_available():
-            return {'error': 'zsteg not installed (requires Ruby: gem install zsteg)'}
-
-        try:
-            # Run zsteg with all analysis modes
-            result = subprocess.run(
-                ['zsteg', '-a', filepath],
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-
-            output_lines = result.stdout.split('\n')
-            findings = []
-
-            for line in output_lines:
-                line = line.strip()
-                if line and not line.startswith('['):
-                    findings.append(line)
-
-            return {
-                'success': True,
-                'findings': findings,
-                'raw_output': result.stdout
-            }
-
-        except subprocess.TimeoutExpired:
-            return {'error': 'zsteg timeout'}
-        except Exception as e:
-            return {'error': str(e)}
+    """Scan LSB bit streams for hidden payloads, like zsteg -a"""
+
+    executor = 'process'
+    version = '2'
+
+    def analyze(self, filepath: str, output_dir: str, context=None) -> dict:
+        """Extract every bit stream zsteg -a would and report the payloads found"""
+        context = self.get_context(filepath, context)
+        if context.format not in LOSSLESS_FORMATS:
+            return {'error': f'LSB payloads do not survive {context.format} compression - skipped',
+                    'skipped': True}
+
+        start = time.monotonic()
+        planes = self._channel_planes(context)
+        channel_sets = CHANNEL_SETS + (ALPHA_CHANNEL_SETS if 'a' in planes else [])
+
+        payloads = []
+        streams = 0
+        # Enough pixels for SCAN_BYTES of the slowest stream (one bit of one channel)
+        prefix = SCAN_BYTES * 8
+
+        for order in ORDERS:
+            sequences = self._pixel_sequences(planes, order, prefix)
+            for channels in channel_sets:
+                for bits in range(1, 9):
+                    for bit_order in BIT_ORDERS:
+                        data = self._bit_stream(sequences, channels, bits, bit_order, SCAN_BYTES)
+                        streams += 1
+                        payload = self._inspect(data)
+                        if payload:
+                            payload.update({
+                                'config': f'b{bits},{channels},{bit_order},{order}',
+                                'channels': channels,
+                                'bits': bits,
+                                'bit_order': bit_order,
+                                'order': order
+                            })
+                            payloads.append(payload)
+
+        payloads.sort(key=self._rank)
+
+        # Keep whole streams that start with a known file type
+        for payload in payloads:
+            if payload['type'] == 'file':
+                payload['extracted_file'] = self._extract(planes, payload, output_dir)
+
+        return {
+            'success': True,
+            'findings': [self._describe(payload) for payload in payloads],
+            'payloads': payloads,
+            'streams_scanned': streams,
+            'scan_bytes': SCAN_BYTES,
+            'elapsed_seconds': round(time.monotonic() - start, 3)
+        }
+
+    def _channel_planes(self, context):
+        """(height, width) value planes by channel letter; 'a' only if the image has alpha"""
+        pixels = context.pixels
+        planes = {'r': pixels[:, :, 0], 'g': pixels[:, :, 1], 'b': pixels[:, :, 2]}
+        image = context.image
+        if 'A' in image.getbands():
+            planes['a'] = np.asarray(image.getchannel('A'))
+        return planes
+
+    def _pixel_sequences(self, planes, order, count):
+        """First count values of every channel plane, walked in the given pixel order"""
+        inner, outer = order
+        sequences = {}
+        for name, plane in planes.items():
+            # Rows of the view are walked one after another, each from left to right
+            view = plane.T if inner.lower() == 'y' else plane
+            if inner.isupper():
+                view = view[:, ::-1]
+            if outer.isupper():
+                view = view[::-1]
+            lines = -(-count // view.shape[1])
+            sequences[name] = view[:lines].ravel()[:count]
+        return sequences
+
+    def _bit_stream(self, sequences, channels, bits, bit_order, size):
+        """
+        Pack the low bits of the channels into up to size bytes
+
+        Pixel by pixel and channel by channel, the selected bits of each value
+        are taken from the highest to the lowest.
+        """
+        pixels = -(-size * 8 // (len(channels) * bits))
+        values = np.stack([sequences[channel][:pixels] for channel in channels], axis=1)
+        shifts = np.arange(bits - 1, -1, -1, dtype=np.uint8)
+        stream = (values[:, :, None] >> shifts) & 1
+        packing = 'big' if bit_order == 'lsb' else 'little'
+        return np.packbits(stream.ravel(), bitorder=packing)[:size].tobytes()
+
+    def _inspect(self, data):
+        """The payload a bit stream starts with, or None"""
+        file_type = identify(data)
+        if file_type:
+            return {'type': 'file', 'description': file_type}
+
+        values = np.frombuffer(data, dtype=np.uint8)
+        non_printable = np.flatnonzero(~PRINTABLE[values])
+        length = int(non_printable[0]) if len(non_printable) else len(values)
+        if length >= MIN_TEXT_LENGTH:
+            text = values[:length]
+            if len(np.unique(text)) >= MIN_TEXT_DISTINCT and ALNUM[text].mean() >= MIN_TEXT_ALNUM:
+                return {'type': 'text', 'length': length,
+                        'text': data[:min(length, PREVIEW_LENGTH)].decode('ascii')}
+
+        # zlib streams may follow a header or length field
+        headers = np.flatnonzero((values[:-1] == 0x78) & np.isin(values[1:], ZLIB_FLAGS))
+        for offset in headers[:MAX_ZLIB_CANDIDATES].tolist():
+            inflater = zlib.decompressobj()
+            try:
+                output = inflater.decompress(data[offset:], MAX_EXTRACT_BYTES)
+            except zlib.error:
+                continue
+            if output and (inflater.eof or len(output) >= MIN_ZLIB_OUTPUT):
+                return {'type': 'zlib', 'offset': offset, 'size': len(output),
+                        'complete': inflater.eof,
+                        'preview': output[:PREVIEW_LENGTH].decode('latin-1')}
+
+        return None
+
+    def _rank(self, payload):
+        """Sort key: files, then zlib streams, then the longest text first"""
+        kind = ['file', 'zlib', 'text'].index(payload['type'])
+        return kind, -payload.get('length', 0)
+
+    def _describe(self, payload):
+        """One zsteg-style output line for a payload"""
+        if payload['type'] == 'file':
+            detail = f"file: {payload['description']}"
+        elif payload['type'] == 'zlib':
+            detail = (f"zlib: data={payload['preview']!r}, offset={payload['offset']}, "
+                      f"size={payload['size']}")
+        else:
+            detail = f"text: {payload['text']!r}"
+        return f"{payload['config']:<20} .. {detail}"
+
+    def _extract(self, planes, payload, output_dir):
+        """Write the bit stream of a payload to a file, up to MAX_EXTRACT_BYTES"""
+        height, width = planes['r'].shape
+        channels, bits = payload['channels'], payload['bits']
+        size = min(MAX_EXTRACT_BYTES, height * width * len(channels) * bits // 8)
+        pixels = -(-size * 8 // (len(channels) * bits))
+        sequences = self._pixel_sequences(planes, payload['order'], pixels)
+        data = self._bit_stream(sequences, channels, bits, payload['bit_order'], size)
+
+        filename = f"zsteg_{payload['config'].replace(',', '_')}.bin"
+        with open(os.path.join(output_dir, filename), 'wb') as f:
+            f.write(data)
+        return filename
@@ -5,18 +5,32 @@ Main application entry point
 """
 
 import os
-from flask import Flask, render_template, request, jsonify, send_file
+import shutil
+from flask import Flask, Response, render_template, request, jsonify, send_file, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import redis
 from rq import Queue
 import uuid
+import tarfile
+import tempfile
+import time
+import zipfile
+from datetime import datetime
 from pathlib import Path
 
+import config
+from cache import ResultCache, make_cache_key, path_sha256
+from analyzers.bitplanes import PLANE_FILENAME, PLANES_FILE, render_plane
+from upload_stream import StreamingRequest, iter_archive, spool, validate_image
+
 # Initialize Flask app
 app = Flask(__name__)
+# Uploads are written to disk, hashed and sniffed while they arrive
+app.request_class = StreamingRequest
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+app.config['MAX_BATCH_CONTENT_LENGTH'] = config.MAX_BATCH_CONTENT_LENGTH
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['RESULTS_FOLDER'] = 'results'
 
@@ -42,14 +56,112 @@ def get_redis_connection():
             task_queue = None
     return redis_conn, task_queue
 
+
+def get_result_cache(redis_conn):
+    """Result cache over the results folder"""
+    return ResultCache(redis_conn, app.config['RESULTS_FOLDER'], config.RESULT_CACHE_MAX_BYTES)
+
 # Ensure directories exist
 Path(app.config['UPLOAD_FOLDER']).mkdir(exist_ok=True)
 Path(app.config['RESULTS_FOLDER']).mkdir(exist_ok=True)
 
+# Seconds between keep-alive comments on idle progress streams
+STREAM_KEEPALIVE = 15
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'tif', 'jfif'}
 
 
+def get_wordlist(params):
+    """
+    Steghide wordlist of a request: an uploaded 'steghide_wordlist' file or a
+    server-side list named by 'steghide_wordlist_name'
+
+    Returns:
+        (uploaded FileStorage or None, server-side path or None,
+         sha256 of the list or None, error message or None)
+    """
+    uploaded = request.files.get('steghide_wordlist')
+    if uploaded and uploaded.filename:
+        return uploaded, None, uploaded.stream.sha256(), None
+
+    name = params.get('steghide_wordlist_name')
+    if name:
+        path = os.path.join(config.WORDLISTS_FOLDER, secure_filename(name))
+        if not os.path.isfile(path):
+            return None, None, None, f'Wordlist not found: {name}'
+        return None, path, path_sha256(path), None
+
+    return None, None, None, None
+
+
+def get_steghide_passwords(form):
+    """Custom steghide passwords of a form, given as a JSON list"""
+    steghide_passwords = None
+    if 'steghide_passwords' in form:
+        try:
+            import json
+            steghide_passwords = json.loads(form['steghide_passwords'])
+        except:
+            pass
+    return steghide_passwords
+
+
+def get_profile(form, default):
+    """
+    Analysis profile of a form ('full' or 'triage'), given as 'profile'
+
+    Returns:
+        (profile or None, error message or None)
+    """
+    from workers.triage import PROFILES
+
+    profile = (form.get('profile') or default).lower()
+    if profile not in PROFILES:
+        return None, f"Unknown profile: {profile} (expected {' or '.join(PROFILES)})"
+    return profile, None
+
+
+def save_wordlist(uploaded, analysis_id):
+    """Move an uploaded wordlist into place in the upload folder"""
+    # Not prefixed with the analysis id, which marks the uploaded image
+    path = os.path.join(app.config['UPLOAD_FOLDER'], f"wordlist_{analysis_id}.txt")
+    uploaded.stream.persist(path)
+    return path
+
+
+def batch_file(batch_id):
+    """Path of the manifest listing the analyses of a batch"""
+    return os.path.join(app.config['RESULTS_FOLDER'], f"batch_{secure_filename(batch_id)}.json")
+
+
+def stored_status(analysis_id):
+    """
+    Status of an analysis according to its results file
+
+    Returns:
+        Status dict like the one kept in Redis, or None without a results file
+    """
+    result_file = os.path.join(app.config['RESULTS_FOLDER'], f"{secure_filename(analysis_id)}.json")
+    if not os.path.exists(result_file):
+        return None
+
+    import json
+    with open(result_file, 'r') as f:
+        results = json.load(f)
+
+    finished = list(results.get('results', {}))
+    if results.get('status') == 'completed':
+        return {'status': 'completed', 'progress': 100, 'analyzers': finished}
+
+    total = len(finished) + len(results.get('pending', []))
+    return {
+        'status': results.get('status', 'processing'),
+        'progress': int((len(finished) / total) * 100) if total else 0,
+        'analyzers': finished
+    }
+
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and \
@@ -81,30 +193,69 @@ def upload_file():
     if task_queue is None:
         return jsonify({'error': 'Job queue unavailable. Please check Redis connection.'}), 503
 
+    filename = secure_filename(file.filename)
+
+    # Reject non-images before anything is queued
+    error = validate_image(file.stream)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Get custom passwords for steghide
+    steghide_passwords = get_steghide_passwords(request.form)
+
+    # Get wordlist for a steghide dictionary attack
+    wordlist_upload, wordlist_path, wordlist_sha256, error = get_wordlist(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+
+    profile, error = get_profile(request.form, config.ANALYSIS_PROFILE)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Reuse the results of an identical earlier upload
+    cache_key = None
+    if config.ENABLE_RESULT_CACHE:
+        from workers.analyzer import analyzer_versions, job_options
+
+        # Hashed while the upload was received
+        cache_key = make_cache_key(file.stream.sha256(), analyzer_versions(),
+                                   job_options(steghide_passwords, wordlist_sha256, profile))
+
+        cached_id = get_result_cache(redis_conn).lookup(cache_key)
+        if cached_id:
+            return jsonify({
+                'analysis_id': cached_id,
+                'job_id': None,
+                'filename': filename,
+                'status': 'completed',
+                'cached': True
+            })
+
     # Generate unique ID for this analysis
     analysis_id = str(uuid.uuid4())
 
-    # Save uploaded file
-    filename = secure_filename(file.filename)
+    # Move the spooled upload into place
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{analysis_id}_{filename}")
-    file.save(filepath)
+    file.stream.persist(filepath)
 
-    # Get custom passwords for steghide
-    steghide_passwords = None
-    if 'steghide_passwords' in request.form:
-        try:
-            import json
-            steghide_passwords = json.loads(request.form['steghide_passwords'])
-        except:
-            pass
+    if wordlist_upload:
+        wordlist_path = save_wordlist(wordlist_upload, analysis_id)
 
     # Queue analysis job
     try:
+        # Known as queued before a worker picks it up, so status checks and
+        # progress streams find it; written first so it never overwrites the worker's
+        from workers.analyzer import update_status
+        update_status(redis_conn, analysis_id, 'queued', 0)
+
         job = task_queue.enqueue(
             'workers.analyze_image',
             filepath,
             analysis_id,
             steghide_passwords,
+            cache_key,
+            wordlist_path,
+            profile,
             job_timeout='10m'
         )
 
@@ -112,12 +263,295 @@ def upload_file():
             'analysis_id': analysis_id,
             'job_id': job.id,
             'filename': filename,
+            'status': 'queued',
+            'cached': False
+        })
+    except Exception as e:
+        return jsonify({'error': f'Failed to queue job: {str(e)}'}), 500
+
+
+@app.route('/api/batch', methods=['POST'])
+def upload_batch():
+    """Queue analysis of many images: a zip/tar 'archive' and/or several 'files'"""
+    archive = request.files.get('archive')
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if archive and not archive.filename:
+        archive = None
+    if not files and not archive:
+        return jsonify({'error': 'No files provided'}), 400
+
+    redis_conn, task_queue = get_redis_connection()
+    if task_queue is None:
+        return jsonify({'error': 'Job queue unavailable. Please check Redis connection.'}), 503
+
+    steghide_passwords = get_steghide_passwords(request.form)
+    wordlist_upload, wordlist_path, wordlist_sha256, error = get_wordlist(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+
+    # Bulk screening defaults to the fast triage profile
+    profile, error = get_profile(request.form, config.BATCH_ANALYSIS_PROFILE)
+    if error:
+        return jsonify({'error': error}), 400
+
+    from workers.analyzer import analyzer_versions, job_options
+    versions = analyzer_versions()
+    options = job_options(steghide_passwords, wordlist_sha256, profile)
+    cache = get_result_cache(redis_conn) if config.ENABLE_RESULT_CACHE else None
+
+    batch_id = str(uuid.uuid4())
+    if wordlist_upload:
+        wordlist_path = save_wordlist(wordlist_upload, batch_id)
+
+    items = []
+    rejected = []
+    job_datas = []
+    queued_ids = {}  # cache key -> analysis id, for duplicates within the batch
+
+    def add(name, upload):
+        """Validate one image and queue it unless its results already exist"""
+        filename = secure_filename(os.path.basename(name))
+        if not allowed_file(filename):
+            error = 'File type not allowed'
+        else:
+            error = validate_image(upload)
+        if error:
+            upload.close()
+            rejected.append({'filename': name, 'error': error})
+            return
+
+        cache_key = make_cache_key(upload.sha256(), versions, options)
+        if cache_key in queued_ids:
+            # Same image earlier in this batch: share its analysis
+            upload.close()
+            items.append({'analysis_id': queued_ids[cache_key], 'filename': filename,
+                          'cached': False})
+            return
+        cached_id = cache.lookup(cache_key) if cache else None
+        if cached_id:
+            upload.close()
+            items.append({'analysis_id': cached_id, 'filename': filename, 'cached': True})
+            return
+
+        analysis_id = str(uuid.uuid4())
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{analysis_id}_{filename}")
+        upload.persist(filepath)
+        queued_ids[cache_key] = analysis_id
+        job_datas.append(Queue.prepare_data(
+            'workers.analyze_image',
+            (filepath, analysis_id, steghide_passwords, cache_key if cache else None, wordlist_path,
+             profile),
+            timeout='10m'
+        ))
+        items.append({'analysis_id': analysis_id, 'filename': filename, 'cached': False})
+
+    truncated = False
+    for file in files:
+        if len(items) + len(rejected) >= config.MAX_BATCH_FILES:
+            truncated = True
+            break
+        add(file.filename, file.stream)
+
+    if archive and not truncated:
+        try:
+            for name, member in iter_archive(archive.stream.path):
+                if len(items) + len(rejected) >= config.MAX_BATCH_FILES:
+                    truncated = True
+                    break
+                # Members are streamed to disk one at a time, never extracted wholesale
+                try:
+                    upload = spool(member, app.config['UPLOAD_FOLDER'],
+                                   app.config['MAX_CONTENT_LENGTH'])
+                except ValueError as e:
+                    rejected.append({'filename': name, 'error': f'File too large: {e}'})
+                    continue
+                add(name, upload)
+        except (ValueError, OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+            rejected.append({'filename': archive.filename, 'error': f'Invalid archive: {e}'})
+
+    # Mark every job queued, then queue them, in one pipelined round-trip each
+    from workers.analyzer import update_status
+    pipe = redis_conn.pipeline(transaction=False)
+    for analysis_id in queued_ids.values():
+        update_status(redis_conn, analysis_id, 'queued', 0, pipe=pipe)
+    try:
+        pipe.execute()
+        jobs = task_queue.enqueue_many(job_datas) if job_datas else []
+    except Exception as e:
+        return jsonify({'error': f'Failed to queue jobs: {str(e)}'}), 500
+
+    batch = {
+        'batch_id': batch_id,
+        'timestamp': datetime.utcnow().isoformat(),
+        'items': items,
+        'rejected': rejected,
+        'truncated': truncated
+    }
+    import json
+    with open(batch_file(batch_id), 'w') as f:
+        json.dump(batch, f, indent=2)
+
+    return jsonify({
+        'batch_id': batch_id,
+        'total': len(items),
+        'queued': len(jobs),
+        'cached': sum(1 for item in items if item['cached']),
+        'rejected': rejected,
+        'truncated': truncated,
+        'items': items
+    })
+
+
+@app.route('/api/batch/<batch_id>', methods=['GET'])
+def check_batch_status(batch_id):
+    """Aggregated status of every image of a batch"""
+    path = batch_file(batch_id)
+    if not os.path.exists(path):
+        return jsonify({'error': 'Batch not found'}), 404
+
+    redis_conn, _ = get_redis_connection()
+    if redis_conn is None:
+        return jsonify({'error': 'Redis unavailable'}), 503
+
+    import json
+    with open(path, 'r') as f:
+        batch = json.load(f)
+
+    # Fetch the status of every job in a single round-trip
+    items = batch['items']
+    keys = [f"stegmage:job:{item['analysis_id']}" for item in items]
+    job_data = redis_conn.mget(keys) if items else []
+
+    counts = {'queued': 0, 'processing': 0, 'completed': 0}
+    for item, data in zip(items, job_data):
+        if data:
+            job_info = json.loads(data)
+        elif item['cached']:
+            job_info = {'status': 'completed', 'progress': 100}
+        else:
+            # No results file yet: not picked up by a worker
+            job_info = stored_status(item['analysis_id']) or {'status': 'queued', 'progress': 0}
+        item['status'] = job_info['status']
+        item['progress'] = job_info['progress']
+        counts[item['status']] = counts.get(item['status'], 0) + 1
+
+    if not items or counts['completed'] == len(items):
+        status = 'completed'
+    elif counts['queued'] == len(items):
+        status = 'queued'
+    else:
+        status = 'processing'
+
+    return jsonify({
+        'batch_id': batch_id,
+        'status': status,
+        'progress': int(sum(item['progress'] for item in items) / len(items)) if items else 100,
+        'total': len(items),
+        'counts': counts,
+        'rejected': batch['rejected'],
+        'items': items
+    })
+
+
+@app.route('/api/reanalyze/<analysis_id>', methods=['POST'])
+def reanalyze(analysis_id):
+    """Re-run selected analyzers of an existing analysis"""
+    from workers.analyzer import get_analyzers
+
+    result_file = os.path.join(app.config['RESULTS_FOLDER'], f"{secure_filename(analysis_id)}.json")
+    if not os.path.exists(result_file):
+        return jsonify({'error': 'Results not found'}), 404
+
+    params = request.get_json(silent=True) or request.form
+    analyzer_names = params.get('analyzers')
+    steghide_passwords = params.get('steghide_passwords')
+    try:
+        import json
+        if isinstance(analyzer_names, str):
+            analyzer_names = json.loads(analyzer_names)
+        if isinstance(steghide_passwords, str):
+            steghide_passwords = json.loads(steghide_passwords)
+    except ValueError:
+        return jsonify({'error': 'Invalid JSON in request'}), 400
+
+    wordlist_upload, wordlist_path, _, error = get_wordlist(params)
+    if error:
+        return jsonify({'error': error}), 400
+
+    known = [name for name, _ in get_analyzers()]
+    if not analyzer_names or not isinstance(analyzer_names, list):
+        return jsonify({'error': 'No analyzers selected', 'available': known}), 400
+    unknown = [name for name in analyzer_names if name not in known]
+    if unknown:
+        return jsonify({'error': f"Unknown analyzers: {', '.join(map(str, unknown))}",
+                        'available': known}), 400
+
+    # Find the uploaded image
+    source_path = None
+    for filename in os.listdir(app.config['UPLOAD_FOLDER']):
+        if filename.startswith(analysis_id):
+            source_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            break
+    if source_path is None:
+        return jsonify({'error': 'Image not found'}), 404
+
+    redis_conn, task_queue = get_redis_connection()
+    if task_queue is None:
+        return jsonify({'error': 'Job queue unavailable. Please check Redis connection.'}), 503
+
+    # Cached analyses are shared by every uploader of the image: re-run on a
+    # copy under a new id and leave the original untouched
+    new_id = str(uuid.uuid4())
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'],
+                            f"{new_id}_{filename[len(analysis_id) + 1:]}")
+    try:
+        os.link(source_path, filepath)
+    except OSError:
+        shutil.copy2(source_path, filepath)
+
+    if wordlist_upload:
+        wordlist_path = save_wordlist(wordlist_upload, new_id)
+
+    try:
+        from workers.analyzer import update_status
+        update_status(redis_conn, new_id, 'queued', 0)
+
+        job = task_queue.enqueue(
+            'workers.reanalyze_image',
+            filepath,
+            analysis_id,
+            new_id,
+            analyzer_names,
+            steghide_passwords,
+            wordlist_path,
+            job_timeout='10m'
+        )
+
+        return jsonify({
+            'analysis_id': new_id,
+            'source_analysis_id': analysis_id,
+            'job_id': job.id,
+            'analyzers': analyzer_names,
             'status': 'queued'
         })
     except Exception as e:
         return jsonify({'error': f'Failed to queue job: {str(e)}'}), 500
 
 
+@app.route('/api/wordlists', methods=['GET'])
+def list_wordlists():
+    """List server-side wordlists usable for steghide dictionary attacks"""
+    folder = config.WORDLISTS_FOLDER
+    wordlists = []
+    if os.path.isdir(folder):
+        for filename in sorted(os.listdir(folder)):
+            path = os.path.join(folder, filename)
+            if os.path.isfile(path):
+                wordlists.append({'name': filename, 'size': os.path.getsize(path)})
+
+    return jsonify({'wordlists': wordlists})
+
+
 @app.route('/api/status/<analysis_id>', methods=['GET'])
 def check_status(analysis_id):
     """Check analysis status"""
@@ -130,6 +564,10 @@ def check_status(analysis_id):
     job_data = redis_conn.get(job_key)
 
     if not job_data:
+        # Status keys expire; cached analyses are still on disk
+        job_info = stored_status(analysis_id)
+        if job_info:
+            return jsonify(job_info)
         return jsonify({'error': 'Analysis not found'}), 404
 
     import json
@@ -138,6 +576,54 @@ def check_status(analysis_id):
     return jsonify(job_info)
 
 
+@app.route('/api/events/<analysis_id>', methods=['GET'])
+def stream_status(analysis_id):
+    """Push status updates and analyzer completion events as server-sent events"""
+    redis_conn, _ = get_redis_connection()
+    if redis_conn is None:
+        return jsonify({'error': 'Redis unavailable'}), 503
+
+    # Subscribe before reading the current status so no update falls in between
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(f"stegmage:progress:{analysis_id}")
+    job_data = redis_conn.get(f"stegmage:job:{analysis_id}")
+    job_info = None if job_data else stored_status(analysis_id)
+
+    if not job_data and not job_info:
+        pubsub.close()
+        return jsonify({'error': 'Analysis not found'}), 404
+
+    import json
+
+    def generate():
+        try:
+            # Current status first, so late subscribers start in sync
+            if job_data:
+                data = job_data.decode() if isinstance(job_data, bytes) else job_data
+            else:
+                data = json.dumps(job_info)
+            yield f"data: {data}\n\n"
+            if json.loads(data)['status'] in ('completed', 'failed'):
+                return
+
+            deadline = time.monotonic() + config.ANALYSIS_TIMEOUT
+            while time.monotonic() < deadline:
+                message = pubsub.get_message(timeout=STREAM_KEEPALIVE)
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                data = message['data']
+                data = data.decode() if isinstance(data, bytes) else data
+                yield f"data: {data}\n\n"
+                if json.loads(data)['status'] in ('completed', 'failed'):
+                    return
+        finally:
+            pubsub.close()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 @app.route('/api/results/<analysis_id>', methods=['GET'])
 def get_results(analysis_id):
     """Get analysis results"""
@@ -150,20 +636,69 @@ def get_results(analysis_id):
     with open(result_file, 'r') as f:
         results = json.load(f)
 
+    # Analyzers still running; empty once the analysis is complete
+    results.setdefault('pending', [])
+
     return jsonify(results)
 
 
+def lazy_plane(analysis_id, filename):
+    """
+    Path of a bit plane PNG, rendering it from packed planes on first access
+
+    Returns:
+        Path of the PNG, or None if it neither exists nor can be rendered
+    """
+    results_dir = os.path.join(app.config['RESULTS_FOLDER'], secure_filename(analysis_id))
+    filepath = os.path.join(results_dir, secure_filename(filename))
+    if os.path.exists(filepath):
+        return filepath
+
+    planes_path = os.path.join(results_dir, PLANES_FILE)
+    if not os.path.exists(planes_path):
+        return None
+    from workers.analyzer import artifact_encoding
+    encoding = artifact_encoding()
+    img = render_plane(planes_path, secure_filename(filename), encoding.bilevel_planes)
+    if img is None:
+        return None
+
+    # Cache the rendering; concurrent first requests each write their own temp file
+    extension = os.path.splitext(filepath)[1]
+    fd, tmp_path = tempfile.mkstemp(dir=results_dir, suffix=extension + '.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        encoding.write(img, f, extension)
+    os.replace(tmp_path, filepath)
+    return filepath
+
+
 @app.route('/api/download/<analysis_id>/<filename>', methods=['GET'])
 def download_file(analysis_id, filename):
     """Download extracted or generated files"""
     filepath = os.path.join(app.config['RESULTS_FOLDER'], analysis_id, secure_filename(filename))
 
     if not os.path.exists(filepath):
-        return jsonify({'error': 'File not found'}), 404
+        # Bit planes of lazily rendered analyses
+        filepath = lazy_plane(analysis_id, filename)
+        if filepath is None:
+            return jsonify({'error': 'File not found'}), 404
 
     return send_file(filepath, as_attachment=True)
 
 
+@app.route('/api/planes/<analysis_id>/<filename>', methods=['GET'])
+def serve_plane(analysis_id, filename):
+    """Serve a bit plane image, rendering and caching it on first access"""
+    if not PLANE_FILENAME.match(filename):
+        return jsonify({'error': 'Not a bit plane image'}), 404
+
+    filepath = lazy_plane(analysis_id, filename)
+    if filepath is None:
+        return jsonify({'error': 'File not found'}), 404
+
+    return send_file(filepath)
+
+
 @app.route('/api/image/<analysis_id>', methods=['GET'])
 def serve_image(analysis_id):
     """Serve the uploaded image for reverse image search"""
@@ -253,17 +788,20 @@ def health():
     redis_conn, _ = get_redis_connection()
 
     redis_status = 'disconnected'
+    cache_stats = None
     if redis_conn is not None:
         try:
             redis_conn.ping()
             redis_status = 'connected'
+            cache_stats = get_result_cache(redis_conn).stats()
         except Exception:
             redis_status = 'error'
 
     return jsonify({
         'status': 'healthy',
         'redis': redis_status,
-        'app': 'running'
+        'app': 'running',
+        'cache': cache_stats
     })
 
 
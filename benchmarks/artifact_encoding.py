@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Artifact encoding benchmark
+Encode time and size of every generated image type under each encoding profile
+
+Usage:
+    python benchmarks/artifact_encoding.py [--megapixels 4] [--profiles default png-fast-bilevel]
+
+The analyzers that write images (LSB, color analysis, entropy, forensics) are
+run on a photo-like image once per profile; only the time spent inside the
+encoder is counted.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzers.color_analysis import ColorAnalyzer  # noqa: E402
+from analyzers.context import ImageContext  # noqa: E402
+from analyzers.encoding import EncodingProfile  # noqa: E402
+from analyzers.entropy import EntropyAnalyzer  # noqa: E402
+from analyzers.forensics import ForensicsAnalyzer  # noqa: E402
+from analyzers.lsb import LSBAnalyzer  # noqa: E402
+from benchmarks.lsb_bitplanes import make_image  # noqa: E402
+
+PROFILES = {
+    'default': {},
+    'png-fast': {'compress_level': 1},
+    'png-bilevel': {'bilevel_planes': True},
+    'png-fast-bilevel': {'compress_level': 1, 'bilevel_planes': True},
+    'webp-lossless': {'format': 'webp', 'bilevel_planes': True, 'quality': 0},
+    'webp-lossy': {'format': 'webp', 'lossless': False, 'quality': 80},
+}
+
+
+def artifact_type(stem):
+    """Group artifact file names into types"""
+    if stem.startswith('lsb_composite'):
+        return 'composite plane'
+    if stem.startswith('lsb_'):
+        return 'gray plane' if stem.endswith('_gray') else 'color plane'
+    if stem.startswith('histogram_'):
+        return 'histogram'
+    return stem
+
+
+class TimedProfile(EncodingProfile):
+    """Encoding profile that records encode time and bytes per artifact type"""
+
+    def __init__(self, **settings):
+        super().__init__(**settings)
+        self.seconds = defaultdict(float)
+        self.bytes = defaultdict(int)
+        self.count = defaultdict(int)
+
+    def save(self, img, output_dir, stem):
+        start = time.perf_counter()
+        filename = super().save(img, output_dir, stem)
+        kind = artifact_type(stem)
+        self.seconds[kind] += time.perf_counter() - start
+        self.bytes[kind] += os.path.getsize(os.path.join(output_dir, filename))
+        self.count[kind] += 1
+        return filename
+
+    @contextmanager
+    def strip_writer(self, output_dir, stem, width, height, mode, palette=None):
+        kind = artifact_type(stem)
+        start = time.perf_counter()
+        with super().strip_writer(output_dir, stem, width, height, mode, palette) as writer:
+            self.seconds[kind] += time.perf_counter() - start
+            yield TimedWriter(writer, self.seconds, kind)
+            start = time.perf_counter()
+        self.seconds[kind] += time.perf_counter() - start
+        self.bytes[kind] += os.path.getsize(os.path.join(output_dir, self.filename(stem)))
+        self.count[kind] += 1
+
+
+class TimedWriter:
+    """Strip writer wrapper adding the time spent encoding strips to seconds[kind]"""
+
+    def __init__(self, writer, seconds, kind):
+        self.writer = writer
+        self.seconds = seconds
+        self.kind = kind
+
+    def write(self, strip):
+        start = time.perf_counter()
+        self.writer.write(strip)
+        self.seconds[self.kind] += time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=4, help='Image size in megapixels')
+    parser.add_argument('--profiles', nargs='+', choices=list(PROFILES), default=list(PROFILES),
+                        help='Profiles to compare')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path, width, height = make_image(args.megapixels, tmp)
+        context = ImageContext(path)
+        print(f"{width}x{height} ({args.megapixels:g}MP)\n")
+        print(f"{'profile':<18} {'artifact':<16} {'files':>5} {'encode (s)':>10} {'bytes':>14}")
+
+        for name in args.profiles:
+            profile = TimedProfile(**PROFILES[name])
+            output_dir = os.path.join(tmp, name)
+            os.makedirs(output_dir)
+
+            analyzers = (LSBAnalyzer(), ColorAnalyzer(), EntropyAnalyzer(), ForensicsAnalyzer())
+            for analyzer in analyzers:
+                analyzer.encoding = profile
+                analyzer.analyze(path, output_dir, context=context)
+
+            for kind in sorted(profile.count):
+                print(f"{name:<18} {kind:<16} {profile.count[kind]:>5} "
+                      f"{profile.seconds[kind]:>10.2f} {profile.bytes[kind]:>14,}")
+            print(f"{name:<18} {'total':<16} {sum(profile.count.values()):>5} "
+                  f"{sum(profile.seconds.values()):>10.2f} {sum(profile.bytes.values()):>14,}\n")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+LSB bit-plane benchmark
+Compares the NumPy bit-plane engine against the original per-pixel loops
+
+Usage:
+    python benchmarks/lsb_bitplanes.py [--sizes 1 12 48] [--legacy-max-mp 1]
+
+"planes" is the NumPy engine alone, "numpy" adds the PNG encoding that
+LSBAnalyzer does for all 56 artifacts. The per-pixel reference is linear in
+pixel count, so above --legacy-max-mp its time is extrapolated from the
+largest size it was actually run on.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analyzers.bitplanes import (  # noqa: E402
+    CHANNELS, CHANNEL_COLORS, to_rgb_array, bit_plane, gray_plane, color_plane, composite_plane
+)
+from analyzers.lsb import LSBAnalyzer  # noqa: E402
+
+
+def legacy_bit_planes(filepath, output_dir):
+    """Original nested-loop implementation, kept as the reference"""
+    img = Image.open(filepath).convert('RGB')
+    width, height = img.size
+    pixels = img.load()
+    color_maps = {'R': (255, 0, 0), 'G': (0, 255, 0), 'B': (0, 0, 255)}
+
+    for channel_idx, channel_name in enumerate(['R', 'G', 'B']):
+        for bit in range(8):
+            gray = Image.new('L', (width, height))
+            gray_pixels = gray.load()
+            color = Image.new('RGB', (width, height))
+            color_pixels = color.load()
+            base_color = color_maps[channel_name]
+
+            for y in range(height):
+                for x in range(width):
+                    bit_value = (pixels[x, y][channel_idx] >> bit) & 1
+                    gray_pixels[x, y] = bit_value * 255
+                    color_pixels[x, y] = base_color if bit_value else (0, 0, 0)
+
+            gray.save(os.path.join(output_dir, f"lsb_{channel_name}{bit}_gray.png"))
+            color.save(os.path.join(output_dir, f"lsb_{channel_name}{bit}.png"))
+
+    for bit in range(8):
+        composite = Image.new('RGB', (width, height))
+        composite_pixels = composite.load()
+        for y in range(height):
+            for x in range(width):
+                r, g, b = pixels[x, y]
+                composite_pixels[x, y] = (((r >> bit) & 1) * 255,
+                                          ((g >> bit) & 1) * 255,
+                                          ((b >> bit) & 1) * 255)
+        composite.save(os.path.join(output_dir, f"lsb_composite_bit{bit}.png"))
+
+
+def numpy_planes_only(filepath):
+    """Build every plane with the NumPy engine without PNG encoding"""
+    pixels = to_rgb_array(Image.open(filepath))
+    for channel_idx, channel_name in enumerate(CHANNELS):
+        for bit in range(8):
+            bits = bit_plane(pixels, channel_idx, bit)
+            gray_plane(bits)
+            color_plane(bits, CHANNEL_COLORS[channel_name])
+    for bit in range(8):
+        composite_plane(pixels, bit)
+
+
+def make_image(megapixels, directory):
+    """Write a photo-like RGB PNG (gradients plus sensor noise), 4:3 aspect"""
+    height = int((megapixels * 1_000_000 * 3 / 4) ** 0.5)
+    width = int(height * 4 / 3)
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 127 // (width + height)],
+                    axis=-1)
+    noise = rng.integers(-4, 5, base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    path = os.path.join(directory, f'bench_{megapixels}mp.png')
+    Image.fromarray(pixels).save(path, compress_level=1)
+    return path, width, height
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1, 12, 48],
+                        help='Image sizes in megapixels')
+    parser.add_argument('--legacy-max-mp', type=float, default=1,
+                        help='Largest size to run the per-pixel reference on')
+    args = parser.parse_args()
+
+    legacy_rate = None  # seconds per megapixel
+    print(f"{'size':>8} {'pixels':>12} {'planes (s)':>10} {'numpy (s)':>10} "
+          f"{'legacy (s)':>12} {'speedup':>8}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.sizes:
+            path, width, height = make_image(mp, tmp)
+            out_new = os.path.join(tmp, f'new_{mp}')
+            os.makedirs(out_new)
+            planes_time = timed(numpy_planes_only, path)
+            new_time = timed(LSBAnalyzer().analyze, path, out_new)
+
+            legacy_label = ''
+            if mp <= args.legacy_max_mp:
+                out_old = os.path.join(tmp, f'old_{mp}')
+                os.makedirs(out_old)
+                legacy_time = timed(legacy_bit_planes, path, out_old)
+                legacy_rate = legacy_time / mp
+                legacy_label = f'{legacy_time:.2f}'
+            elif legacy_rate is not None:
+                legacy_time = legacy_rate * mp
+                legacy_label = f'~{legacy_time:.0f} est'
+            else:
+                legacy_time = None
+
+            speedup = f'{legacy_time / new_time:.0f}x' if legacy_time else '-'
+            print(f"{mp:>6g}MP {width * height:>12,} {planes_time:>10.2f} {new_time:>10.2f} "
+                  f"{legacy_label or '-':>12} {speedup:>8}")
+
+
+if __name__ == '__main__':
+    main()
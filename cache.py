@@ -0,0 +1,213 @@
+"""
+StegMage Result Cache
+Content-addressed index of finished analyses, with LRU eviction of the
+results/ tree, and a memo of individual analyzer outcomes
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+INDEX_KEY = 'stegmage:cache:index'   # cache key -> analysis_id
+KEYS_KEY = 'stegmage:cache:keys'     # analysis_id -> cache key
+LRU_KEY = 'stegmage:cache:lru'       # every stored analysis_id scored by last access time
+SIZES_KEY = 'stegmage:cache:sizes'   # every stored analysis_id -> bytes on disk
+STATS_KEY = 'stegmage:cache:stats'   # hits / misses counters
+MEMO_PREFIX = 'stegmage:memo:'       # memo key -> analyzer outcome
+
+
+def file_sha256(fileobj, chunk_size=1024 * 1024) -> str:
+    """Hash a binary file object from its current position to the end"""
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=32)
+def _path_sha256(path: str, size: int, mtime_ns: int) -> str:
+    with open(path, 'rb') as f:
+        return file_sha256(f)
+
+
+def path_sha256(path) -> str:
+    """Hash a file on disk, remembering the result until it changes"""
+    stat = os.stat(path)
+    return _path_sha256(str(path), stat.st_size, stat.st_mtime_ns)
+
+
+def make_cache_key(file_hash: str, analyzer_versions: dict, options: dict) -> str:
+    """Build the cache key from image hash, analyzer versions and settings, and job options"""
+    material = json.dumps({
+        'sha256': file_hash,
+        'analyzers': analyzer_versions,
+        'options': options
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def _tree_size(path: Path) -> int:
+    """Total size in bytes of a file or directory tree"""
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache:
+    """
+    Redis-backed mapping of cache keys to completed analysis ids
+
+    Every analysis written to results/ is recorded here, cached or not, so
+    the whole tree is kept within max_bytes.
+    """
+
+    def __init__(self, redis_conn, results_folder, max_bytes: int):
+        self.redis = redis_conn
+        self.results_folder = Path(results_folder)
+        self.max_bytes = max_bytes
+
+    def lookup(self, key: str):
+        """Return the analysis id cached under key, or None on a miss"""
+        analysis_id = self.redis.hget(INDEX_KEY, key)
+        if analysis_id is not None:
+            analysis_id = analysis_id.decode()
+            if (self.results_folder / f"{analysis_id}.json").exists():
+                self.redis.zadd(LRU_KEY, {analysis_id: time.time()})
+                self.redis.hincrby(STATS_KEY, 'hits', 1)
+                return analysis_id
+            # Results were removed behind our back
+            self._forget(analysis_id)
+
+        self.redis.hincrby(STATS_KEY, 'misses', 1)
+        return None
+
+    def store(self, key: str, analysis_id: str):
+        """Register a completed analysis under key and evict old ones over the size limit"""
+        pipe = self.redis.pipeline()
+        pipe.hset(INDEX_KEY, key, analysis_id)
+        pipe.hset(KEYS_KEY, analysis_id, key)
+        pipe.execute()
+
+        self.record(analysis_id)
+
+    def record(self, analysis_id: str):
+        """Count a completed analysis toward the size limit and evict old ones over it"""
+        size = (_tree_size(self.results_folder / f"{analysis_id}.json") +
+                _tree_size(self.results_folder / analysis_id))
+
+        pipe = self.redis.pipeline()
+        pipe.hset(SIZES_KEY, analysis_id, size)
+        pipe.zadd(LRU_KEY, {analysis_id: time.time()})
+        pipe.execute()
+
+        self.evict(keep=analysis_id)
+
+    def evict(self, keep=None):
+        """
+        Delete least recently used analyses until the tree fits max_bytes
+
+        The analysis keep is never deleted, even if it alone is over the
+        limit: its results are about to be fetched.
+        """
+        total = sum(int(s) for s in self.redis.hvals(SIZES_KEY))
+
+        skipped = 0
+        while total > self.max_bytes:
+            oldest = self.redis.zrange(LRU_KEY, skipped, skipped)
+            if not oldest:
+                break
+            analysis_id = oldest[0].decode()
+            if analysis_id == keep:
+                skipped += 1
+                continue
+            total -= int(self.redis.hget(SIZES_KEY, analysis_id) or 0)
+
+            shutil.rmtree(self.results_folder / analysis_id, ignore_errors=True)
+            try:
+                os.remove(self.results_folder / f"{analysis_id}.json")
+            except FileNotFoundError:
+                pass
+            self._forget(analysis_id)
+
+    def stats(self) -> dict:
+        """Hit/miss counters and current cache occupancy"""
+        counters = self.redis.hgetall(STATS_KEY)
+        return {
+            'hits': int(counters.get(b'hits', 0)),
+            'misses': int(counters.get(b'misses', 0)),
+            'entries': self.redis.zcard(LRU_KEY),
+            'bytes': sum(int(s) for s in self.redis.hvals(SIZES_KEY)),
+            'max_bytes': self.max_bytes
+        }
+
+    def _forget(self, analysis_id: str):
+        """Drop every index entry for an analysis"""
+        key = self.redis.hget(KEYS_KEY, analysis_id)
+        pipe = self.redis.pipeline()
+        if key is not None:
+            pipe.hdel(INDEX_KEY, key)
+        pipe.hdel(KEYS_KEY, analysis_id)
+        pipe.hdel(SIZES_KEY, analysis_id)
+        pipe.zrem(LRU_KEY, analysis_id)
+        pipe.execute()
+
+
+def make_memo_key(file_hash: str, name: str, version: str, params: dict) -> str:
+    """Build the memo key of one analyzer run"""
+    material = json.dumps({
+        'sha256': file_hash,
+        'analyzer': name,
+        'version': version,
+        'params': params
+    }, sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class AnalyzerMemo:
+    """Redis-backed memo of single analyzer outcomes and the files they wrote"""
+
+    def __init__(self, redis_conn, results_folder, ttl: int):
+        self.redis = redis_conn
+        self.results_folder = Path(results_folder)
+        self.ttl = ttl
+
+    def get(self, key: str):
+        """Return {'analysis_id', 'outcome', 'files'} or None if missing/stale"""
+        entry = self.redis.get(MEMO_PREFIX + key)
+        if entry is None:
+            return None
+        entry = json.loads(entry)
+
+        # Artifacts may have been evicted from the results tree
+        source_dir = self.results_folder / entry['analysis_id']
+        if not all((source_dir / f).is_file() for f in entry['files']):
+            self.redis.delete(MEMO_PREFIX + key)
+            return None
+        return entry
+
+    def put(self, key: str, analysis_id: str, outcome: dict, files: list):
+        """Remember an analyzer outcome produced in results/<analysis_id>/"""
+        entry = {'analysis_id': analysis_id, 'outcome': outcome, 'files': files}
+        self.redis.setex(MEMO_PREFIX + key, self.ttl, json.dumps(entry))
+
+    def restore(self, entry: dict, output_dir):
+        """Copy the entry's artifacts into output_dir, unless they already live there"""
+        source_dir = self.results_folder / entry['analysis_id']
+        output_dir = Path(output_dir)
+        if source_dir.resolve() == output_dir.resolve():
+            return
+        for rel_path in entry['files']:
+            target = output_dir / rel_path
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(source_dir / rel_path, target)
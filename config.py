@@ -16,6 +16,10 @@ DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
 MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
 UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', BASE_DIR / 'uploads')
 RESULTS_FOLDER = os.environ.get('RESULTS_FOLDER', BASE_DIR / 'results')
+WORDLISTS_FOLDER = os.environ.get('WORDLISTS_FOLDER', BASE_DIR / 'wordlists')
+MAX_BATCH_CONTENT_LENGTH = int(os.environ.get('MAX_BATCH_CONTENT_LENGTH',
+                                              str(2 * 1024 ** 3)))  # 2GB
+MAX_BATCH_FILES = int(os.environ.get('MAX_BATCH_FILES', '10000'))
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'tiff', 'tif', 'jfif'}
 
 # Redis Configuration
@@ -27,6 +31,58 @@ DATABASE_URL = os.environ.get('DATABASE_URL', 'postgresql://stegmage:stegmage@lo
 # Analysis Configuration
 ANALYSIS_TIMEOUT = int(os.environ.get('ANALYSIS_TIMEOUT', '600'))  # 10 minutes
 MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '4'))
+STEGHIDE_WORKERS = int(os.environ.get('STEGHIDE_WORKERS', str(os.cpu_count() or 1)))
+# Reject JPEG passwords whose steghide header does not match in Python, before running steghide
+STEGHIDE_HEADER_CHECK = os.environ.get('STEGHIDE_HEADER_CHECK', 'True').lower() == 'true'
+# Run binwalk and foremost in addition to the built-in signature carver
+CARVING_EXTERNAL_TOOLS = os.environ.get('CARVING_EXTERNAL_TOOLS', 'False').lower() == 'true'
+# Strings extraction: minimum length, encodings scanned and how many ranked strings are reported
+STRINGS_MIN_LENGTH = int(os.environ.get('STRINGS_MIN_LENGTH', '8'))
+STRINGS_ENCODINGS = [e.strip().lower() for e in os.environ.get(
+    'STRINGS_ENCODINGS', 'ascii,utf-16le,utf-16be').split(',')]
+STRINGS_TOP = int(os.environ.get('STRINGS_TOP', '100'))
+# 'eager' writes every bit plane PNG during analysis, 'lazy' renders them on first access
+LSB_RENDER_MODE = os.environ.get('LSB_RENDER_MODE', 'eager').lower()
+# Estimated LSB embedding rate (chi-square/RS/SPA) from which an image is reported
+LSB_STATS_THRESHOLD = float(os.environ.get('LSB_STATS_THRESHOLD', '0.05'))
+# exiftool processes kept open per worker, requests that may wait for one, and seconds per request
+EXIFTOOL_POOL_SIZE = int(os.environ.get('EXIFTOOL_POOL_SIZE', '2'))
+EXIFTOOL_QUEUE_SIZE = int(os.environ.get('EXIFTOOL_QUEUE_SIZE', '16'))
+EXIFTOOL_TIMEOUT = int(os.environ.get('EXIFTOOL_TIMEOUT', '30'))
+# Working memory each analyzer may use when processing an image in strips; the
+# decoded source image, held once per job, comes on top
+ANALYZER_MEMORY_BUDGET = int(os.environ.get('ANALYZER_MEMORY_BUDGET',
+                                            str(256 * 1024 * 1024)))  # 256MB
+
+# Artifact Encoding Configuration (images written by analyzers)
+ARTIFACT_FORMAT = os.environ.get('ARTIFACT_FORMAT', 'png').lower()  # 'png' or 'webp'
+ARTIFACT_COMPRESS_LEVEL = int(os.environ.get('ARTIFACT_COMPRESS_LEVEL', '1'))  # PNG zlib level 0-9
+ARTIFACT_BILEVEL_PLANES = os.environ.get('ARTIFACT_BILEVEL_PLANES', 'True').lower() == 'true'
+ARTIFACT_WEBP_LOSSLESS = os.environ.get('ARTIFACT_WEBP_LOSSLESS', 'True').lower() == 'true'
+ARTIFACT_WEBP_QUALITY = int(os.environ.get('ARTIFACT_WEBP_QUALITY', '80'))
+
+# Triage Configuration
+# 'full' runs every analyzer; 'triage' runs the cheap ones and escalates to
+# the expensive ones only when a triage rule fires
+ANALYSIS_PROFILE = os.environ.get('ANALYSIS_PROFILE', 'full').lower()
+BATCH_ANALYSIS_PROFILE = os.environ.get('BATCH_ANALYSIS_PROFILE', 'triage').lower()
+# Rules that escalate a triaged image: lsb_stats, trailing_data, structure,
+# strings, metadata, unscreened
+TRIAGE_RULES = [r.strip().lower() for r in os.environ.get(
+    'TRIAGE_RULES', 'lsb_stats,trailing_data,structure,strings,metadata').split(',') if r.strip()]
+TRIAGE_TRAILING_BYTES = int(os.environ.get('TRIAGE_TRAILING_BYTES', '1'))
+TRIAGE_STRING_TAGS = [t.strip().lower() for t in os.environ.get(
+    'TRIAGE_STRING_TAGS', 'flag,pem,keyword').split(',') if t.strip()]
+TRIAGE_METADATA_FIELDS = [f.strip() for f in os.environ.get(
+    'TRIAGE_METADATA_FIELDS', 'Comment,UserComment,XPComment,ImageDescription,Warning').split(',')
+    if f.strip()]
+
+# Result Cache Configuration
+ENABLE_RESULT_CACHE = os.environ.get('ENABLE_RESULT_CACHE', 'True').lower() == 'true'
+# Size limit of the whole results tree, cached or not; least recently used analyses go first
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(5 * 1024 ** 3)))  # 5GB
+ENABLE_ANALYZER_MEMO = os.environ.get('ENABLE_ANALYZER_MEMO', 'True').lower() == 'true'
+ANALYZER_MEMO_TTL = int(os.environ.get('ANALYZER_MEMO_TTL', str(7 * 24 * 3600)))  # 7 days
 
 # Tool Paths (can be customized)
 TOOL_PATHS = {
@@ -2,6 +2,9 @@
 
 let currentAnalysisId = null;
 let pollInterval = null;
+let statusStream = null;
+let renderedSections = new Set();
+let partialLoadInFlight = false;
 
 // DOM Elements
 const uploadSection = document.getElementById('upload-section');
@@ -16,6 +19,8 @@ const newAnalysisBtn = document.getElementById('new-analysis-btn');
 const toggleAdvancedBtn = document.getElementById('toggle-advanced');
 const advancedSection = document.getElementById('advanced-section');
 const steghidePasswordsInput = document.getElementById('steghide-passwords');
+const steghideWordlistInput = document.getElementById('steghide-wordlist');
+const analysisProfileInput = document.getElementById('analysis-profile');
 
 // Toggle Advanced Options
 toggleAdvancedBtn.addEventListener('click', (e) => {
@@ -77,6 +82,16 @@ async function uploadFile(file) {
         formData.append('steghide_passwords', JSON.stringify(passwords));
     }
 
+    // Get steghide wordlist for a dictionary attack
+    if (steghideWordlistInput.files.length > 0) {
+        formData.append('steghide_wordlist', steghideWordlistInput.files[0]);
+    }
+
+    // Full analysis or fast triage
+    if (analysisProfileInput.value) {
+        formData.append('profile', analysisProfileInput.value);
+    }
+
     // Show progress section
     uploadSection.style.display = 'none';
     progressSection.style.display = 'block';
@@ -95,6 +110,12 @@ async function uploadFile(file) {
 
         if (response.ok) {
             currentAnalysisId = data.analysis_id;
+            if (data.cached) {
+                // Identical image was analyzed before - results are ready
+                progressFill.style.width = '100%';
+                loadResults();
+                return;
+            }
             progressText.textContent = 'Analysis started...';
             progressFill.style.width = '20%';
             startPolling();
@@ -107,9 +128,53 @@ async function uploadFile(file) {
     }
 }
 
-// Start Polling for Status
+// Follow Status Updates pushed by the server
 function startPolling() {
-    pollInterval = setInterval(checkStatus, 2000);
+    if (!window.EventSource) {
+        pollInterval = setInterval(checkStatus, 2000);
+        return;
+    }
+
+    statusStream = new EventSource(`/api/events/${currentAnalysisId}`);
+
+    statusStream.onmessage = (e) => {
+        const data = JSON.parse(e.data);
+        updateProgress(data);
+
+        // Show each analyzer's output as soon as it is stored
+        if (data.event && data.status === 'processing') {
+            loadPartialResults();
+        }
+
+        if (data.status === 'completed') {
+            stopStatusUpdates();
+            loadResults();
+        } else if (data.status === 'failed') {
+            stopStatusUpdates();
+            alert('Analysis failed');
+            resetUI();
+        }
+    };
+
+    statusStream.onerror = () => {
+        // The browser reconnects by itself unless the stream was refused
+        if (statusStream && statusStream.readyState === EventSource.CLOSED) {
+            statusStream = null;
+            pollInterval = setInterval(checkStatus, 2000);
+        }
+    };
+}
+
+// Stop Status Updates
+function stopStatusUpdates() {
+    if (statusStream) {
+        statusStream.close();
+        statusStream = null;
+    }
+    if (pollInterval) {
+        clearInterval(pollInterval);
+        pollInterval = null;
+    }
 }
 
 // Check Analysis Status
@@ -122,10 +187,10 @@ async function checkStatus() {
             updateProgress(data);
 
             if (data.status === 'completed') {
-                clearInterval(pollInterval);
+                stopStatusUpdates();
                 loadResults();
             } else if (data.status === 'failed') {
-                clearInterval(pollInterval);
+                stopStatusUpdates();
                 alert('Analysis failed');
                 resetUI();
             }
@@ -140,6 +205,12 @@ function updateProgress(data) {
     const progress = data.progress || 0;
     progressFill.style.width = progress + '%';
     progressText.textContent = `Analyzing... ${progress}%`;
+
+    // Name the analyzer that just finished
+    if (data.event) {
+        const name = data.event.analyzer.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase());
+        progressText.textContent += ` (${name} ${data.event.success ? 'done' : 'failed'}, ${data.event.completed}/${data.event.total})`;
+    }
 }
 
 // Load Results
@@ -161,6 +232,30 @@ async function loadResults() {
     }
 }
 
+// Load Results of a Running Analysis
+async function loadPartialResults() {
+    if (partialLoadInFlight) {
+        return;
+    }
+    partialLoadInFlight = true;
+    const analysisId = currentAnalysisId;
+
+    try {
+        const response = await fetch(`/api/results/${analysisId}`);
+        const data = await response.json();
+
+        // Ignore responses for an analysis the user has left
+        if (response.ok && analysisId === currentAnalysisId && Object.keys(data.results).length > 0) {
+            displayResults(data);
+            resultsSection.style.display = 'block';
+        }
+    } catch (error) {
+        console.error('Error loading partial results:', error);
+    } finally {
+        partialLoadInFlight = false;
+    }
+}
+
 // Display Results
 function displayResults(data) {
     const results = data.results;
@@ -169,56 +264,34 @@ function displayResults(data) {
     displayDashboard(results, data);
 
     // Load Reverse Image Search
-    loadReverseSearchResults();
-
-    // Metadata
-    if (results.metadata && results.metadata.success) {
-        displayMetadataResults(results.metadata.data);
-    }
-
-    // Color Analysis
-    if (results.color_analysis && results.color_analysis.success) {
-        displayColorAnalysisResults(results.color_analysis.data);
-    }
-
-    // LSB Analysis
-    if (results.lsb && results.lsb.success) {
-        displayLSBResults(results.lsb.data);
+    if (!renderedSections.has('reverse_search')) {
+        renderedSections.add('reverse_search');
+        loadReverseSearchResults();
     }
 
-    // Steghide
-    if (results.steghide && results.steghide.success) {
-        displaySteghideResults(results.steghide.data);
-    }
-
-    // Outguess
-    if (results.outguess && results.outguess.success) {
-        displayOutguessResults(results.outguess.data);
-    }
-
-    // Zsteg
-    if (results.zsteg && results.zsteg.success) {
-        displayZstegResults(results.zsteg.data);
-    }
-
-    // Entropy
-    if (results.entropy && results.entropy.success) {
-        displayEntropyResults(results.entropy.data);
-    }
-
-    // Forensics
-    if (results.forensics && results.forensics.success) {
-        displayForensicsResults(results.forensics.data);
-    }
-
-    // Strings
-    if (results.strings && results.strings.success) {
-        displayStringsResults(results.strings.data);
-    }
+    // Sections of every analyzer, each rendered once its result arrives
+    const sections = {
+        metadata: displayMetadataResults,
+        color_analysis: displayColorAnalysisResults,
+        lsb: displayLSBResults,
+        lsb_stats: displayLSBStatsResults,
+        steghide: displaySteghideResults,
+        outguess: displayOutguessResults,
+        zsteg: displayZstegResults,
+        entropy: displayEntropyResults,
+        forensics: displayForensicsResults,
+        strings: displayStringsResults,
+        file_structure: displayFileStructureResults,
+        file_carving: displayFileCarvingResults
+    };
 
-    // File Carving
-    if (results.file_carving && results.file_carving.success) {
-        displayFileCarvingResults(results.file_carving.data);
+    for (const [name, display] of Object.entries(sections)) {
+        if (results[name] && !renderedSections.has(name)) {
+            renderedSections.add(name);
+            if (results[name].success) {
+                display(results[name].data);
+            }
+        }
     }
 }
 
@@ -343,7 +416,7 @@ function displayLSBResults(data) {
                 <div class="image-grid">
                     ${planes.map(bp => `
                         <div class="image-item" style="border: 2px solid ${channelColor}">
-                            <img src="/api/download/${currentAnalysisId}/${bp.filename}"
+                            <img src="/api/planes/${currentAnalysisId}/${bp.filename}"
                                  alt="${bp.channel}${bp.bit}"
                                  title="Bit ${bp.bit} of ${bp.channel} channel">
                             <p style="color: ${channelColor}; font-weight: bold;">${bp.channel} Bit ${bp.bit}</p>
@@ -366,7 +439,7 @@ function displayLSBResults(data) {
                 <div class="image-grid">
                     ${data.composite_planes.map(cp => `
                         <div class="image-item" style="border: 2px solid #6366f1">
-                            <img src="/api/download/${currentAnalysisId}/${cp.filename}"
+                            <img src="/api/planes/${currentAnalysisId}/${cp.filename}"
                                  alt="Composite Bit ${cp.bit}"
                                  title="RGB Composite of Bit ${cp.bit}">
                             <p style="color: #6366f1; font-weight: bold;">Composite Bit ${cp.bit}</p>
@@ -546,12 +619,18 @@ function displayStringsResults(data) {
         return;
     }
 
+    const ranked = data.ranked || data.strings.map(string => ({ string, tags: [] }));
+
     container.innerHTML = `
         <div class="result-item">
-            <h3>Found ${data.count} strings (showing first 100)</h3>
-            <pre>${data.strings.join('\n')}</pre>
+            <h3>Found ${data.count} strings (showing the ${ranked.length} most interesting)</h3>
+            <pre></pre>
         </div>
     `;
+    // Strings come from the file itself - never parse them as HTML
+    container.querySelector('pre').textContent = ranked
+        .map(r => r.tags.length ? `[${r.tags.join(', ')}] ${r.string}` : r.string)
+        .join('\n');
 }
 
 // Display Zsteg Results
@@ -563,10 +642,62 @@ function displayZstegResults(data) {
         return;
     }
 
+    const extracted = (data.payloads || []).filter(p => p.extracted_file);
+
     container.innerHTML = `
         <div class="result-item">
             <h3>Zsteg Analysis</h3>
-            <pre>${data.findings.join('\n') || 'No findings'}</pre>
+            ${data.streams_scanned ? `<p style="color: var(--text-muted);">Scanned ${data.streams_scanned} bit streams in ${data.elapsed_seconds}s</p>` : ''}
+            <pre></pre>
+            ${extracted.map(p => `<p><strong>Extracted file:</strong> ${p.extracted_file} (${p.description})</p>`).join('')}
+        </div>
+    `;
+    // Payload text comes from the image itself - never parse it as HTML
+    container.querySelector('pre').textContent = data.findings.join('\n') || 'No findings';
+}
+
+// Display LSB Statistics Results
+function displayLSBStatsResults(data) {
+    const container = document.getElementById('tab-lsb_stats');
+
+    if (data.error) {
+        container.innerHTML = `<p>${data.error}</p>`;
+        return;
+    }
+
+    const percent = value => value === null || value === undefined ? 'N/A' : `${(value * 100).toFixed(1)}%`;
+    const verdict = data.suspicious ?
+        `<p style="color: var(--warning-color); font-weight: bold;">LSB embedding likely: about ${percent(data.embedding_rate)} of the pixels (threshold ${percent(data.threshold)})</p>` :
+        `<p style="color: var(--success-color);">No LSB embedding detected (estimated rate ${percent(data.embedding_rate)}, threshold ${percent(data.threshold)})</p>`;
+
+    container.innerHTML = `
+        <div class="result-item">
+            <h3><i class="fas fa-chart-line"></i> LSB Statistics</h3>
+            ${verdict}
+            <p style="color: var(--text-muted);">${data.pixels.toLocaleString()} pixels analyzed in ${data.elapsed_seconds}s</p>
+            <table style="width: 100%; margin-top: 1rem;">
+                <tr><th style="text-align: left;">Channel</th><th>Rate</th><th>RS</th><th>Sample pairs</th><th>Chi-square p</th><th>Embedded from top</th></tr>
+                ${Object.entries(data.channels).map(([name, channel]) => `
+                    <tr>
+                        <td>${name}</td>
+                        <td style="text-align: center;">${percent(channel.rate)}</td>
+                        <td style="text-align: center;">${percent(channel.rs.rate)}</td>
+                        <td style="text-align: center;">${percent(channel.spa.rate)}</td>
+                        <td style="text-align: center;">${channel.chi_square.p_value.toFixed(4)}</td>
+                        <td style="text-align: center;">${percent(channel.chi_square.embedded_fraction)}</td>
+                    </tr>
+                `).join('')}
+            </table>
+        </div>
+        <div class="result-item">
+            <h3>Chi-square Curve</h3>
+            <p style="color: var(--text-muted);">p-value of consecutive pixel windows from the top of the image; values near 100% look like random message bits</p>
+            ${Object.entries(data.channels).map(([name, channel]) => `
+                <p><strong>${name}</strong></p>
+                <div style="display: flex; align-items: flex-end; height: 60px; gap: 1px; background: var(--darker-bg); border-radius: 4px; padding: 2px;">
+                    ${channel.chi_square.curve.map(p => `<div title="${(p * 100).toFixed(1)}%" style="flex: 1; height: ${Math.max(2, p * 100)}%; background: ${p >= 0.5 ? 'var(--warning-color)' : 'var(--primary-color)'};"></div>`).join('')}
+                </div>
+            `).join('')}
         </div>
     `;
 }
@@ -580,6 +711,11 @@ function displaySteghideResults(data) {
         return;
     }
 
+    if (data.mode === 'dictionary') {
+        displaySteghideDictionaryResults(container, data);
+        return;
+    }
+
     const passwordSource = data.using_custom_passwords ?
         '<p style="color: var(--success-color); font-weight: bold;">🔐 Using your custom passwords</p>' :
         '<p style="color: var(--text-muted);">Using default passwords (empty, password, 123456, admin, root)</p>';
@@ -631,6 +767,36 @@ function displaySteghideResults(data) {
     `;
 }
 
+// Display Steghide Dictionary Attack Results
+function displaySteghideDictionaryResults(container, data) {
+    const outcome = data.success ? `
+        <div class="result-item" style="border-left: 4px solid var(--success-color);">
+            <h3 style="color: var(--success-color);">✅ Extraction Successful!</h3>
+            <p><strong>Password used:</strong> <code class="steghide-password" style="background: var(--darker-bg); padding: 0.25rem 0.5rem; border-radius: 4px;"></code></p>
+            ${data.output_file ? '<p><strong>Extracted file:</strong> <span class="steghide-output"></span></p>' : ''}
+        </div>
+    ` : '<div class="result-item"><p>No password in the wordlist extracted any data.</p></div>';
+
+    container.innerHTML = `
+        <div class="result-item">
+            <h3>🔐 Steghide Dictionary Attack</h3>
+            <p><strong>Wordlist:</strong> <span class="steghide-wordlist"></span></p>
+            ${data.header_check ? `<p><strong>Rejected by header check:</strong> ${data.rejected}</p>` : ''}
+            <p><strong>Passwords tried:</strong> ${data.attempted} (${data.attempts_per_second}/s on ${data.workers} workers)</p>
+            <p><strong>Failed:</strong> ${data.failed} &middot; <strong>Timeouts:</strong> ${data.timeouts} &middot; <strong>Errors:</strong> ${data.errors}</p>
+        </div>
+        ${outcome}
+    `;
+    // Wordlist names and entries are user-supplied - never parse them as HTML
+    container.querySelector('.steghide-wordlist').textContent = data.wordlist;
+    if (data.success) {
+        container.querySelector('.steghide-password').textContent = data.password;
+        if (data.output_file) {
+            container.querySelector('.steghide-output').textContent = data.output_file;
+        }
+    }
+}
+
 // Display Outguess Results
 function displayOutguessResults(data) {
     const container = document.getElementById('tab-outguess');
@@ -654,12 +820,86 @@ function displayOutguessResults(data) {
     }
 }
 
+// Display File Structure Results
+function displayFileStructureResults(data) {
+    const container = document.getElementById('tab-file_structure');
+
+    if (data.error) {
+        container.innerHTML = `<p>${data.error}</p>`;
+        return;
+    }
+
+    const hex = value => '0x' + value.toString(16).padStart(8, '0');
+    const notes = segment => [
+        segment.count > 1 ? `${segment.count} chunks` : '',
+        segment.crc_ok === false ? '<span style="color: var(--danger-color);">CRC mismatch</span>' : '',
+        segment.known === false ? '<span style="color: var(--warning-color);">unknown</span>' : '',
+        segment.file ? `<a href="/api/download/${currentAnalysisId}/${segment.file}">extracted</a>` : ''
+    ].filter(Boolean).join(', ');
+
+    container.innerHTML = `
+        <div class="result-item">
+            <h3><i class="fas fa-sitemap"></i> ${data.format} Structure</h3>
+            <p>${data.segment_count.toLocaleString()} segments in ${data.file_size.toLocaleString()} bytes, parsed in ${(data.elapsed_seconds * 1000).toFixed(1)} ms</p>
+            ${data.trailing_bytes === null ?
+                '<p style="color: var(--warning-color);">The structure breaks before the image ends</p>' :
+                data.trailing_bytes > 0 ?
+                    `<p style="color: var(--warning-color); font-weight: bold;">${data.trailing_bytes.toLocaleString()} bytes follow the end of the image at offset ${data.image_end.toLocaleString()}</p>` :
+                    '<p style="color: var(--success-color);">Nothing follows the end of the image</p>'}
+            ${data.anomalies.length ? `<ul>${data.anomalies.map(a => `<li>${a.description}</li>`).join('')}</ul>` : ''}
+        </div>
+        <div class="result-item">
+            <h3>Segments</h3>
+            <table style="width: 100%;">
+                <tr><th style="text-align: left;">Offset</th><th style="text-align: left;">Type</th><th style="text-align: right;">Size</th><th style="text-align: left;">Label</th><th style="text-align: left;">Notes</th></tr>
+                ${data.segments.map(s => `
+                    <tr>
+                        <td><code>${hex(s.offset)}</code></td>
+                        <td>${s.type}</td>
+                        <td style="text-align: right;">${s.size.toLocaleString()}</td>
+                        <td class="segment-label"></td>
+                        <td>${notes(s)}</td>
+                    </tr>
+                `).join('')}
+            </table>
+            ${data.segment_count > data.segments.length ? `<p style="color: var(--text-muted);">${data.segment_count - data.segments.length} more segments not listed</p>` : ''}
+        </div>
+    `;
+    // Keywords and identifiers come from the file itself - never parse them as HTML
+    container.querySelectorAll('.segment-label').forEach((cell, i) => {
+        const segment = data.segments[i];
+        cell.textContent = segment.keyword ?? segment.identifier ?? '';
+    });
+}
+
 // Display File Carving Results
 function displayFileCarvingResults(data) {
     const container = document.getElementById('tab-file_carving');
 
     let html = '';
 
+    if (data.carver) {
+        const carver = data.carver;
+        html += `
+            <div class="result-item">
+                <h3>Signature Carving</h3>
+                <p>Found ${carver.files.length} embedded files in ${carver.scan_seconds}s</p>
+                ${carver.trailing_bytes ? `<p><strong>${carver.trailing_bytes} bytes trail the image</strong> (carved/trailing_data.bin)</p>` : ''}
+                ${carver.files.length ? `
+                    <ul>
+                        ${carver.files.map(f => `<li>0x${f.offset.toString(16)}: ${f.type}, ${f.size} bytes${f.complete ? '' : ' (end not found)'}${f.file ? ` - ${f.file}` : ''}</li>`).join('')}
+                    </ul>
+                ` : ''}
+                ${carver.metadata_files?.length ? `
+                    <p style="color: var(--text-muted);">${carver.metadata_files.length} images inside the image's own metadata (EXIF, thumbnails, previews):</p>
+                    <ul style="color: var(--text-muted);">
+                        ${carver.metadata_files.map(f => `<li>0x${f.offset.toString(16)}: ${f.type} in ${f.segment}, ${f.size} bytes${f.file ? ` - ${f.file}` : ''}</li>`).join('')}
+                    </ul>
+                ` : ''}
+            </div>
+        `;
+    }
+
     if (data.binwalk) {
         html += `
             <div class="result-item">
@@ -703,7 +943,7 @@ function displayDashboard(results, data) {
     let findings = [];
 
     // Check steghide
-    if (results.steghide?.success && results.steghide.data.attempts?.some(a => a.success)) {
+    if (results.steghide?.success && (results.steghide.data.success || results.steghide.data.attempts?.some(a => a.success))) {
         findingsCount.steganography++;
         findings.push({ type: 'success', icon: 'fa-lock', title: 'Steghide Data Found', desc: 'Hidden data extracted with password' });
     }
@@ -714,18 +954,47 @@ function displayDashboard(results, data) {
         findings.push({ type: 'success', icon: 'fa-unlock', title: 'Outguess Data Found', desc: 'Hidden data detected' });
     }
 
+    // Check LSB statistics
+    if (results.lsb_stats?.success && results.lsb_stats.data.suspicious) {
+        findingsCount.steganography++;
+        findings.push({ type: 'warning', icon: 'fa-chart-line', title: 'LSB Embedding Detected', desc: `About ${(results.lsb_stats.data.embedding_rate * 100).toFixed(1)}% of the pixels carry LSB-replaced data` });
+    }
+
     // Check zsteg
     if (results.zsteg?.success && results.zsteg.data.findings?.length > 0) {
         findingsCount.steganography++;
         findings.push({ type: 'info', icon: 'fa-gem', title: 'Zsteg Findings', desc: `${results.zsteg.data.findings.length} potential findings` });
     }
 
+    // Check carved files
+    const carver = results.file_carving?.success ? results.file_carving.data.carver : null;
+    if (carver && (carver.files?.length > 0 || carver.trailing_bytes > 0)) {
+        findingsCount.steganography++;
+        findings.push({ type: 'warning', icon: 'fa-file-archive', title: 'Embedded Files', desc: `${carver.files.length} embedded files, ${carver.trailing_bytes || 0} bytes after the image end` });
+    }
+
+    // Check file structure
+    const structure = results.file_structure?.success ? results.file_structure.data : null;
+    if (structure?.anomalies?.length > 0) {
+        findingsCount.steganography++;
+        findings.push({ type: 'warning', icon: 'fa-sitemap', title: 'File Structure Anomalies', desc: structure.anomalies.slice(0, 3).map(a => a.description).join('; ') });
+    }
+
     // Check entropy
     if (results.entropy?.success && results.entropy.data.suspicious_blocks?.length > 0) {
         findingsCount.forensics++;
         findings.push({ type: 'warning', icon: 'fa-wave-square', title: 'Entropy Anomalies', desc: `${results.entropy.data.suspicious_blocks.length} suspicious blocks detected` });
     }
 
+    const jpeg = results.forensics?.success ? results.forensics.data.jpeg_analysis : null;
+    if (jpeg && !jpeg.error) {
+        const methods = ['jsteg', 'f5', 'outguess'].filter(name => jpeg[name].detected);
+        if (methods.length > 0) {
+            findingsCount.steganography++;
+            findings.push({ type: 'warning', icon: 'fa-th', title: 'JPEG Embedding Detected', desc: `DCT coefficient statistics match ${methods.join(', ')}` });
+        }
+    }
+
     // Check forensics
     if (results.forensics?.success && results.forensics.data.ela_findings?.length > 0) {
         findingsCount.forensics++;
@@ -818,6 +1087,7 @@ function displayDashboard(results, data) {
                 ${Object.entries(results).map(([name, result]) => {
                     const icons = {
                         lsb: 'fa-th',
+                        lsb_stats: 'fa-chart-line',
                         metadata: 'fa-tags',
                         color_analysis: 'fa-palette',
                         steghide: 'fa-lock',
@@ -826,6 +1096,7 @@ function displayDashboard(results, data) {
                         entropy: 'fa-wave-square',
                         forensics: 'fa-microscope',
                         strings: 'fa-file-alt',
+                        file_structure: 'fa-sitemap',
                         file_carving: 'fa-folder-open'
                     };
                     const status = result.success ? '<i class="fas fa-check-circle" style="color: var(--success-color)"></i>' : '<i class="fas fa-times-circle" style="color: var(--danger-color)"></i>';
@@ -835,11 +1106,29 @@ function displayDashboard(results, data) {
                         </div>
                     `;
                 }).join('')}
+                ${(data.pending || []).map(name => `
+                        <div style="background: var(--darker-bg); padding: 0.5rem 0.75rem; border-radius: 6px; font-size: 0.9rem; display: flex; align-items: center; gap: 0.5rem; color: var(--text-muted);">
+                            <i class="fas fa-spinner fa-spin"></i> ${name.replace(/_/g, ' ').replace(/\b\w/g, l => l.toUpperCase())}
+                        </div>
+                    `).join('')}
             </div>
         </div>
     `;
 
-    container.innerHTML = summaryHTML + findingsHTML + analysesHTML;
+    const triage = data.triage;
+    const triageHTML = triage ? `
+        <div class="result-item" style="border-left: 4px solid ${triage.escalated ? 'var(--warning-color)' : 'var(--success-color)'};">
+            <h3><i class="fas fa-filter"></i> Fast Triage</h3>
+            ${triage.escalated ? `
+                <p>Escalated to the full analysis:</p>
+                <ul>${triage.reasons.map(r => `<li>${r}</li>`).join('')}</ul>
+            ` : `
+                <p>Nothing suspicious in the cheap checks; skipped ${triage.skipped.map(n => n.replace(/_/g, ' ')).join(', ')}</p>
+            `}
+        </div>
+    ` : '';
+
+    container.innerHTML = summaryHTML + triageHTML + findingsHTML + analysesHTML;
 }
 
 // Display Color Analysis Results
@@ -1048,27 +1337,34 @@ function displayForensicsResults(data) {
         `;
     }
 
-    if (data.compression_analysis) {
-        const ca = data.compression_analysis;
+    if (data.jpeg_analysis) {
+        const ja = data.jpeg_analysis;
+        const verdict = (detected, text) => `<span style="font-weight: bold; color: ${detected ? 'var(--danger-color)' : 'var(--success-color)'};">${text}</span>`;
         html += `
             <div class="result-item">
-                <h3><i class="fas fa-compress"></i> JPEG Compression Analysis</h3>
+                <h3><i class="fas fa-compress"></i> JPEG Coefficient Analysis</h3>
                 <div style="background: var(--darker-bg); padding: 1rem; border-radius: 8px; margin-top: 1rem;">
-                    <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem;">
-                        ${ca.estimated_quality ? `
+                    ${ja.error ? `<p class="jpeg-error" style="color: var(--text-muted);"></p>` : `
+                        <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 1rem;">
                             <div>
                                 <div style="color: var(--text-muted); font-size: 0.85rem;">Estimated Quality</div>
-                                <div style="font-size: 1.3rem; font-weight: bold; color: var(--primary-color);">${ca.estimated_quality}</div>
+                                <div style="font-size: 1.3rem; font-weight: bold; color: var(--primary-color);">${ja.quality.quality}${ja.quality.standard_tables ? '' : ' (custom tables)'}</div>
                             </div>
-                        ` : ''}
-                        ${ca.compression_artifacts ? `
                             <div>
-                                <div style="color: var(--text-muted); font-size: 0.85rem;">Compression Artifacts</div>
-                                <div style="font-size: 1.3rem; font-weight: bold; color: ${ca.compression_artifacts === 'High' ? 'var(--danger-color)' : 'var(--success-color)'};">${ca.compression_artifacts}</div>
+                                <div style="color: var(--text-muted); font-size: 0.85rem;">Double Compression</div>
+                                <div style="font-size: 1.3rem;">${verdict(ja.double_compression.detected, ja.double_compression.detected ? `Detected (first quality ~${ja.double_compression.primary_quality})` : 'Not detected')}</div>
+                                <div style="color: var(--text-muted); font-size: 0.85rem;">${ja.double_compression.confidence === null ? 'Too few coefficients to tell' : `Confidence ${Math.round(ja.double_compression.confidence * 100)}%`}</div>
                             </div>
-                        ` : ''}
-                    </div>
-                    ${ca.notes ? `<p style="color: var(--text-muted); margin-top: 1rem; font-size: 0.9rem;">${ca.notes}</p>` : ''}
+                        </div>
+                        <table style="width: 100%; margin-top: 1rem; color: var(--text-muted);">
+                            <tr><td>JSteg (chi-square, p=${ja.jsteg.p_value ?? 'n/a'})</td><td>${verdict(ja.jsteg.detected, ja.jsteg.detected ? `First ${Math.round(ja.jsteg.embedded_fraction * 100)}% of coefficients` : 'Not detected')}</td></tr>
+                            <tr><td>F5 (shrinkage estimate ${ja.f5.beta})</td><td>${verdict(ja.f5.detected, ja.f5.detected ? 'Detected' : (ja.f5.reliable ? 'Not detected' : 'Unreliable'))}</td></tr>
+                            <tr><td>OutGuess (blockiness estimate ${ja.outguess.embedded_fraction})</td><td>${verdict(ja.outguess.detected, ja.outguess.detected ? 'Detected' : (ja.outguess.reliable ? 'Not detected' : 'Unreliable'))}</td></tr>
+                        </table>
+                        <p style="color: var(--text-muted); margin-top: 1rem; font-size: 0.9rem;">
+                            ${ja.blocks_analyzed} DCT blocks analyzed${ja.complete ? '' : ' (top of the image)'}${ja.progressive ? ', progressive JPEG' : ''}
+                        </p>
+                    `}
                 </div>
             </div>
         `;
@@ -1086,6 +1382,10 @@ function displayForensicsResults(data) {
     }
 
     container.innerHTML = html || '<div class="result-item"><p>No forensic analysis data available</p></div>';
+
+    if (data.jpeg_analysis?.error) {
+        container.querySelector('.jpeg-error').textContent = `JPEG coefficient analysis failed: ${data.jpeg_analysis.error}`;
+    }
 }
 
 // Category Navigation
@@ -1125,10 +1425,8 @@ newAnalysisBtn.addEventListener('click', resetUI);
 // Reset UI
 function resetUI() {
     currentAnalysisId = null;
-    if (pollInterval) {
-        clearInterval(pollInterval);
-        pollInterval = null;
-    }
+    stopStatusUpdates();
+    renderedSections.clear();
     uploadSection.style.display = 'block';
     progressSection.style.display = 'none';
     resultsSection.style.display = 'none';
@@ -1137,6 +1435,7 @@ function resetUI() {
 
     // Reset advanced options
     steghidePasswordsInput.value = '';
+    steghideWordlistInput.value = '';
     advancedSection.style.display = 'none';
     toggleAdvancedBtn.textContent = '⚙️ Advanced Options';
 }
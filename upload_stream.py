@@ -0,0 +1,197 @@
+"""
+StegMage Upload Streaming
+Writes multipart uploads straight to disk while hashing and sniffing them
+"""
+
+import hashlib
+import os
+import tarfile
+import tempfile
+import zipfile
+
+from flask import Request, current_app
+from PIL import Image
+
+try:
+    import magic
+except ImportError:  # libmagic missing - fall back to the signature table
+    magic = None
+
+# Bytes kept from the start of each upload for type detection
+SNIFF_BYTES = 2048
+
+# Bytes copied at a time when spooling archive members
+COPY_CHUNK = 1024 * 1024
+
+# MIME types accepted as images, and their signatures when libmagic is missing
+IMAGE_SIGNATURES = {
+    b'\x89PNG\r\n\x1a\n': 'image/png',
+    b'\xff\xd8\xff': 'image/jpeg',
+    b'GIF87a': 'image/gif',
+    b'GIF89a': 'image/gif',
+    b'BM': 'image/bmp',
+    b'II*\x00': 'image/tiff',
+    b'MM\x00*': 'image/tiff',
+}
+IMAGE_MIME_TYPES = set(IMAGE_SIGNATURES.values()) | {'image/x-ms-bmp'}
+
+
+class SpooledUpload:
+    """
+    File-like upload target in the upload folder
+
+    Werkzeug writes the incoming file part here chunk by chunk; the SHA-256
+    and the first SNIFF_BYTES are taken in the same pass.
+    """
+
+    def __init__(self, directory):
+        fd, self.path = tempfile.mkstemp(dir=directory, prefix='.upload_')
+        self.file = os.fdopen(fd, 'w+b')
+        self.digest = hashlib.sha256()
+        self.head = b''
+        self.size = 0
+        self.persisted = False
+
+    def write(self, data):
+        self.digest.update(data)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += bytes(data[:SNIFF_BYTES - len(self.head)])
+        self.size += len(data)
+        return self.file.write(data)
+
+    def read(self, *args):
+        return self.file.read(*args)
+
+    def readline(self, *args):
+        return self.file.readline(*args)
+
+    def seek(self, *args):
+        return self.file.seek(*args)
+
+    def tell(self):
+        return self.file.tell()
+
+    def flush(self):
+        return self.file.flush()
+
+    def sha256(self) -> str:
+        """Hex SHA-256 of everything written"""
+        return self.digest.hexdigest()
+
+    def persist(self, target):
+        """Move the upload to its final path without copying it"""
+        self.file.close()
+        os.replace(self.path, target)
+        self.persisted = True
+
+    def close(self):
+        """Close, deleting the upload unless it was persisted"""
+        self.file.close()
+        if not self.persisted:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class StreamingRequest(Request):
+    """Request that spools every uploaded file directly into UPLOAD_FOLDER"""
+
+    @property
+    def max_content_length(self):
+        """Batch submissions get their own, larger size limit"""
+        if self.endpoint == 'upload_batch':
+            return current_app.config['MAX_BATCH_CONTENT_LENGTH']
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        return SpooledUpload(current_app.config['UPLOAD_FOLDER'])
+
+
+def sniff_mime_type(head: bytes):
+    """MIME type of a file from its first bytes"""
+    if magic is not None:
+        return magic.from_buffer(head, mime=True)
+    for signature, mime_type in IMAGE_SIGNATURES.items():
+        if head.startswith(signature):
+            return mime_type
+    return 'application/octet-stream'
+
+
+def validate_image(upload: SpooledUpload):
+    """
+    Check that an upload really is a supported image
+
+    The type comes from the bytes sniffed during receipt; Pillow then parses
+    only the header on disk (no pixel decoding), which also rejects
+    decompression bombs.
+
+    Returns:
+        Error message, or None if the upload is a valid image
+    """
+    if upload.size == 0:
+        return 'Empty file'
+
+    mime_type = sniff_mime_type(upload.head)
+    if mime_type not in IMAGE_MIME_TYPES:
+        return f'File content is not a supported image ({mime_type})'
+
+    upload.flush()
+    try:
+        with Image.open(upload.path) as img:
+            if img.width == 0 or img.height == 0:
+                return 'Image has no pixels'
+    except Exception as e:
+        return f'Invalid image header: {e}'
+
+    return None
+
+
+def spool(fileobj, directory, max_bytes):
+    """
+    Copy a file-like object into a SpooledUpload
+
+    Raises:
+        ValueError: if more than max_bytes are read
+    """
+    upload = SpooledUpload(directory)
+    try:
+        while True:
+            chunk = fileobj.read(COPY_CHUNK)
+            if not chunk:
+                break
+            if upload.size + len(chunk) > max_bytes:
+                raise ValueError(f'larger than {max_bytes} bytes')
+            upload.write(chunk)
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+
+def iter_archive(path):
+    """
+    Regular files of a zip or tar archive, in archive order
+
+    Yields:
+        (member name, open binary file object) pairs
+
+    Raises:
+        ValueError: if path is not a zip or tar archive
+    """
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as member:
+                    yield info.filename, member
+    elif tarfile.is_tarfile(path):
+        with tarfile.open(path, 'r:*') as archive:
+            for info in archive:
+                if not info.isfile():
+                    continue
+                yield info.name, archive.extractfile(info)
+    else:
+        raise ValueError('not a zip or tar archive')
@@ -3,6 +3,6 @@ StegMage Workers
 Background job processing for image analysis
 """
 
-from .analyzer import analyze_image
+from .analyzer import analyze_image, reanalyze_image
 
-__all__ = ['analyze_image']
+__all__ = ['analyze_image', 'reanalyze_image']
@@ -5,23 +5,98 @@ Coordinates all steganography analysis methods
 
 import json
 import os
+import shutil
 from pathlib import Path
 from datetime import datetime
 import redis
 
+import config
+from cache import ResultCache, AnalyzerMemo, make_memo_key, path_sha256
+from analyzers.context import ImageContext
+from analyzers.encoding import EncodingProfile
 from analyzers.lsb import LSBAnalyzer
+from analyzers.lsb_stats import LSBStatsAnalyzer
 from analyzers.metadata import MetadataAnalyzer
 from analyzers.steghide import SteghideAnalyzer
 from analyzers.outguess import OutguessAnalyzer
 from analyzers.file_carving import FileCarvingAnalyzer
+from analyzers.file_structure import FileStructureAnalyzer
 from analyzers.strings import StringsAnalyzer
 from analyzers.zsteg import ZstegAnalyzer
 from analyzers.color_analysis import ColorAnalyzer
 from analyzers.entropy import EntropyAnalyzer
 from analyzers.forensics import ForensicsAnalyzer
+from workers.scheduler import run_analyzers
+from workers.triage import escalation_reasons
 
 
-def analyze_image(filepath: str, analysis_id: str, steghide_passwords=None):
+def artifact_encoding() -> EncodingProfile:
+    """Configured encoding of the images analyzers write"""
+    return EncodingProfile(
+        format=config.ARTIFACT_FORMAT,
+        compress_level=config.ARTIFACT_COMPRESS_LEVEL,
+        bilevel_planes=config.ARTIFACT_BILEVEL_PLANES,
+        lossless=config.ARTIFACT_WEBP_LOSSLESS,
+        quality=config.ARTIFACT_WEBP_QUALITY
+    )
+
+
+def get_analyzers():
+    """List of (name, analyzer) pairs organized by category"""
+    analyzers = [
+        # Basic Analysis
+        ('metadata', MetadataAnalyzer(executable=config.TOOL_PATHS['exiftool'],
+                                      pool_size=config.EXIFTOOL_POOL_SIZE,
+                                      queue_size=config.EXIFTOOL_QUEUE_SIZE,
+                                      timeout=config.EXIFTOOL_TIMEOUT)),
+        ('color_analysis', ColorAnalyzer()),
+
+        # Steganography Detection
+        ('lsb', LSBAnalyzer(lazy=config.LSB_RENDER_MODE == 'lazy')),
+        ('lsb_stats', LSBStatsAnalyzer(threshold=config.LSB_STATS_THRESHOLD)),
+        ('steghide', SteghideAnalyzer(workers=config.STEGHIDE_WORKERS,
+                                      header_check=config.STEGHIDE_HEADER_CHECK)),
+        ('outguess', OutguessAnalyzer()),
+        ('zsteg', ZstegAnalyzer()),
+
+        # Forensic Analysis
+        ('forensics', ForensicsAnalyzer()),
+        ('entropy', EntropyAnalyzer()),
+
+        # Additional Analysis
+        ('strings', StringsAnalyzer(min_length=config.STRINGS_MIN_LENGTH,
+                                    encodings=config.STRINGS_ENCODINGS,
+                                    top=config.STRINGS_TOP)),
+        ('file_structure', FileStructureAnalyzer()),
+        ('file_carving', FileCarvingAnalyzer(external_tools=config.CARVING_EXTERNAL_TOOLS)),
+    ]
+
+    encoding = artifact_encoding()
+    for _, analyzer in analyzers:
+        analyzer.encoding = encoding
+        analyzer.memory_budget = config.ANALYZER_MEMORY_BUDGET
+
+    return analyzers
+
+
+def analyzer_versions() -> dict:
+    """Version and settings of every analyzer, used in result cache keys"""
+    return {name: {'version': analyzer.version, 'params': analyzer.params()}
+            for name, analyzer in get_analyzers()}
+
+
+def job_options(steghide_passwords=None, steghide_wordlist_sha256=None, profile='full') -> dict:
+    """Job options that change the output, as stored in results and cache keys"""
+    options = {'steghide_passwords': steghide_passwords}
+    if steghide_wordlist_sha256:
+        options['steghide_wordlist'] = steghide_wordlist_sha256
+    if profile != 'full':
+        options['profile'] = profile
+    return options
+
+
+def analyze_image(filepath: str, analysis_id: str, steghide_passwords=None, cache_key=None,
+                  steghide_wordlist=None, profile=None):
     """
     Main analysis function that runs all steganography detection methods
 
@@ -29,6 +104,12 @@ def analyze_image(filepath: str, analysis_id: str, steghide_passwords=None):
         filepath: Path to the uploaded image
         analysis_id: Unique identifier for this analysis
         steghide_passwords: Optional list of custom passwords for steghide
+        cache_key: Optional result cache key to register the results under
+        steghide_wordlist: Optional path to a wordlist for a steghide
+            dictionary attack
+        profile: 'full' to run every analyzer, 'triage' to run the cheap
+            ones first and the expensive ones only if a triage rule fires
+            (defaults to ANALYSIS_PROFILE)
     """
     # Connect to Redis
     redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
@@ -39,84 +120,292 @@ def analyze_image(filepath: str, analysis_id: str, steghide_passwords=None):
     results_dir.mkdir(parents=True, exist_ok=True)
 
     # Initialize results structure
+    options = job_options(steghide_passwords,
+                          path_sha256(steghide_wordlist) if steghide_wordlist else None,
+                          profile or config.ANALYSIS_PROFILE)
+    analyzers = get_analyzers()
+    triage = options.get('profile') == 'triage'
+    # Triage starts with the cheap analyzers only
+    first = [(name, a) for name, a in analyzers if a.cost == 'cheap'] if triage else analyzers
     results = {
         'analysis_id': analysis_id,
         'filename': Path(filepath).name,
         'timestamp': datetime.utcnow().isoformat(),
         'status': 'processing',
-        'results': {}
+        'options': options,
+        'results': {},
+        'pending': [name for name, _ in first]
     }
 
+    # Results are readable while the analysis runs
+    results_file = Path('results') / f"{analysis_id}.json"
+    save_results(results_file, results)
+
     # Update status
     update_status(redis_conn, analysis_id, 'processing', 0)
 
-    # List of analyzers organized by category
-    analyzers = [
-        # Basic Analysis
-        ('metadata', MetadataAnalyzer()),
-        ('color_analysis', ColorAnalyzer()),
+    # Read and decode the image once for every analyzer
+    context = ImageContext(filepath)
 
-        # Steganography Detection
-        ('lsb', LSBAnalyzer()),
-        ('steghide', SteghideAnalyzer()),
-        ('outguess', OutguessAnalyzer()),
-        ('zsteg', ZstegAnalyzer()),
+    def on_result(name, outcome):
+        # Publish each analyzer's output as soon as it is available
+        results['results'][name] = outcome
+        results['pending'].remove(name)
+        save_results(results_file, results)
 
-        # Forensic Analysis
-        ('forensics', ForensicsAnalyzer()),
-        ('entropy', EntropyAnalyzer()),
+    outcomes = run_memoized(
+        redis_conn, analysis_id, first, filepath, results_dir, context, options,
+        steghide_wordlist, on_result, total=len(analyzers)
+    )
 
-        # Additional Analysis
-        ('strings', StringsAnalyzer()),
-        ('file_carving', FileCarvingAnalyzer()),
-    ]
+    if triage:
+        remaining = [(name, a) for name, a in analyzers if a.cost != 'cheap']
+        reasons = escalation_reasons(outcomes, config.TRIAGE_RULES)
+        results['triage'] = {
+            'escalated': bool(reasons),
+            'reasons': reasons,
+            'skipped': [] if reasons else [name for name, _ in remaining]
+        }
+        print(f"Triage: {'; '.join(reasons) if reasons else 'nothing suspicious'}")
+        if reasons:
+            results['pending'] = [name for name, _ in remaining]
+            save_results(results_file, results)
+            outcomes.update(run_memoized(
+                redis_conn, analysis_id, remaining, filepath, results_dir, context, options,
+                steghide_wordlist, on_result, total=len(analyzers), finished=list(outcomes)
+            ))
 
-    total_analyzers = len(analyzers)
-
-    # Run each analyzer
-    for idx, (name, analyzer) in enumerate(analyzers):
-        try:
-            print(f"Running {name} analyzer...")
-
-            # Pass custom passwords to steghide analyzer
-            if name == 'steghide' and steghide_passwords:
-                result = analyzer.analyze(filepath, str(results_dir), custom_passwords=steghide_passwords)
-            else:
-                result = analyzer.analyze(filepath, str(results_dir))
-
-            results['results'][name] = {
-                'success': True,
-                'data': result
-            }
-        except Exception as e:
-            print(f"Error in {name} analyzer: {str(e)}")
-            results['results'][name] = {
-                'success': False,
-                'error': str(e)
-            }
+    results['results'] = {name: outcomes[name] for name, _ in analyzers if name in outcomes}
 
-        # Update progress
-        progress = int(((idx + 1) / total_analyzers) * 100)
-        update_status(redis_conn, analysis_id, 'processing', progress)
+    # Save results to file before announcing completion
+    results['status'] = 'completed'
+    results['pending'] = []
+    save_results(results_file, results)
 
     # Mark as complete
-    results['status'] = 'completed'
-    update_status(redis_conn, analysis_id, 'completed', 100)
+    update_status(redis_conn, analysis_id, 'completed', 100, list(results['results']))
+
+    # Make the results reusable for identical uploads; uncached results
+    # still count toward the size of the results tree
+    if config.ENABLE_RESULT_CACHE:
+        cache = ResultCache(redis_conn, 'results', config.RESULT_CACHE_MAX_BYTES)
+        if cache_key:
+            cache.store(cache_key, analysis_id)
+        else:
+            cache.record(analysis_id)
+
+    return results
+
+
+def reanalyze_image(filepath: str, source_id: str, analysis_id: str, analyzer_names,
+                    steghide_passwords=None, steghide_wordlist=None):
+    """
+    Re-run selected analyzers of an existing analysis on a copy of it, and
+    merge their output into results/<analysis_id>.json
 
-    # Save results to file
+    The cache serves one analysis to every uploader of an image, so the
+    source analysis is never changed.
+
+    Args:
+        filepath: Path to the uploaded image
+        source_id: Identifier of the existing analysis
+        analysis_id: Identifier of the new analysis
+        analyzer_names: Names of the analyzers to re-run
+        steghide_passwords: Custom passwords for steghide, used when steghide
+            is re-run (None for the defaults)
+        steghide_wordlist: Optional wordlist path, used when steghide is re-run
+    """
+    redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    redis_conn = redis.from_url(redis_url)
+
+    # Start from a copy of the source analysis and its artifacts
+    results_dir = Path('results') / analysis_id
+    source_dir = Path('results') / source_id
+    if source_dir.is_dir():
+        shutil.copytree(source_dir, results_dir)
+    else:
+        results_dir.mkdir(parents=True, exist_ok=True)
+    with open(Path('results') / f"{source_id}.json", 'r') as f:
+        results = json.load(f)
+    results['analysis_id'] = analysis_id
+    results['source_analysis_id'] = source_id
+    results['filename'] = Path(filepath).name
+    results['timestamp'] = datetime.utcnow().isoformat()
     results_file = Path('results') / f"{analysis_id}.json"
-    with open(results_file, 'w') as f:
-        json.dump(results, f, indent=2)
+
+    options = results.get('options', job_options())
+    if 'steghide' in analyzer_names:
+        wordlist_sha256 = path_sha256(steghide_wordlist) if steghide_wordlist else None
+        steghide_options = job_options(steghide_passwords, wordlist_sha256)
+        options.pop('steghide_wordlist', None)
+        options.update(steghide_options)
+    results['options'] = options
+
+    context = ImageContext(filepath)
+    all_analyzers = get_analyzers()
+    selected = [(name, analyzer) for name, analyzer in all_analyzers if name in analyzer_names]
+
+    # Re-run analyzers are pending until their new output arrives
+    for name, _ in selected:
+        results['results'].pop(name, None)
+    results['status'] = 'processing'
+    results['pending'] = [name for name, _ in selected]
+    save_results(results_file, results)
+
+    update_status(redis_conn, analysis_id, 'processing', 0)
+
+    def on_result(name, outcome):
+        results['results'][name] = outcome
+        results['pending'].remove(name)
+        save_results(results_file, results)
+
+    outcomes = run_memoized(
+        redis_conn, analysis_id, selected, filepath, results_dir, context, options,
+        steghide_wordlist, on_result
+    )
+
+    # Merge, keeping the order of get_analyzers()
+    merged = {**results['results'], **outcomes}
+    results['results'] = {name: merged[name] for name, _ in all_analyzers if name in merged}
+    results['status'] = 'completed'
+    results['pending'] = []
+    save_results(results_file, results)
+
+    update_status(redis_conn, analysis_id, 'completed', 100, list(results['results']))
+
+    # Counted toward the results tree, but never served to other uploads
+    if config.ENABLE_RESULT_CACHE:
+        ResultCache(redis_conn, 'results', config.RESULT_CACHE_MAX_BYTES).record(analysis_id)
 
     return results
 
 
-def update_status(redis_conn, analysis_id: str, status: str, progress: int):
-    """Update job status in Redis"""
+def run_memoized(redis_conn, analysis_id: str, analyzers, filepath: str, results_dir: Path,
+                 context: ImageContext, options: dict, steghide_wordlist=None,
+                 on_result=None, total=None, finished=()) -> dict:
+    """
+    Run analyzers, reusing memoized outcomes for this image where possible
+
+    Outcomes are memoized per (image hash, analyzer name, analyzer version,
+    analyzer settings and job parameters); a reused outcome gets its artifacts copied into
+    results_dir. on_result(name, outcome) is called for every outcome as
+    soon as it is available. When the job runs its analyzers in several
+    passes, total is the job's analyzer count and finished the names done
+    in earlier passes, so progress keeps counting up.
+
+    Returns:
+        Dict of name -> outcome in the order of analyzers
+    """
+    # Pass custom passwords and wordlist to steghide analyzer
+    analyzer_kwargs = {}
+    memo_params = {}
+    if options.get('steghide_passwords'):
+        analyzer_kwargs['steghide'] = {'custom_passwords': options['steghide_passwords']}
+    memo_params['steghide'] = dict(analyzer_kwargs.get('steghide', {}))
+    if steghide_wordlist:
+        analyzer_kwargs.setdefault('steghide', {})['wordlist'] = steghide_wordlist
+        # Memoize on the wordlist contents, not its per-upload path
+        memo_params['steghide']['wordlist'] = options['steghide_wordlist']
+
+    outcomes = {}
+    memo_keys = {}
+    to_run = list(analyzers)
+    memo = None
+
+    if config.ENABLE_ANALYZER_MEMO:
+        memo = AnalyzerMemo(redis_conn, 'results', config.ANALYZER_MEMO_TTL)
+        file_hash = path_sha256(filepath)
+        to_run = []
+        for name, analyzer in analyzers:
+            memo_keys[name] = make_memo_key(file_hash, name, analyzer.version,
+                                            {**analyzer.params(), **memo_params.get(name, {})})
+            entry = memo.get(memo_keys[name])
+            if entry:
+                try:
+                    memo.restore(entry, results_dir)
+                    outcomes[name] = entry['outcome']
+                    print(f"Reusing memoized {name} result")
+                    continue
+                except OSError:
+                    pass
+            to_run.append((name, analyzer))
+
+    total = total or len(analyzers)
+    by_name = dict(analyzers)
+    finished = list(finished) + list(outcomes)
+
+    if outcomes:
+        if on_result:
+            for name in outcomes:
+                on_result(name, outcomes[name])
+        update_status(redis_conn, analysis_id, 'processing', int((len(finished) / total) * 100),
+                      finished)
+
+    def on_complete(name, outcome, *_):
+        # Remember clean outcomes so later runs can skip this analyzer
+        if memo and outcome['success'] and 'error' not in outcome['data']:
+            files = by_name[name].artifacts(outcome['data'], str(results_dir))
+            try:
+                memo.put(memo_keys[name], analysis_id, outcome, files)
+            except redis.RedisError as e:
+                # The memo is an optimization; the job goes on without it
+                print(f"Could not memoize {name} result: {e}")
+
+        if on_result:
+            on_result(name, outcome)
+
+        # Update progress
+        finished.append(name)
+        progress = int((len(finished) / total) * 100)
+        update_status(redis_conn, analysis_id, 'processing', progress, finished, {
+            'analyzer': name,
+            'success': outcome['success'] and 'error' not in outcome['data'],
+            'completed': len(finished),
+            'total': total
+        })
+
+    # Run analyzers concurrently
+    outcomes.update(run_analyzers(
+        to_run, filepath, str(results_dir), context,
+        analyzer_kwargs=analyzer_kwargs,
+        max_workers=config.MAX_WORKERS,
+        on_complete=on_complete
+    ))
+
+    return {name: outcomes[name] for name, _ in analyzers}
+
+
+def save_results(results_file: Path, results: dict):
+    """Write a results document atomically, so readers never see half a file"""
+    tmp_file = results_file.with_name(results_file.name + '.tmp')
+    with open(tmp_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    os.replace(tmp_file, results_file)
+
+
+def update_status(redis_conn, analysis_id: str, status: str, progress: int, analyzers=None,
+                  event=None, pipe=None):
+    """
+    Update job status in Redis and publish it to progress subscribers
+
+    Args:
+        analyzers: Names of the analyzers finished so far
+        event: Completion event of the analyzer that triggered this update
+        pipe: Pipeline to add the update to instead of sending it right away
+    """
     job_key = f"stegmage:job:{analysis_id}"
     job_data = {
         'status': status,
         'progress': progress,
         'updated_at': datetime.utcnow().isoformat()
     }
-    redis_conn.setex(job_key, 3600, json.dumps(job_data))  # Expire after 1 hour
+    if analyzers is not None:
+        job_data['analyzers'] = list(analyzers)
+
+    message = dict(job_data, event=event) if event else job_data
+
+    commands = pipe if pipe is not None else redis_conn.pipeline()
+    commands.setex(job_key, 3600, json.dumps(job_data))  # Expire after 1 hour
+    commands.publish(f"stegmage:progress:{analysis_id}", json.dumps(message))
+    if pipe is None:
+        commands.execute()
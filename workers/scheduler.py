@@ -0,0 +1,124 @@
+"""
+Analyzer scheduler
+Runs the analyzers of one job concurrently within a per-job limit
+"""
+
+import os
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+# ImageContext of the job, installed in each process pool worker
+_process_context = None
+
+
+def _init_process_worker(context):
+    """Process pool initializer: keep the job's ImageContext for every task"""
+    global _process_context
+    _process_context = context
+
+
+def _run_in_process(analyzer, filepath, output_dir, kwargs):
+    """Process pool entry point"""
+    return analyzer.run(filepath, output_dir, _process_context, **kwargs)
+
+
+def _outcome(future):
+    """Convert a finished future into a result entry"""
+    try:
+        return {'success': True, 'data': future.result()}
+    except Exception as e:
+        return {'success': False, 'error': str(e)}
+
+
+def run_analyzers(analyzers, filepath, output_dir, context, analyzer_kwargs=None,
+                  max_workers=1, on_complete=None):
+    """
+    Run analyzers and collect their results
+
+    Analyzers with executor == 'thread' (external tools) run on a thread pool,
+    analyzers with executor == 'process' (Pillow/NumPy work) on a process pool
+    that maps the decoded pixels from a store in output_dir.
+    At most max_workers analyzers run at the same time; with max_workers <= 1
+    everything runs sequentially in the calling process.
+
+    Args:
+        analyzers: List of (name, analyzer) tuples
+        filepath: Path to the image file
+        output_dir: Directory to save output files
+        context: Shared ImageContext for this job
+        analyzer_kwargs: Optional dict of name -> extra keyword arguments
+        max_workers: Maximum number of analyzers running concurrently
+        on_complete: Optional callback(name, outcome, completed, total), always
+            called from the calling thread
+
+    Returns:
+        Dict of name -> {'success': ..., 'data'/'error': ...} in the order
+        the analyzers were given, regardless of completion order
+    """
+    analyzer_kwargs = analyzer_kwargs or {}
+    total = len(analyzers)
+    outcomes = {}
+
+    def complete(name, outcome):
+        outcomes[name] = outcome
+        if outcome['success']:
+            print(f"Finished {name} analyzer")
+        else:
+            print(f"Error in {name} analyzer: {outcome['error']}")
+        if on_complete:
+            on_complete(name, outcome, len(outcomes), total)
+
+    if max_workers <= 1:
+        for name, analyzer in analyzers:
+            print(f"Running {name} analyzer...")
+            try:
+                kwargs = analyzer_kwargs.get(name, {})
+                result = analyzer.run(filepath, output_dir, context, **kwargs)
+            except Exception as e:
+                complete(name, {'success': False, 'error': str(e)})
+            else:
+                # Outside the try: a failing callback must not turn into a second outcome
+                complete(name, {'success': True, 'data': result})
+        return {name: outcomes[name] for name, _ in analyzers}
+
+    process_count = sum(1 for _, a in analyzers if a.executor == 'process')
+    process_pool = None
+    pixel_store = ExitStack()
+    if process_count:
+        # Decode once into a memory-mapped store that every pool process maps
+        pixel_store.enter_context(context.shared_pixels(output_dir))
+        process_pool = ProcessPoolExecutor(
+            max_workers=min(max_workers, process_count, os.cpu_count() or 1),
+            initializer=_init_process_worker,
+            initargs=(context,)
+        )
+    thread_pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    pending = list(analyzers)
+    running = {}
+    try:
+        while pending or running:
+            # Keep at most max_workers analyzers in flight
+            while pending and len(running) < max_workers:
+                name, analyzer = pending.pop(0)
+                kwargs = analyzer_kwargs.get(name, {})
+                print(f"Running {name} analyzer...")
+                if analyzer.executor == 'process':
+                    future = process_pool.submit(_run_in_process, analyzer, filepath, output_dir,
+                                                 kwargs)
+                else:
+                    future = thread_pool.submit(analyzer.run, filepath, output_dir, context,
+                                                **kwargs)
+                running[future] = name
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                complete(running.pop(future), _outcome(future))
+    finally:
+        thread_pool.shutdown(wait=True)
+        if process_pool:
+            process_pool.shutdown(wait=True)
+        # No process maps the store any more
+        pixel_store.close()
+
+    return {name: outcomes[name] for name, _ in analyzers}
@@ -0,0 +1,108 @@
+"""
+Triage
+Rules deciding whether the cheap analyzers found enough to run the expensive ones
+"""
+
+import config
+from analyzers.lsb_stats import rate_threshold
+
+# Analysis profiles a job can be run with
+PROFILES = ('full', 'triage')
+
+
+def _data(outcomes, name):
+    """Data of an analyzer outcome that succeeded without an error, or None"""
+    outcome = outcomes.get(name)
+    if not outcome or not outcome['success'] or 'error' in outcome['data']:
+        return None
+    return outcome['data']
+
+
+def _lsb_stats(outcomes):
+    """The rate against the configured threshold, not the verdict stored with a memoized result"""
+    data = _data(outcomes, 'lsb_stats')
+    if not data or data.get('embedding_rate') is None:
+        return None
+    if data['embedding_rate'] >= rate_threshold(data['pixels'], config.LSB_STATS_THRESHOLD):
+        return f"LSB embedding rate estimated at {data['embedding_rate'] * 100:.1f}%"
+    return None
+
+
+def _trailing_data(outcomes):
+    data = _data(outcomes, 'file_structure')
+    if data and (data.get('trailing_bytes') or 0) >= config.TRIAGE_TRAILING_BYTES:
+        return f"{data['trailing_bytes']} bytes after the end of the image"
+    return None
+
+
+def _structure(outcomes):
+    """Unknown chunks, CRC mismatches, gaps and broken structure; trailing data has its own rule"""
+    data = _data(outcomes, 'file_structure')
+    if not data:
+        return None
+    anomalies = [a for a in data.get('anomalies', []) if a['kind'] != 'trailing']
+    if anomalies:
+        more = f" and {len(anomalies) - 1} more structure anomalies" if len(anomalies) > 1 else ''
+        return anomalies[0]['description'] + more
+    return None
+
+
+def _strings(outcomes):
+    data = _data(outcomes, 'strings')
+    if not data:
+        return None
+    tags = sorted({tag for entry in data.get('ranked', []) for tag in entry['tags']
+                   if tag in config.TRIAGE_STRING_TAGS})
+    if tags:
+        return f"Strings tagged {', '.join(tags)}"
+    return None
+
+
+def _metadata(outcomes):
+    data = _data(outcomes, 'metadata')
+    if not data:
+        return None
+    fields = [field for field in config.TRIAGE_METADATA_FIELDS
+              if str(data.get('metadata', {}).get(field, '')).strip()]
+    if fields:
+        return f"Metadata fields {', '.join(fields)}"
+    return None
+
+
+def _unscreened(outcomes):
+    """Images the LSB statistics cannot screen (lossy formats, palettes) are always escalated"""
+    outcome = outcomes.get('lsb_stats')
+    if outcome and (not outcome['success'] or 'error' in outcome['data']):
+        return 'LSB statistics could not screen this image'
+    return None
+
+
+# Rule name -> function(outcomes) returning the reason to escalate, or None
+RULES = {
+    'lsb_stats': _lsb_stats,
+    'trailing_data': _trailing_data,
+    'structure': _structure,
+    'strings': _strings,
+    'metadata': _metadata,
+    'unscreened': _unscreened,
+}
+
+
+def escalation_reasons(outcomes, rules) -> list:
+    """
+    Reasons the cheap analyzers' outcomes give for running the expensive ones
+
+    Args:
+        outcomes: Dict of analyzer name -> outcome, as run_analyzers returns
+        rules: Names of the RULES to apply; unknown names are ignored
+
+    Returns:
+        List of reasons, empty when the image looks clean
+    """
+    reasons = []
+    for name in rules:
+        rule = RULES.get(name)
+        reason = rule(outcomes) if rule else None
+        if reason:
+            reasons.append(reason)
+    return reasons
@@ -0,0 +1,48 @@
+"""
+RQ worker
+Keeps the exiftool pool running and the steghide header check validated in
+the worker process between jobs
+"""
+
+from rq import Worker
+
+from analyzers.steghide_header import validated_seed
+from workers.analyzer import get_analyzers
+
+
+def metadata_analyzer():
+    """The configured MetadataAnalyzer"""
+    return dict(get_analyzers())['metadata']
+
+
+def steghide_analyzer():
+    """The configured SteghideAnalyzer"""
+    return dict(get_analyzers())['steghide']
+
+
+class StegMageWorker(Worker):
+    """
+    Worker whose exiftool processes and steghide check outlive the jobs
+
+    RQ forks a work horse per job; processes started and checks validated
+    here before the fork are shared by every horse instead of being redone
+    for each image.
+    """
+
+    def execute_job(self, job, queue):
+        analyzer = metadata_analyzer()
+        if analyzer.is_available():
+            pool = analyzer.pool()
+            # Replace processes a previous horse killed or left hanging
+            pool.check()
+            pool.warm()
+        steghide = steghide_analyzer()
+        if steghide.header_check and steghide.is_available():
+            # Validated once here rather than in every horse
+            validated_seed()
+        return super().execute_job(job, queue)
+
+    def teardown(self):
+        if not self.is_horse:
+            metadata_analyzer().pool().close()
+        super().teardown()